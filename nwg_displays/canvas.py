@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+"""
+Single-surface layout renderer: all the outputs are drawn with cairo on one Gtk.DrawingArea,
+instead of a Gtk.Button per output inside a Gtk.Fixed. Meant for video walls with dozens of outputs.
+"""
+
+import math
+
+import cairo
+import gi
+
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, Gdk
+
+# Spatial index bucket size, in logical pixels
+CELL = 1024
+# Extra device pixels redrawn around a damaged output, to cover the border
+MARGIN = 2
+
+
+class LayoutCanvas(Gtk.DrawingArea):
+    """
+    Items are expected to expose `name`, `x`, `y`, `logical_width`, `logical_height`, `active` and `changed`.
+    `on_select(item, toggle, keep_group)` is called on button press over an item (`toggle` if Ctrl held), and
+    on release with no drag. `on_drag(item, x, y)` is called with the new view coordinates while dragging; it's
+    up to the callback to update x and y of the item and whatever moves with it, and return the items moved.
+    Dragging over the empty area draws a rubber band, and calls `on_band(items, toggle)` with the items it touched.
+    `on_drop(item)` is called when a drag that moved anything ends.
+    """
+
+    def __init__(self, view_scale, on_select, on_drag, on_band=None, on_drop=None):
+        super().__init__()
+        self.view_scale = view_scale
+        self.on_select = on_select
+        self.on_drag = on_drag
+        self.on_band = on_band
+        self.on_drop = on_drop
+
+        self.items = []
+        self.selected = None
+        self.group = set()  # id() of the items selected along with self.selected
+        self.buckets = {}  # (cell_x, cell_y): [items]
+        self.item_cells = {}  # id(item): [cells]
+        self.rects = {}  # id(item): last drawn device rectangle
+        self.order = {}  # id(item): drawing order, for hit-testing overlapping outputs
+
+        self.drag_item = None
+        self.drag_offset_x = 0
+        self.drag_offset_y = 0
+        self.drag_moved = False
+        self.band = None  # (x0, y0, x1, y1) in device pixels, while drawing a rubber band
+
+        self.set_hexpand(True)
+        self.set_vexpand(True)
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK |
+                        Gdk.EventMask.BUTTON1_MOTION_MASK)
+        self.connect("draw", self.on_draw)
+        self.connect("button-press-event", self.on_button_press)
+        self.connect("motion-notify-event", self.on_motion)
+        self.connect("button-release-event", self.on_button_release)
+
+    def set_items(self, items):
+        self.items = list(items)
+        self.buckets = {}
+        self.item_cells = {}
+        self.rects = {}
+        self.order = {}
+        self.drag_item = None
+        for i, item in enumerate(self.items):
+            self.order[id(item)] = i
+            self.index(item)
+            self.rects[id(item)] = self.device_rect(item)
+        if not any(item is self.selected for item in self.items):
+            self.selected = None
+        self.group = {id(item) for item in self.items if id(item) in self.group}
+        self.update_size()
+        self.queue_draw()
+
+    def set_view_scale(self, view_scale):
+        self.view_scale = view_scale
+        for item in self.items:
+            self.rects[id(item)] = self.device_rect(item)
+        self.update_size()
+        self.queue_draw()
+
+    def select(self, item, group=()):
+        """
+        Highlights `item`, and the items in `group` along with it.
+        """
+        group = {id(i) for i in group}
+        if item is not None:
+            group.add(id(item))
+        # Redraw the items whose state changed only
+        damaged = [self.rects[i] for i in group ^ self.group if i in self.rects]
+        if self.selected is not None and self.selected is not item:
+            damaged.append(self.rects[id(self.selected)])
+        if item is not None:
+            damaged.append(self.rects[id(item)])
+        self.selected = item
+        self.group = group
+        if damaged:
+            self.damage(*damaged)
+
+    def item_changed(self, item):
+        """
+        Call after the item geometry changed: updates the index and redraws the old and the new area only.
+        """
+        self.items_changed([item])
+
+    def items_changed(self, items):
+        # One redraw for all the items moved together
+        rects = []
+        for item in items:
+            rects.append(self.rects[id(item)])
+            self.unindex(item)
+            self.index(item)
+            new_rect = self.device_rect(item)
+            self.rects[id(item)] = new_rect
+            rects.append(new_rect)
+        if rects:
+            self.damage(*rects)
+        if not self.drag_item:
+            self.update_size()
+
+    # Spatial index
+    def cells(self, item):
+        x0 = int(item.x // CELL)
+        x1 = int((item.x + item.logical_width) // CELL)
+        y0 = int(item.y // CELL)
+        y1 = int((item.y + item.logical_height) // CELL)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def index(self, item):
+        cells = self.cells(item)
+        self.item_cells[id(item)] = cells
+        for cell in cells:
+            self.buckets.setdefault(cell, []).append(item)
+
+    def unindex(self, item):
+        for cell in self.item_cells.pop(id(item), []):
+            bucket = [i for i in self.buckets[cell] if i is not item]
+            if bucket:
+                self.buckets[cell] = bucket
+            else:
+                del self.buckets[cell]
+
+    def items_in(self, x0, y0, x1, y1):
+        # Items that overlap the rectangle, in logical coordinates
+        result = []
+        seen = set()
+        for cx in range(int(x0 // CELL), int(x1 // CELL) + 1):
+            for cy in range(int(y0 // CELL), int(y1 // CELL) + 1):
+                for item in self.buckets.get((cx, cy), []):
+                    if id(item) in seen:
+                        continue
+                    seen.add(id(item))
+                    if item.x < x1 and x0 < item.x + item.logical_width and \
+                            item.y < y1 and y0 < item.y + item.logical_height:
+                        result.append(item)
+        result.sort(key=lambda i: self.order[id(i)])
+        return result
+
+    def item_at(self, x, y):
+        # x, y in logical coordinates; the topmost (last drawn) item wins
+        result = None
+        for item in self.buckets.get((int(x // CELL), int(y // CELL)), []):
+            if item.x <= x < item.x + item.logical_width and item.y <= y < item.y + item.logical_height:
+                if result is None or self.order[id(item)] > self.order[id(result)]:
+                    result = item
+        return result
+
+    # Geometry
+    def device_rect(self, item):
+        x = math.floor(item.x * self.view_scale) - MARGIN
+        y = math.floor(item.y * self.view_scale) - MARGIN
+        w = math.ceil(item.logical_width * self.view_scale) + 2 * MARGIN + 1
+        h = math.ceil(item.logical_height * self.view_scale) + 2 * MARGIN + 1
+        return x, y, w, h
+
+    def damage(self, *rects):
+        x0 = min(r[0] for r in rects)
+        y0 = min(r[1] for r in rects)
+        x1 = max(r[0] + r[2] for r in rects)
+        y1 = max(r[1] + r[3] for r in rects)
+        self.queue_draw_area(x0, y0, x1 - x0, y1 - y0)
+
+    def update_size(self):
+        width, height = 0, 0
+        for item in self.items:
+            x, y, w, h = self.rects[id(item)]
+            width = max(width, x + w)
+            height = max(height, y + h)
+        self.set_size_request(width, height)
+
+    # Drawing
+    def on_draw(self, widget, cr):
+        x1, y1, x2, y2 = cr.clip_extents()
+        # One transform per zoom level; everything below is drawn in logical coordinates
+        cr.scale(self.view_scale, self.view_scale)
+        line_width = 1 / self.view_scale
+        cr.set_line_width(line_width)
+        for item in self.items:
+            x, y, w, h = self.rects[id(item)]
+            if x > x2 or y > y2 or x + w < x1 or y + h < y1:
+                continue
+            self.draw_item(cr, item, line_width)
+
+        if self.band:
+            x0, y0, x1, y1 = self.band_rect()
+            cr.rectangle(x0 / self.view_scale, y0 / self.view_scale, (x1 - x0) / self.view_scale,
+                         (y1 - y0) / self.view_scale)
+            cr.set_source_rgba(0.78, 0.78, 1, 0.15)
+            cr.fill_preserve()
+            cr.set_source_rgba(0.78, 0.78, 1, 0.6)
+            cr.stroke()
+        return False
+
+    def band_rect(self):
+        x0, y0, x1, y1 = self.band
+        return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+    def draw_item(self, cr, item, line_width):
+        selected = id(item) in self.group
+        # Half a device pixel inside, for crisp 1px borders
+        x = item.x + line_width / 2
+        y = item.y + line_width / 2
+        w = item.logical_width - line_width
+        h = item.logical_height - line_width
+
+        cr.rectangle(x, y, w, h)
+        cr.set_source_rgba(0, 0, 0, 0.4)
+        cr.fill_preserve()
+        if not item.active:
+            cr.new_path()
+        else:
+            if item.changed:
+                cr.set_source_rgba(1, 0.78, 0, 0.8)
+            elif selected:
+                cr.set_source_rgba(0.78, 0.78, 1, 0.6)
+            else:
+                cr.set_source_rgba(0.78, 0.78, 0.78, 0.3)
+            cr.stroke()
+
+        cr.select_font_face("Sans", cairo.FONT_SLANT_NORMAL,
+                            cairo.FONT_WEIGHT_BOLD if selected or not item.active else cairo.FONT_WEIGHT_NORMAL)
+        cr.set_font_size(12 / self.view_scale)
+        extents = cr.text_extents(item.name)
+        cr.move_to(item.x + (item.logical_width - extents.width) / 2 - extents.x_bearing,
+                   item.y + (item.logical_height - extents.height) / 2 - extents.y_bearing)
+        if item.active:
+            cr.set_source_rgb(0.93, 0.93, 0.93)
+        else:
+            cr.set_source_rgb(0.2, 0.2, 0.2)
+        cr.show_text(item.name)
+
+    # Pointer
+    def on_button_press(self, widget, event):
+        if event.button != 1:
+            return False
+        toggle = bool(event.state & Gdk.ModifierType.CONTROL_MASK)
+        item = self.item_at(event.x / self.view_scale, event.y / self.view_scale)
+        if item is None:
+            if self.on_band:
+                self.band = (event.x, event.y, event.x, event.y)
+            return False
+        self.drag_item = item
+        self.drag_moved = False
+        self.drag_offset_x = event.x - item.x * self.view_scale
+        self.drag_offset_y = event.y - item.y * self.view_scale
+        self.on_select(item, toggle, True)
+        return True
+
+    def on_motion(self, widget, event):
+        if self.band:
+            old = self.band_rect()
+            self.band = (self.band[0], self.band[1], event.x, event.y)
+            new = self.band_rect()
+            self.damage((old[0] - MARGIN, old[1] - MARGIN, old[2] - old[0] + 2 * MARGIN, old[3] - old[1] + 2 * MARGIN),
+                        (new[0] - MARGIN, new[1] - MARGIN, new[2] - new[0] + 2 * MARGIN, new[3] - new[1] + 2 * MARGIN))
+            return True
+
+        item = self.drag_item
+        if item is None:
+            return False
+        allocation = self.get_allocation()
+        max_x = allocation.width - item.logical_width * self.view_scale
+        max_y = allocation.height - item.logical_height * self.view_scale
+        x = max(min(event.x - self.drag_offset_x, max_x), 0)
+        y = max(min(event.y - self.drag_offset_y, max_y), 0)
+        moved = self.on_drag(item, x, y)
+        if moved:
+            self.drag_moved = True
+            self.items_changed(moved)
+        return True
+
+    def on_button_release(self, widget, event):
+        toggle = bool(event.state & Gdk.ModifierType.CONTROL_MASK)
+        if self.band:
+            x0, y0, x1, y1 = self.band_rect()
+            self.band = None
+            self.queue_draw()
+            self.on_band(self.items_in(x0 / self.view_scale, y0 / self.view_scale, x1 / self.view_scale,
+                                       y1 / self.view_scale), toggle)
+        elif self.drag_item is not None:
+            item = self.drag_item
+            self.drag_item = None
+            self.update_size()
+            if self.drag_moved and self.on_drop:
+                self.on_drop(item)
+            # A plain click on a member of the group selects just that item
+            if not self.drag_moved and not toggle:
+                self.on_select(item, False, False)
+        return False
@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""
+Offline layout simulator: `nwg-displays --dry-run SPEC [SPEC ...]`. Takes a layout spec on top of a recorded
+outputs snapshot, and prints what `apply_settings()` would save and send, with the resulting geometry, overlaps
+and workspace placement. Touches neither the compositor nor GTK, so it runs in CI.
+
+A spec is a JSON file:
+
+{
+  "compositor": "sway",  # or "hyprland"
+  "snapshot": "outputs-sway.json",  # as saved in ~/.cache/nwg-displays, relative to the spec; or the same inline
+  "use-desc": false,
+  "outputs": {"DP-1": {"mode": "2560x1440@59.951", "x": 0, "y": 0, "scale": 1.25, "transform": "normal"},
+              "HDMI-A-1": {"active": false}},
+  "workspaces": {"1": "DP-1", "2": "DP-1"}
+}
+
+Outputs and keys left out of "outputs" keep their snapshot values.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from nwg_displays.layout import Layout, HYPR_TRANSFORMS, REFRESH_TOLERANCE, sway_config, hypr_config, \
+    valid_scales
+
+# spec key: (OutputState attribute, accepted types)
+OUTPUT_KEYS = {"x": ("x", (int,)), "y": ("y", (int,)), "scale": ("scale", (int, float)),
+               "transform": ("transform", (str,)), "scale_filter": ("scale_filter", (str,)),
+               "active": ("active", (bool,)), "dpms": ("dpms", (bool,)), "adaptive_sync": ("adaptive_sync", (bool,)),
+               "custom_mode": ("custom_mode", (bool,)), "mirror": ("mirror", (str,)), "ten_bit": ("ten_bit", (bool,))}
+
+
+def type_ok(value, types):
+    # bool is an int in Python, but `"x": true` is a mistake
+    return isinstance(value, types) and (bool in types or not isinstance(value, bool))
+
+
+def load_snapshot(snapshot, base_dir):
+    """
+    Returns (outputs, activity) from a snapshot path or an inline snapshot object.
+    """
+    if isinstance(snapshot, str):
+        with open(os.path.join(base_dir, snapshot), "r") as f:
+            snapshot = json.load(f)
+    outputs = snapshot["outputs"]
+    activity = snapshot.get("activity", {name: outputs[name]["active"] for name in outputs})
+    for name in outputs:
+        outputs[name]["monitor"] = None
+    return outputs, activity
+
+
+def parse_mode(mode):
+    # "1920x1080@60" -> (1920, 1080, 60.0)
+    size, _, refresh = mode.partition("@")
+    w, h = size.split("x")
+    return int(w), int(h), float(refresh) if refresh else None
+
+
+def apply_mode(state, mode, errors):
+    try:
+        w, h, refresh = parse_mode(mode)
+    except ValueError:
+        errors.append("{}: can't parse mode '{}'".format(state.name, mode))
+        return
+    match = None
+    for m in state.modes:
+        if m["width"] == w and m["height"] == h and (refresh is None or
+                                                     abs(m["refresh"] - refresh * 1000) <= REFRESH_TOLERANCE):
+            if match is None or m["refresh"] > match["refresh"]:
+                match = m
+    if match is None and not state.custom_mode:
+        errors.append("{}: mode {} not supported".format(state.name, mode))
+    state.physical_width = w
+    state.physical_height = h
+    if match is not None:
+        state.refresh = match["refresh"] / 1000
+    elif refresh is not None:
+        state.refresh = refresh
+
+
+def overlaps(states):
+    """
+    Returns [(name, name)] of the outputs whose logical rectangles overlap. Sweeps along x, so that outputs
+    side by side aren't compared with each other.
+    """
+    result = []
+    rects = sorted((state.rect() + (state.name,) for state in states), key=lambda r: r[0])
+    open_rects = []
+    for x, y, w, h, name in rects:
+        open_rects = [r for r in open_rects if r[0] + r[2] > x]
+        for ox, oy, ow, oh, other in open_rects:
+            if oy < y + h and y < oy + oh:
+                result.append((other, name))
+        open_rects.append((x, y, w, h, name))
+    return result
+
+
+def simulate(spec, base_dir="."):
+    """
+    Returns the report dictionary of a single spec.
+    """
+    compositor = spec.get("compositor", "sway")
+    use_desc = spec.get("use-desc", False)
+    errors = []
+    warnings = []
+
+    outputs, activity = load_snapshot(spec["snapshot"], base_dir)
+    baseline = Layout.from_outputs(outputs)
+    layout = baseline.copy()
+    activity = dict(activity)
+
+    for name, settings in spec.get("outputs", {}).items():
+        if name not in layout:
+            if name in activity and not settings.get("active", True):
+                activity[name] = False
+            else:
+                errors.append("{}: no such output in the snapshot".format(name))
+            continue
+        state = layout[name]
+        for key, value in settings.items():
+            if key in OUTPUT_KEYS:
+                attribute, types = OUTPUT_KEYS[key]
+                if type_ok(value, types):
+                    setattr(state, attribute, value)
+                else:
+                    errors.append("{}: {} must be {}, not {}".format(
+                        name, key, " or ".join(t.__name__ for t in types), json.dumps(value)))
+            elif key == "mode":
+                if isinstance(value, str):
+                    apply_mode(state, value, errors)
+                else:
+                    errors.append("{}: mode must be str, not {}".format(name, json.dumps(value)))
+            else:
+                warnings.append("{}: unknown key '{}'".format(name, key))
+        if type_ok(settings.get("active"), (bool,)):
+            activity[name] = settings["active"]
+
+    for state in layout:
+        if state.transform not in HYPR_TRANSFORMS:
+            errors.append("{}: unknown transform '{}'".format(state.name, state.transform))
+        if state.mirror and state.mirror not in layout:
+            errors.append("{}: mirrors unknown output '{}'".format(state.name, state.mirror))
+        if compositor == "hyprland" and state.scale > 0:
+            w, h = state.physical_width, state.physical_height
+            if not any(abs(s - state.scale) < 1e-6 for s in valid_scales(w, h)):
+                warnings.append("{}: scale {} gives a fractional logical size for {}x{}".format(
+                    state.name, state.scale, w, h))
+        if state.scale <= 0:
+            errors.append("{}: scale must be positive".format(state.name))
+
+    if compositor == "sway":
+        # Turning an output off in the GUI takes it out of the layout, before the settings get applied
+        layout = Layout(state for state in layout if activity.get(state.name, True))
+        descriptions = {name: outputs[name]["description"] for name in outputs}
+        lines, cmds = sway_config(layout, activity, baseline=baseline, use_desc=use_desc,
+                                  describe=lambda name: descriptions.get(name, name))
+    else:
+        lines, cmds = hypr_config(layout, activity, baseline=baseline, use_desc=use_desc)
+
+    visible = [state for state in layout if activity.get(state.name, True) and not state.mirror]
+    for a, b in overlaps(visible):
+        errors.append("{} overlaps {}".format(a, b))
+
+    geometry = {}
+    for state in layout:
+        x, y, w, h = state.rect()
+        geometry[state.name] = {"x": x, "y": y, "width": w, "height": h, "scale": state.scale,
+                                "transform": state.transform, "active": activity.get(state.name, True),
+                                "mirror": state.mirror}
+
+    workspaces = {}
+    for num, target in spec.get("workspaces", {}).items():
+        name = target
+        if target not in layout:
+            # may be given by description
+            name = next((s.name for s in layout if s.description == target), None)
+        if name is None:
+            errors.append("workspace {}: no such output '{}'".format(num, target))
+        elif not activity.get(name, True):
+            errors.append("workspace {}: output {} is disabled".format(num, name))
+        workspaces[num] = name
+
+    return {"compositor": compositor, "config": lines, "commands": cmds, "geometry": geometry,
+            "workspaces": workspaces, "errors": errors, "warnings": warnings}
+
+
+def print_report(path, report):
+    print("== {} ({})".format(path, report["compositor"]))
+    print("[Saving]")
+    for line in report["config"]:
+        print(line.rstrip("\n"))
+    print("[Executing]")
+    for cmd in report["commands"]:
+        print(cmd)
+    print("[Geometry]")
+    for name, g in report["geometry"].items():
+        state = "" if g["active"] else " (disabled)"
+        if g["mirror"]:
+            state += " (mirrors {})".format(g["mirror"])
+        print("{}: {}x{} at {},{}, scale {}, {}{}".format(name, round(g["width"], 2), round(g["height"], 2),
+                                                         g["x"], g["y"], g["scale"], g["transform"], state))
+    if report["workspaces"]:
+        print("[Workspaces]")
+        for num, name in report["workspaces"].items():
+            print("{}: {}".format(num, name))
+    for warning in report["warnings"]:
+        print("WARNING: {}".format(warning))
+    for error in report["errors"]:
+        print("ERROR: {}".format(error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nwg-displays --dry-run")
+    parser.add_argument("--dry-run", dest="specs", nargs="+", metavar="SPEC", required=True,
+                        help="layout spec file(s) to simulate")
+    parser.add_argument("--json", action="store_true", help="print the reports as NDJSON, one per spec")
+    args, _ = parser.parse_known_args(argv)
+
+    failed = 0
+    for path in args.specs:
+        try:
+            with open(path, "r") as f:
+                spec = json.load(f)
+            report = simulate(spec, os.path.dirname(os.path.abspath(path)))
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # a malformed spec fails on its own, the others still run
+            report = {"compositor": None, "config": [], "commands": [], "geometry": {}, "workspaces": {},
+                      "errors": ["{}: {}".format(type(e).__name__, e)], "warnings": []}
+
+        if report["errors"]:
+            failed += 1
+        if args.json:
+            print(json.dumps(dict(report, spec=path), sort_keys=True))
+        else:
+            print_report(path, report)
+
+    if not args.json:
+        print("{} spec(s), {} failed".format(len(args.specs), failed), file=sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+EDID reader for the /sys/class/drm connectors. Gives stable output identities (vendor, product, serial)
+and mode metadata with no compositor round trips. Parsed results are cached by connector and EDID hash.
+"""
+
+import glob
+import hashlib
+import os
+import sys
+
+DRM_PATH = "/sys/class/drm"
+HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+BLOCK_SIZE = 128
+CTA_EXTENSION = 0x02
+
+# Display descriptor tags
+TAG_SERIAL = 0xff
+TAG_TEXT = 0xfe
+TAG_NAME = 0xfc
+
+_cache = {}  # (connector, hash): Edid
+
+
+class Edid:
+    def __init__(self, edid_hash, vendor, product_code, serial_number, week, year, version, width_cm, height_cm):
+        self.hash = edid_hash
+        self.vendor = vendor  # 3-letter PNP ID, e.g. "DEL"
+        self.product_code = product_code
+        self.serial_number = serial_number  # numeric serial from the base block, often 0
+        self.serial = ""  # serial string from the display descriptor, if any
+        self.name = ""  # monitor name from the display descriptor, if any
+        self.text = []  # unspecified text descriptors
+        self.week = week
+        self.year = year
+        self.version = version
+        self.width_cm = width_cm
+        self.height_cm = height_cm
+        self.timings = []  # detailed timings, the preferred one first
+
+    def identity(self):
+        # Stable across reboots and connector changes, as long as the monitor reports any serial
+        serial = self.serial if self.serial else str(self.serial_number)
+        return "{} {:04X} {}".format(self.vendor, self.product_code, serial)
+
+    def preferred_mode(self):
+        return self.timings[0] if self.timings else None
+
+    def to_dict(self):
+        return {"hash": self.hash,
+                "vendor": self.vendor,
+                "product-code": self.product_code,
+                "serial": self.serial if self.serial else str(self.serial_number),
+                "name": self.name,
+                "year": self.year,
+                "physical-size": [self.width_cm * 10, self.height_cm * 10],  # mm
+                "identity": self.identity(),
+                "timings": self.timings}
+
+
+def parse_detailed_timing(d):
+    """
+    Returns an 18-byte detailed timing descriptor as a mode dict, with refresh in mHz like sway modes.
+    """
+    pixel_clock = int.from_bytes(d[0:2], "little") * 10000  # Hz
+    h_active = d[2] | (d[4] & 0xf0) << 4
+    h_blank = d[3] | (d[4] & 0x0f) << 8
+    v_active = d[5] | (d[7] & 0xf0) << 4
+    v_blank = d[6] | (d[7] & 0x0f) << 8
+    total = (h_active + h_blank) * (v_active + v_blank)
+    return {"width": h_active,
+            "height": v_active,
+            "refresh": round(pixel_clock * 1000 / total) if total else 0,
+            "pixel-clock": pixel_clock // 1000,  # kHz
+            "interlaced": bool(d[17] & 0x80),
+            "width-mm": d[12] | (d[14] & 0xf0) << 4,
+            "height-mm": d[13] | (d[14] & 0x0f) << 8}
+
+
+def descriptor_text(d):
+    return d[5:18].split(b"\x0a")[0].decode("cp437").strip()
+
+
+def parse_edid(data):
+    """
+    Parses the base EDID block and CTA-861 extensions. Raises ValueError on malformed data.
+    """
+    if len(data) < BLOCK_SIZE or data[:8] != HEADER:
+        raise ValueError("not an EDID block")
+    if sum(data[:BLOCK_SIZE]) % 256 != 0:
+        raise ValueError("base block checksum mismatch")
+
+    pnp = int.from_bytes(data[8:10], "big")
+    vendor = "".join(chr(((pnp >> shift) & 0x1f) + ord("A") - 1) for shift in (10, 5, 0))
+
+    edid = Edid(hashlib.sha1(data).hexdigest(), vendor,
+                product_code=int.from_bytes(data[10:12], "little"),
+                serial_number=int.from_bytes(data[12:16], "little"),
+                week=data[16],
+                year=data[17] + 1990,
+                version="{}.{}".format(data[18], data[19]),
+                width_cm=data[21],
+                height_cm=data[22])
+
+    for offset in range(54, 126, 18):
+        d = data[offset:offset + 18]
+        if d[0] or d[1]:
+            edid.timings.append(parse_detailed_timing(d))
+        elif d[3] == TAG_SERIAL:
+            edid.serial = descriptor_text(d)
+        elif d[3] == TAG_NAME:
+            edid.name = descriptor_text(d)
+        elif d[3] == TAG_TEXT:
+            edid.text.append(descriptor_text(d))
+
+    for n in range(1, data[126] + 1):
+        block = data[n * BLOCK_SIZE:(n + 1) * BLOCK_SIZE]
+        if len(block) < BLOCK_SIZE or block[0] != CTA_EXTENSION or sum(block) % 256 != 0:
+            continue
+        # Detailed timings start at the offset from byte 2, and run until the padding
+        dtd_start = block[2]
+        if dtd_start < 4:
+            continue
+        for offset in range(dtd_start, BLOCK_SIZE - 18, 18):
+            d = block[offset:offset + 18]
+            if not (d[0] or d[1]):
+                break
+            timing = parse_detailed_timing(d)
+            if timing not in edid.timings:
+                edid.timings.append(timing)
+
+    return edid
+
+
+def read_edid(path):
+    """
+    Returns the parsed EDID from a file, or None if the connector is empty or the data is malformed.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        print("Error reading EDID: {}".format(e), file=sys.stderr)
+        return None
+    if not data:
+        return None
+
+    connector = os.path.basename(os.path.dirname(path))
+    key = (connector, hashlib.sha1(data).hexdigest())
+    if key not in _cache:
+        try:
+            _cache[key] = parse_edid(data)
+        except ValueError as e:
+            print("Error parsing EDID from '{}': {}".format(path, e), file=sys.stderr)
+            _cache[key] = None
+    return _cache[key]
+
+
+def read_edids(drm_path=DRM_PATH):
+    """
+    Returns {connector name: Edid} for connectors with a display attached, e.g. {"DP-1": Edid}.
+    """
+    result = {}
+    paths = sorted(glob.glob(os.path.join(drm_path, "card*-*", "edid")))
+    for path in paths:
+        edid = read_edid(path)
+        if edid:
+            # "card1-DP-1" -> "DP-1"
+            connector = os.path.basename(os.path.dirname(path)).split("-", 1)[1]
+            result[connector] = edid
+
+    # Forget monitors no longer connected, so that hotplugging doesn't grow the cache
+    current = {edid.hash for edid in result.values()}
+    connectors = {os.path.basename(os.path.dirname(path)) for path in paths}
+    for key in list(_cache):
+        if key[0] in connectors and (_cache[key] is None or _cache[key].hash not in current):
+            del _cache[key]
+
+    return result
@@ -0,0 +1,633 @@
+#!/usr/bin/env python
+
+"""
+Pure-Python output layout model. Widgets only render it, so everything else (apply, validation, snapping,
+undo) works without GTK, and the hot loops don't go through GObject attribute lookups.
+"""
+
+import bisect
+import datetime
+import heapq
+from fractions import Fraction
+from math import ceil, floor, gcd
+
+HYPR_TRANSFORMS = {"normal": 0, "90": 1, "180": 2, "270": 3, "flipped": 4, "flipped-90": 5, "flipped-180": 6,
+                   "flipped-270": 7}
+
+
+# Refresh rates closer than this (in mHz, like the modes) are the same for mirroring, e.g. 59.94 and 60 Hz
+REFRESH_TOLERANCE = 500
+
+# Fractional scales come in 1/120 steps, as in the wp_fractional_scale_v1 protocol; Hyprland checks them this way too
+SCALE_DENOMINATOR = 120
+
+
+def is_rotated(transform):
+    return "90" in transform or "270" in transform
+
+
+class OutputState:
+    """
+    Settings of a single output. Logical geometry is derived from the physical size, transform and scale,
+    and cached until one of them changes.
+    """
+    __slots__ = ("name", "description", "x", "y", "_physical_width", "_physical_height", "_transform", "_scale",
+                 "scale_filter", "refresh", "modes", "active", "dpms", "adaptive_sync", "custom_mode", "focused",
+                 "mirror", "ten_bit", "changed", "_logical")
+
+    # Compared by __eq__; `focused` and `changed` are not settings
+    fields = ("name", "description", "x", "y", "physical_width", "physical_height", "transform", "scale",
+              "scale_filter", "refresh", "active", "dpms", "adaptive_sync", "custom_mode", "mirror", "ten_bit")
+
+    def __init__(self, name, description, x, y, physical_width, physical_height, transform, scale, scale_filter,
+                 refresh, modes, active, dpms, adaptive_sync, custom_mode, focused=False, mirror="", ten_bit=False):
+        self.name = name
+        self.description = description
+        self.x = x
+        self.y = y
+        self._physical_width = physical_width
+        self._physical_height = physical_height
+        self._transform = transform
+        self._scale = scale
+        self.scale_filter = scale_filter
+        self.refresh = refresh
+        self.modes = modes
+        self.active = active
+        self.dpms = dpms
+        self.adaptive_sync = adaptive_sync
+        self.custom_mode = custom_mode
+        self.focused = focused
+        self.mirror = mirror
+        self.ten_bit = ten_bit
+        self.changed = []  # keys changed since the cached snapshot
+        self._logical = None
+
+    @classmethod
+    def from_output(cls, name, item, custom_mode=False):
+        """
+        Creates the state from an entry of the `list_outputs()` dictionary.
+        """
+        modes = []
+        for m in item["modes"]:
+            if m not in modes:
+                modes.append(m)
+        return cls(name, item["description"], item["x"], item["y"], round(item["physical-width"]),
+                   round(item["physical-height"]), item["transform"], item["scale"], item["scale_filter"],
+                   item["refresh"], modes, item["active"], item["dpms"],
+                   item["adaptive_sync_status"] == "enabled",  # converts "enabled | disabled" to bool
+                   custom_mode, focused=item["focused"], mirror=item["mirror"], ten_bit=item["ten_bit"])
+
+    def copy(self):
+        # The modes list is never modified in place, so it may be shared
+        state = OutputState.__new__(OutputState)
+        for slot in OutputState.__slots__:
+            setattr(state, slot, getattr(self, slot))
+        state.changed = list(self.changed)
+        return state
+
+    def key(self):
+        return tuple(getattr(self, f) for f in OutputState.fields)
+
+    def diff(self, other):
+        """
+        Returns the names of the fields that differ from `other`.
+        """
+        return [f for f in OutputState.fields if getattr(self, f) != getattr(other, f)]
+
+    def __eq__(self, other):
+        if not isinstance(other, OutputState):
+            return NotImplemented
+        return self.key() == other.key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "OutputState({})".format(", ".join("{}={!r}".format(f, getattr(self, f)) for f in OutputState.fields))
+
+    # Geometry
+    @property
+    def physical_width(self):
+        return self._physical_width
+
+    @physical_width.setter
+    def physical_width(self, value):
+        self._physical_width = value
+        self._logical = None
+
+    @property
+    def physical_height(self):
+        return self._physical_height
+
+    @physical_height.setter
+    def physical_height(self, value):
+        self._physical_height = value
+        self._logical = None
+
+    @property
+    def transform(self):
+        return self._transform
+
+    @transform.setter
+    def transform(self, value):
+        self._transform = value
+        self._logical = None
+
+    @property
+    def scale(self):
+        return self._scale
+
+    @scale.setter
+    def scale(self, value):
+        self._scale = value
+        self._logical = None
+
+    def logical_size(self):
+        if self._logical is None:
+            if is_rotated(self._transform):
+                self._logical = (self._physical_height / self._scale, self._physical_width / self._scale)
+            else:
+                self._logical = (self._physical_width / self._scale, self._physical_height / self._scale)
+        return self._logical
+
+    @property
+    def logical_width(self):
+        return self.logical_size()[0]
+
+    @property
+    def logical_height(self):
+        return self.logical_size()[1]
+
+    def rect(self):
+        w, h = self.logical_size()
+        return self.x, self.y, w, h
+
+
+class Layout:
+    """
+    Ordered collection of OutputState, by output name.
+    """
+    __slots__ = ("outputs",)
+
+    def __init__(self, states=()):
+        self.outputs = {}
+        for state in states:
+            self.outputs[state.name] = state
+
+    @classmethod
+    def from_outputs(cls, outputs_dict, custom_modes=()):
+        return cls(OutputState.from_output(key, outputs_dict[key], custom_mode=key in custom_modes)
+                   for key in outputs_dict)
+
+    def copy(self):
+        return Layout(state.copy() for state in self.outputs.values())
+
+    def __iter__(self):
+        return iter(self.outputs.values())
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, name):
+        return name in self.outputs
+
+    def __getitem__(self, name):
+        return self.outputs[name]
+
+    def get(self, name, default=None):
+        return self.outputs.get(name, default)
+
+    def names(self):
+        return list(self.outputs)
+
+    def __eq__(self, other):
+        if not isinstance(other, Layout):
+            return NotImplemented
+        return list(self.outputs.items()) == list(other.outputs.items())
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Layout({!r})".format(list(self.outputs.values()))
+
+
+def config_header():
+    now = datetime.datetime.now()
+    return "# Generated by nwg-displays on {} at {}. Do not edit manually.\n".format(
+        datetime.datetime.strftime(now, '%Y-%m-%d'),
+        datetime.datetime.strftime(now, '%H:%M:%S'))
+
+
+def sway_output_properties(state):
+    """
+    Returns [(property, value, fields it depends on)] of a sway output block, in the config file order.
+    """
+    custom_mode_str = "--custom" if state.custom_mode else ""
+    mode = "{} {}x{}@{}Hz".format(custom_mode_str, state.physical_width, state.physical_height, state.refresh)
+    return [("mode", mode, ("physical_width", "physical_height", "refresh", "custom_mode")),
+            ("pos", "{} {}".format(state.x, state.y), ("x", "y")),
+            ("transform", state.transform, ("transform",)),
+            ("scale", state.scale, ("scale",)),
+            ("scale_filter", state.scale_filter, ("scale_filter",)),
+            ("adaptive_sync", "on" if state.adaptive_sync else "off", ("adaptive_sync",)),
+            ("dpms", "on" if state.dpms else "off", ("dpms",))]
+
+
+def sway_config(layout, activity, baseline=None, use_desc=False, describe=None, only=None, baseline_activity=None):
+    """
+    Returns the sway `outputs` file lines, and the commands to apply `layout`. With `baseline` (the layout
+    the compositor currently runs) given, the commands only carry the properties that differ from it, and
+    unchanged outputs are left alone. Outputs off in `baseline_activity` are turned back on with all their
+    properties. `describe(name)` returns the description of an inactive output.
+    With `only` given, the commands carry just these properties, and don't disable outputs.
+    """
+    lines = [config_header()]
+    cmds = []
+    names = []
+    for state in layout:
+        name = state.name if not use_desc else state.description
+        names.append(name)
+
+        old = baseline.get(state.name) if baseline is not None else None
+        changed = state.diff(old) if old is not None else OutputState.fields
+        enable = baseline_activity is not None and not baseline_activity.get(state.name, True) \
+            and activity.get(state.name, True)
+        if enable:
+            changed = OutputState.fields
+
+        lines.append('output "%s" {' % name)
+        cmd = ""
+        for prop, value, fields in sway_output_properties(state):
+            lines.append("    {} {}".format(prop, value))
+            if only is not None and prop not in only:
+                continue
+            for f in fields:
+                if f in changed:
+                    cmd += " {} {}".format(prop, value)
+                    break
+        lines.append("}")
+        if enable and only is None:
+            cmd += " enable"
+        if cmd:
+            cmds.append('output "{}"{}'.format(name, cmd))
+
+    for key in activity:
+        name = key if not use_desc else describe(key)
+        if name not in names:
+            lines.append('output "{}" disable'.format(name))
+            # already off, if not in the baseline
+            if only is None and (baseline is None or key in baseline):
+                cmds.append('output "{}" disable'.format(name))
+
+    return lines, cmds
+
+
+def hypr_output_lines(state, activity, use_desc=False):
+    """
+    Returns the `monitor=` lines of a single output.
+    """
+    name = state.name if not use_desc else "desc:{}".format(state.description.replace("#", "##"))
+
+    line = "monitor={},{}x{}@{},{}x{},{}".format(name, state.physical_width, state.physical_height,
+                                                 state.refresh, state.x, state.y, state.scale)
+    if state.mirror:
+        line += ",mirror,{}".format(state.mirror)
+    if state.ten_bit:
+        line += ",bitdepth,10"
+
+    lines = [line]
+    if state.transform != "normal":
+        lines.append("monitor={},transform,{}".format(name, HYPR_TRANSFORMS[state.transform]))
+
+    # avoid looking up the hardware name
+    if state.name in activity and not activity[state.name]:
+        lines.append("monitor={},disable".format(name))
+    return lines
+
+
+def hypr_config(layout, activity, baseline=None, use_desc=False, keywords=False, baseline_activity=None):
+    """
+    Returns the Hyprland `monitors.conf` lines, and the commands to apply what Hyprland won't pick up from
+    the file on its own: DPMS state, only for outputs it changed on if `baseline` given. With `keywords`,
+    outputs that differ from `baseline`, or turned on or off since `baseline_activity`, are also reconfigured
+    with `keyword monitor`, so that the change doesn't wait for Hyprland to reload the file.
+    """
+    lines = [config_header()]
+    cmds = []
+    for state in layout:
+        output_lines = hypr_output_lines(state, activity, use_desc)
+        lines += output_lines
+
+        old = baseline.get(state.name) if baseline is not None else None
+        toggled = baseline_activity is not None and \
+            baseline_activity.get(state.name, True) != activity.get(state.name, True)
+        if keywords and (old is None or toggled or state.diff(old)):
+            for line in output_lines:
+                cmds.append("keyword monitor {}".format(line[len("monitor="):]))
+        if old is None or old.dpms != state.dpms:
+            cmds.append("dispatch dpms {} {}".format("on" if state.dpms else "off", state.name))
+
+    return lines, cmds
+
+
+# Changing these takes the compositor a modeset, about a second per output
+MODESET_FIELDS = ("physical_width", "physical_height", "refresh", "custom_mode", "ten_bit")
+
+
+def modesets(layout, activity, baseline=None, baseline_activity=None):
+    """
+    Returns the number of outputs that applying `layout` turns on or off, or changes the mode of; all of them, if
+    `baseline` is None.
+    """
+    count = 0
+    for name in set(layout.names()) | set(activity):
+        on = activity.get(name, True)
+        if baseline_activity is not None and baseline_activity.get(name, True) != on:
+            count += 1
+        elif on and name in layout:
+            old = baseline.get(name) if baseline is not None else None
+            if old is None or any(getattr(layout[name], f) != getattr(old, f) for f in MODESET_FIELDS):
+                count += 1
+    return count
+
+
+def position_commands(states, activity, hypr=False, baseline=None):
+    """
+    Returns the commands that move the outputs to their positions, and change nothing else: `output pos` on sway,
+    the whole `keyword monitor` line on Hyprland, which has no position-only keyword. The rest of that line comes
+    from `baseline`, the layout the compositor runs, so that edits not applied yet stay that way; outputs missing
+    from it are left alone.
+    """
+    cmds = []
+    for state in states:
+        if not activity.get(state.name, True) or state.mirror:
+            continue
+        if hypr:
+            old = baseline.get(state.name) if baseline is not None else None
+            if old is None or old.mirror:
+                continue
+            moved = old.copy()
+            moved.x, moved.y = state.x, state.y
+            cmds.append("keyword monitor {}".format(hypr_output_lines(moved, activity)[0][len("monitor="):]))
+        else:
+            cmds.append('output "{}" pos {} {}'.format(state.name, state.x, state.y))
+    return cmds
+
+
+def valid_scales(width, height, lower=Fraction(1, 10), upper=Fraction(10)):
+    """
+    Returns the sorted scales (as Fractions) in 1/120 steps between `lower` and `upper`, that give an integer
+    logical width and height for the `width` x `height` mode.
+    """
+    # width / (k / 120) is an integer when k divides 120 * width, so k must divide 120 * gcd(width, height)
+    n = SCALE_DENOMINATOR * gcd(width, height)
+    result = set()
+    i = 1
+    while i * i <= n:
+        if n % i == 0:
+            for k in (i, n // i):
+                scale = Fraction(k, SCALE_DENOMINATOR)
+                if lower <= scale <= upper:
+                    result.add(scale)
+        i += 1
+    return sorted(result)
+
+
+def scale_table(layout):
+    """
+    Returns {(width, height): valid_scales()} for all the modes of all the outputs.
+    """
+    table = {}
+    for state in layout:
+        sizes = [(m["width"], m["height"]) for m in state.modes]
+        sizes.append((state.physical_width, state.physical_height))
+        for size in sizes:
+            if size not in table:
+                table[size] = valid_scales(*size)
+    return table
+
+
+def snap_scale(scales, value, previous=None):
+    """
+    Returns the scale from `scales` closest to `value`. With `previous` given, moves in the direction of the change,
+    so that stepping the spin button from a valid value doesn't get stuck on it.
+    """
+    if not scales:
+        return value
+    for scale in scales:
+        if abs(scale - value) < 1e-6:
+            return float(scale)
+
+    if previous is not None and value > previous:
+        bigger = [scale for scale in scales if scale > value]
+        return float(bigger[0] if bigger else scales[-1])
+    if previous is not None and value < previous:
+        smaller = [scale for scale in scales if scale < value]
+        return float(smaller[-1] if smaller else scales[0])
+
+    return float(min(scales, key=lambda scale: abs(scale - value)))
+
+
+def common_modes(mode_tables, tolerance=REFRESH_TOLERANCE):
+    """
+    Intersects the mode lists (as in OutputState.modes) of a mirror group. Returns [(width, height, refreshes)],
+    best first: the largest resolution, then the highest refresh rate that all the outputs can do. `refreshes`
+    holds the refresh rate (mHz) of the matching mode of each output, in the `mode_tables` order, as they may
+    differ by up to `tolerance`.
+    """
+    if not mode_tables:
+        return []
+
+    # (width, height): sorted refresh rates, per output
+    tables = []
+    for modes in mode_tables:
+        table = {}
+        for m in modes:
+            table.setdefault((m["width"], m["height"]), []).append(m["refresh"])
+        for rates in table.values():
+            rates.sort()
+        tables.append(table)
+
+    sizes = set(tables[0])
+    for table in tables[1:]:
+        sizes &= set(table)
+
+    result = []
+    for size in sizes:
+        for rate in tables[0][size]:
+            refreshes = [rate]
+            for table in tables[1:]:
+                rates = table[size]
+                # the closest rate is one of the neighbours of the insertion point
+                i = bisect.bisect_left(rates, rate)
+                closest = min(rates[max(i - 1, 0):i + 1], key=lambda r: abs(r - rate))
+                if abs(closest - rate) > tolerance:
+                    break
+                refreshes.append(closest)
+            else:
+                result.append((size[0], size[1], tuple(refreshes)))
+
+    result.sort(key=lambda m: (m[0] * m[1], min(m[2]), -(max(m[2]) - min(m[2]))), reverse=True)
+    return result
+
+
+class RectIndex:
+    """
+    Grid-bucket spatial index of (x, y, width, height) rectangles in logical pixels.
+    """
+    CELL = 1024
+
+    def __init__(self, rects=()):
+        self.buckets = {}  # (cell_x, cell_y): [rects]
+        for rect in rects:
+            self.add(rect)
+
+    def cells(self, x, y, w, h):
+        for cx in range(int(x // self.CELL), int((x + w) // self.CELL) + 1):
+            for cy in range(int(y // self.CELL), int((y + h) // self.CELL) + 1):
+                yield cx, cy
+
+    def add(self, rect):
+        for cell in self.cells(*rect):
+            self.buckets.setdefault(cell, []).append(rect)
+
+    def overlapping(self, x, y, w, h):
+        """
+        Returns the rectangles that overlap this one; touching edges don't count.
+        """
+        result = []
+        for cell in self.cells(x, y, w, h):
+            for r in self.buckets.get(cell, ()):
+                if r[0] < x + w and x < r[0] + r[2] and r[1] < y + h and y < r[1] + r[3] and r not in result:
+                    result.append(r)
+        return result
+
+
+def free_position(index, x, y, width, height, max_candidates=64):
+    """
+    Returns the position closest to x, y where a `width` x `height` rectangle overlaps nothing in `index`, with
+    non-negative coordinates; None if none found in `max_candidates` tries. Candidates are the positions flush with
+    the sides of the rectangles in the way, so that a dragged output slides along its neighbours' edges.
+    """
+    heap = [(0, x, y)]
+    seen = {(x, y)}
+    while heap and len(seen) <= max_candidates:
+        distance, cx, cy = heapq.heappop(heap)
+        obstacles = index.overlapping(cx, cy, width, height)
+        if not obstacles:
+            return cx, cy
+        for ox, oy, ow, oh in obstacles:
+            for nx, ny in ((floor(ox - width), cy), (ceil(ox + ow), cy), (cx, floor(oy - height)),
+                           (cx, ceil(oy + oh))):
+                if nx >= 0 and ny >= 0 and (nx, ny) not in seen:
+                    seen.add((nx, ny))
+                    heapq.heappush(heap, ((nx - x) ** 2 + (ny - y) ** 2, nx, ny))
+    return None
+
+
+class Adjacency:
+    """
+    Which outputs touch which, kept up to date as outputs move and resize. `right[name]` holds the outputs whose
+    left edge lies on the right edge of `name`, `below[name]` those whose top edge lies on its bottom edge.
+    Inactive and mirroring outputs are left out.
+    """
+    TOLERANCE = 1  # logical pixels, for fractional sizes
+
+    def __init__(self, layout):
+        self.states = {}
+        self.rects = {}  # name: rectangle as of the last update
+        self.right = {}
+        self.below = {}
+        self.dirty = set()  # moved since the last update
+        for state in layout:
+            if state.active and not state.mirror:
+                self.states[state.name] = state
+                self.rects[state.name] = state.rect()
+                self.right[state.name] = set()
+                self.below[state.name] = set()
+        for name in self.states:
+            self.link(name)
+
+    def link(self, name):
+        x, y, w, h = self.rects[name]
+        for other, (ox, oy, ow, oh) in self.rects.items():
+            if other == name:
+                continue
+            if oy < y + h and y < oy + oh:
+                if abs(ox - (x + w)) <= self.TOLERANCE:
+                    self.right[name].add(other)
+                if abs(x - (ox + ow)) <= self.TOLERANCE:
+                    self.right[other].add(name)
+            if ox < x + w and x < ox + ow:
+                if abs(oy - (y + h)) <= self.TOLERANCE:
+                    self.below[name].add(other)
+                if abs(y - (oy + oh)) <= self.TOLERANCE:
+                    self.below[other].add(name)
+
+    def unlink(self, name):
+        self.right[name].clear()
+        self.below[name].clear()
+        for neighbours in self.right.values():
+            neighbours.discard(name)
+        for neighbours in self.below.values():
+            neighbours.discard(name)
+
+    def moved(self, states):
+        # Cheap enough for every motion event: the edges are recomputed on the next update
+        for state in states:
+            if state.name in self.states:
+                self.dirty.add(state.name)
+
+    def refresh(self):
+        for name in self.dirty:
+            self.rects[name] = self.states[name].rect()
+            self.unlink(name)
+            self.link(name)
+        self.dirty.clear()
+
+    def reach(self, graph, start):
+        result = []
+        seen = {start}
+        queue = [start]
+        while queue:
+            for other in graph[queue.pop()]:
+                if other not in seen:
+                    seen.add(other)
+                    result.append(other)
+                    queue.append(other)
+        return result
+
+    def update(self, state, reflow=True):
+        """
+        Call after the output geometry changed. If its logical size did, and `reflow`, shifts the outputs that
+        depend on its right and bottom edges, so that they keep touching them. Returns the outputs shifted.
+        """
+        name = state.name
+        if name not in self.states:
+            return []
+        old_w, old_h = self.rects[name][2:]
+        new_w, new_h = state.logical_size()
+        # The size only changes here, and doesn't move the output: the edges as they were before the change
+        self.dirty.discard(name)
+        self.rects[name] = (state.x, state.y, old_w, old_h)
+        self.unlink(name)
+        self.link(name)
+        self.refresh()
+
+        shifted = []
+        if reflow:
+            dw, dh = new_w - old_w, new_h - old_h
+            if dw:
+                for other in self.reach(self.right, name):
+                    s = self.states[other]
+                    s.x = round(s.x + dw)
+                    shifted.append(s)
+            if dh:
+                for other in self.reach(self.below, name):
+                    s = self.states[other]
+                    s.y = round(s.y + dh)
+                    if not any(s is t for t in shifted):
+                        shifted.append(s)
+
+        self.moved([state] + shifted)
+        self.refresh()
+        return shifted
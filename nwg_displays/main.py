@@ -16,6 +16,23 @@ Thank you, Kurt Jacobson!
 import argparse
 import os.path
 import sys
+import threading
+
+# The offline simulator needs neither a compositor nor GTK, so it must run before we check for them
+if "--dry-run" in sys.argv[1:]:
+    from nwg_displays.dryrun import main as dry_run
+
+    sys.exit(dry_run())
+
+# Replaying a recorded session sets up the compositor environment, so it must go before the checks too
+if "--replay" in sys.argv[1:]:
+    from nwg_displays import session
+
+    try:
+        session.start_replay(sys.argv[sys.argv.index("--replay") + 1])
+    except (IndexError, OSError, ValueError, session.ReplayError) as e:
+        print("Couldn't load the session to replay: {}".format(e), file=sys.stderr)
+        sys.exit(1)
 
 import gi
 
@@ -31,7 +48,11 @@ except ValueError:
 
 from gi.repository import Gtk, GLib, GtkLayerShell
 
+from nwg_displays import metrics, session
 from nwg_displays.tools import *
+from nwg_displays.wlr import MODESET_TIMEOUT, UNSUPPORTED_PROPERTIES, apply_layout as wlr_apply_layout, scale_exact
+from nwg_displays.layout import Layout, sway_config, hypr_config, scale_table, valid_scales, \
+    snap_scale, common_modes, position_commands, modesets, RectIndex, free_position, Adjacency
 
 from nwg_displays.__about__ import __version__
 
@@ -43,6 +64,10 @@ config_dir = os.path.join(get_config_home(), "nwg-displays")
 # This was done by mistake, and the config file need to be migrated to the proper path
 old_config_dir = os.path.join(get_config_home(), "nwg-outputs")
 
+# The last good outputs snapshot, to draw the layout from before the compositor answers
+outputs_cache_path = os.path.join(get_cache_home(), "nwg-displays",
+                                  "outputs-hyprland.json" if hypr else "outputs-sway.json")
+
 sway_config_dir = os.path.join(get_config_home(), "sway")
 if sway and not os.path.isdir(sway_config_dir):
     print("WARNING: Couldn't find sway config directory '{}'".format(sway_config_dir), file=sys.stderr)
@@ -75,10 +100,28 @@ and the add inactive outputs, if any, from what we detect with .get_outputs()
 """
 outputs = {}  # Active outputs, listed from the sway tree; stores name and all attributes.
 outputs_activity = {}  # Just a dictionary "name": is_active - from get_outputs()
+snapshot = None  # OutputSnapshot: compositor state fetched once per refresh
 workspaces = {}  # "workspace_num": "display_name"
 
-display_buttons = []
-selected_output_button = None
+layout = Layout()  # The edited outputs state; widgets only render it
+applied_layout = None  # What the compositor runs, as of the last refresh or apply
+applied_activity = {}  # name: is_active, as the compositor runs it; `outputs_activity` holds the edits
+view_cached = False  # the layout comes from the outputs cache: nothing is sent until the compositor answers
+scales = {}  # (width, height): valid scales for the mode, see `scale_table()`
+display_buttons = {}  # name: DisplayButton, unless the canvas renderer is on
+indicators = {}  # name: Indicator
+selected_output = None  # OutputState
+selection = []  # OutputStates selected together and dragged as one; selected_output is the one in the form
+group_moved = False  # if the pointer dragged anything since the button press
+drag_index = None  # RectIndex of the outputs not being dragged, built on the first move
+adjacency = None  # Adjacency of the layout outputs, for the auto reflow
+preview_pending = {}  # name: OutputState, to move on the next live preview tick
+preview_src = 0  # live preview timer
+preview_origin = {}  # name: (x, y) as last applied, of the outputs moved by the live preview
+preview_i3 = None  # Connection kept for the live preview
+refresh_count = 0
+show_stats = False  # --stats
+activity_box = None  # holds the "Active" check buttons
 
 # Glade form fields
 form_name = None
@@ -88,6 +131,7 @@ form_adaptive_sync = None
 form_custom_mode = None
 form_view_scale = None
 form_use_desc = None
+form_auto_reflow = None
 form_x = None
 form_y = None
 form_width = None
@@ -101,30 +145,36 @@ form_wrapper_box = None
 form_workspaces = None
 form_close = None
 form_apply = None
+form_toggle = None
 form_version = None
 form_mirror = None
+mirror_status = {}  # mirrored output name: the common mode proposed for the group, shown on the form
 form_ten_bit = None
 
 dialog_win = None
 confirm_win = None
+ROLLBACK_BUDGET = 3  # seconds for all the IPC requests of a rollback, plus MODESET_TIMEOUT per output modeset
+rollback = None  # (Layout, activity) the compositor ran before the last apply, restored unless confirmed
 src_tag = 0
 counter = 0
 
 """
 We need to rebuild the modes GtkComboBoxText on each DisplayButton click. Unfortunately appending an item fires the
-"change" event every time (and we have no "value-changed" event here). Setting `on_mode_changed_silent` True will 
-prevent the `on_mode_changed` function from working.
+"change" event every time (and we have no "value-changed" event here). Setting `form_silent` True will 
+prevent the `on_mode_changed` function from working. The same goes for the other form field handlers: `update_form`
+only shows the state, and must not write it back, which would e.g. rebuild the drag index on every motion event.
 """
-on_mode_changed_silent = False
+form_silent = False
 
 # Value from config adjusted to current view scale
 snap_threshold_scaled = None
 
 fixed = Gtk.Fixed()
+canvas = None  # LayoutCanvas, if "canvas-renderer" enabled; replaces the `fixed` above
 
 SENSITIVITY = 1
 
-EvMask = Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON1_MOTION_MASK
+EvMask = Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK | Gdk.EventMask.BUTTON1_MOTION_MASK
 
 offset_x = 0
 offset_y = 0
@@ -166,15 +216,10 @@ def load_vocabulary():
 
 
 def on_button_press_event(widget, event):
-    if widget != selected_output_button:
-        widget.indicator.show_up()
-
     if event.button == 1:
-        for db in display_buttons:
-            if db.name == widget.name:
-                db.select()
-            else:
-                db.unselect()
+        global group_moved
+        group_moved = False
+        select_output(widget.state, toggle=bool(event.state & Gdk.ModifierType.CONTROL_MASK), keep_group=True)
 
         p = widget.get_parent()
         # offset == distance of parent widget from edge of screen ...
@@ -189,17 +234,73 @@ def on_button_press_event(widget, event):
         global max_x, max_y
         max_x = round_down_to_multiple(p.get_allocation().width - widget.get_allocation().width, SENSITIVITY)
         max_y = round_down_to_multiple(p.get_allocation().height - widget.get_allocation().height, SENSITIVITY)
+    elif widget.state is not selected_output:
+        indicators[widget.state.name].show_up()
+
+
+def on_button_release_event(widget, event):
+    if event.button == 1 and group_moved:
+        end_preview()
+    # A plain click on a member of the group, with no drag, selects just that output
+    if event.button == 1 and not group_moved and not event.state & Gdk.ModifierType.CONTROL_MASK:
+        select_output(widget.state)
+
+
+def in_selection(state):
+    return any(s is state for s in selection)
+
+
+def select_output(state, toggle=False, keep_group=False):
+    """
+    Makes `state` the output shown in the form. With `toggle` (Ctrl-click) adds it to the selection, or takes
+    it out if it's there already; `keep_group` leaves the selection alone if the output belongs to it, so that
+    the group can be dragged. Otherwise `state` becomes the only output selected.
+    """
+    global selected_output, selection
+    if toggle:
+        if not in_selection(state):
+            selection.append(state)
+        elif len(selection) > 1:
+            selection = [s for s in selection if s is not state]
+            state = selection[-1]
+    elif not (keep_group and in_selection(state)):
+        selection = [state]
+
+    if state is not selected_output:
+        indicators[state.name].show_up()
+    selected_output = state
+    invalidate_drag_index()
+    show_selection()
+    update_form(state)
+
+
+def select_outputs(states, toggle=False):
+    # Rubber band selection
+    global selection
+    if not states:
+        return
+    if toggle:
+        selection = selection + [s for s in states if not in_selection(s)]
+    else:
+        selection = list(states)
+    select_output(selection[-1], keep_group=True)
+
 
-        update_form_from_widget(widget)
+def show_selection():
+    if canvas:
+        # Just redraw the outputs involved, no restyling of the others
+        canvas.select(selected_output, selection)
+    else:
+        for b in display_buttons.values():
+            if in_selection(b.state):
+                b.select()
+            else:
+                b.unselect()
 
 
 def on_motion_notify_event(widget, event):
     # x_root,x_root relative to screen
     # x,y relative to parent (fixed widget)
-    # px,py stores previous values of x,y
-
-    global px, py
-    global offset_x, offset_y
 
     # get starting values for x,y
     x = event.x_root - offset_x
@@ -210,214 +311,281 @@ def on_motion_notify_event(widget, event):
     x = round_to_nearest_multiple(max_val(min_val(x, max_x), 0), SENSITIVITY)
     y = round_to_nearest_multiple(max_val(min_val(y, max_y), 0), SENSITIVITY)
 
-    if x != px or y != py:
-        px = x
-        py = y
-        snap_x, snap_y = [0], [0]
-        for db in display_buttons:
-            if db.name == widget.name:
-                continue
-
-            val = db.x * config["view-scale"]
-            if val not in snap_x:
-                snap_x.append(val)
-
-            val = (db.x + db.logical_width) * config["view-scale"]
-            if val not in snap_x:
-                snap_x.append(val)
-
-            val = db.y * config["view-scale"]
-            if val not in snap_y:
-                snap_y.append(val)
-
-            val = (db.y + db.logical_height) * config["view-scale"]
-            if val not in snap_y:
-                snap_y.append(val)
-
-        snap_h, snap_v = None, None
-        for value in snap_x:
-            if abs(x - value) < snap_threshold_scaled:
-                snap_h = value
-                break
-
-        for value in snap_x:
-            w = widget.logical_width * config["view-scale"]
-            if abs(w + x - value) < snap_threshold_scaled:
-                snap_h = value - w
-                break
-
-        for value in snap_y:
-            if abs(y - value) < snap_threshold_scaled:
-                snap_v = value
-                break
-
-        for value in snap_y:
-            h = widget.logical_height * config["view-scale"]
-            if abs(h + y - value) < snap_threshold_scaled:
-                snap_v = value - h
-                break
-
-        # Just in case ;)
-        if snap_h and snap_h < 0:
-            snap_h = 0
-
-        if snap_v and snap_v < 0:
-            snap_v = 0
-
-        if snap_h is None and snap_v is None:
-            fixed.move(widget, x, y)
-            widget.x = round(x / config["view-scale"])
-            widget.y = round(y / config["view-scale"])
+    moved = drag_output(widget.state, x, y)
+    for state in moved:
+        fixed.move(display_buttons[state.name], state.x * config["view-scale"], state.y * config["view-scale"])
+
+    if moved:
+        update_form(widget.state)
+        preview_positions(moved)
+
+
+def on_canvas_drag(state, x, y):
+    moved = drag_output(state, round_to_nearest_multiple(x, SENSITIVITY), round_to_nearest_multiple(y, SENSITIVITY))
+    if moved:
+        update_form(state)
+        preview_positions(moved)
+    return moved
+
+
+def preview_positions(states):
+    """
+    Live preview: queues the outputs to be moved on the compositor. Whatever is queued goes in a single batched
+    request per tick, at `live-preview-rate` per second at most; nothing is saved to the config file.
+    """
+    if not config["live-preview"] or view_cached:
+        return
+    global preview_src
+    for state in states:
+        preview_pending[state.name] = state
+    if not preview_src:
+        preview_src = GLib.timeout_add(max(1000 // config["live-preview-rate"], 10), on_preview_tick)
+
+
+def on_preview_tick():
+    global preview_src
+    if not preview_pending:
+        # the pointer stopped; the next move restarts the timer
+        preview_src = 0
+        return False
+    flush_preview()
+    return True
+
+
+def end_preview():
+    # On drop: the final position goes right away
+    global preview_src
+    if preview_src:
+        GLib.source_remove(preview_src)
+        preview_src = 0
+    if preview_pending:
+        flush_preview()
+
+
+def flush_preview():
+    states = list(preview_pending.values())
+    preview_pending.clear()
+    for state in states:
+        if state.name not in preview_origin and applied_layout and state.name in applied_layout:
+            old = applied_layout[state.name]
+            preview_origin[state.name] = (old.x, old.y)
+    send_positions(position_commands(states, outputs_activity, hypr=hypr, baseline=applied_layout))
+
+
+def send_positions(cmds):
+    global preview_i3
+    if not cmds:
+        return
+    try:
+        if sway:
+            if preview_i3 is None:
+                preview_i3 = Connection()
+            preview_i3.command("; ".join(cmds))
         else:
+            hyprctl_batch(cmds)
+    except IPCError as e:
+        eprint("Live preview: {}".format(e))
+
+
+def revert_preview():
+    # Puts the outputs moved by the live preview, but not applied, back where they were
+    states = []
+    for name in preview_origin:
+        if name in layout:
+            state = layout[name].copy()
+            state.x, state.y = preview_origin[name]
+            states.append(state)
+    preview_origin.clear()
+    with ipc_budget(1):
+        send_positions(position_commands(states, outputs_activity, hypr=hypr, baseline=applied_layout))
+
+
+def quit_app(*args):
+    if preview_origin:
+        revert_preview()
+    Gtk.main_quit()
+
+
+def drag_output(state, x, y):
+    """
+    Moves the output to x, y in view coordinates, together with the rest of the selection if it belongs to it.
+    The group moves as one: its bounding box is snapped to the other outputs' edges, and the outputs keep their
+    relative positions. Returns the outputs moved, empty if the pointer hasn't moved.
+    """
+    # px,py stores previous values of x,y
+    global px, py, group_moved
+    if x == px and y == py:
+        return []
+    px = x
+    py = y
+
+    group = selection if in_selection(state) else [state]
+    view_scale = config["view-scale"]
+    rects = []
+    for other in layout:
+        if not any(other is s for s in group):
+            ox, oy, ow, oh = other.rect()
+            rects.append((ox * view_scale, oy * view_scale, ow * view_scale, oh * view_scale))
+    snap_x, snap_y = snap_edges(rects)
+
+    x0 = min(s.x for s in group)
+    y0 = min(s.y for s in group)
+    x1 = max(s.x + s.logical_width for s in group)
+    y1 = max(s.y + s.logical_height for s in group)
+    # where the pointer wants the bounding box
+    bx = x + (x0 - state.x) * view_scale
+    by = y + (y0 - state.y) * view_scale
+    bx, by = snap_position(bx, by, (x1 - x0) * view_scale, (y1 - y0) * view_scale, snap_x, snap_y,
+                           snap_threshold_scaled)
+
+    nx = max(round(bx / view_scale), 0)
+    ny = max(round(by / view_scale), 0)
+    if config["collision-drag"]:
+        # Slide along the neighbours rather than over them; stay put if there's no room nearby
+        global drag_index
+        if drag_index is None:
+            drag_index = RectIndex(other.rect() for other in layout if not any(other is s for s in group)
+                                   and other.active and not other.mirror)
+        position = free_position(drag_index, nx, ny, x1 - x0, y1 - y0)
+        if position is None:
+            return []
+        nx, ny = position
+
+    dx = nx - x0
+    dy = ny - y0
+    if not dx and not dy:
+        return []
+    for s in group:
+        s.x += dx
+        s.y += dy
+    group_moved = True
+    if adjacency:
+        adjacency.moved(group)
+
+    return group
+
+
+def invalidate_drag_index():
+    # Call when outputs other than the dragged ones may have moved
+    global drag_index
+    drag_index = None
+
+
+def refresh_output_view(state):
+    # Call after changing the output geometry
+    invalidate_drag_index()
+    redraw_output(state)
+    if adjacency:
+        # With the auto reflow on, a size change pushes or pulls the outputs on the right and below
+        shifted = adjacency.update(state, reflow=config["auto-reflow"])
+        for other in shifted:
+            redraw_output(other)
+        if any(s is selected_output for s in shifted):
+            update_form(selected_output)
+
+
+def redraw_output(state):
+    if canvas:
+        canvas.item_changed(state)
+    else:
+        b = display_buttons[state.name]
+        b.rescale_transform()
+        fixed.move(b, state.x * config["view-scale"], state.y * config["view-scale"])
 
-            if snap_h is not None and snap_v is not None:
-                fixed.move(widget, snap_h, snap_v)
-                widget.x = round(snap_h / config["view-scale"])
-                widget.y = round(snap_v / config["view-scale"])
-
-            elif snap_h is not None:
-                fixed.move(widget, snap_h, y)
-                widget.x = round(snap_h / config["view-scale"])
-                widget.y = round(y / config["view-scale"])
-
-            elif snap_v is not None:
-                fixed.move(widget, x, snap_v)
-                widget.x = round(x / config["view-scale"])
-                widget.y = round(snap_v / config["view-scale"])
-
-    update_form_from_widget(widget)
 
+def update_form(state):
+    global form_silent
+    form_silent = True
 
-def update_form_from_widget(widget):
-    form_name.set_text(widget.name)
-    if len(widget.description) > 48:
-        form_description.set_text(f"{widget.description[:47]}(…)")
+    form_name.set_text(state.name)
+    if len(state.description) > 48:
+        form_description.set_text(f"{state.description[:47]}(…)")
     else:
-        form_description.set_text(widget.description)
-    form_dpms.set_active(widget.dpms)
-    form_adaptive_sync.set_active(widget.adaptive_sync)
-    form_custom_mode.set_active(widget.custom_mode)
-    form_view_scale.set_value(config["view-scale"])  # not really from the widget, but from the global value
+        form_description.set_text(state.description)
+    form_dpms.set_active(state.dpms)
+    form_adaptive_sync.set_active(state.adaptive_sync)
+    form_custom_mode.set_active(state.custom_mode)
+    form_view_scale.set_value(config["view-scale"])  # not really from the state, but from the global value
     form_use_desc.set_active(config["use-desc"])
-    form_x.set_value(widget.x)
-    form_y.set_value(widget.y)
-    form_width.set_value(widget.physical_width)
-    form_height.set_value(widget.physical_height)
-    form_scale.set_value(widget.scale)
-    form_scale_filter.set_active_id(widget.scale_filter)
-    form_refresh.set_value(widget.refresh)
+    form_x.set_value(state.x)
+    form_y.set_value(state.y)
+    form_width.set_value(state.physical_width)
+    form_height.set_value(state.physical_height)
+    form_scale.set_value(state.scale)
+    form_scale_filter.set_active_id(state.scale_filter)
+    form_refresh.set_value(state.refresh)
     if form_ten_bit:
-        form_ten_bit.set_active(widget.ten_bit)
+        form_ten_bit.set_active(state.ten_bit)
     if form_mirror:
         form_mirror.remove_all()
         form_mirror.append("", voc["none"])
         for key in outputs:
-            if key != widget.name:
+            if key != state.name:
                 form_mirror.append(key, key)
-        form_mirror.set_active_id(widget.mirror)
+        form_mirror.set_active_id(state.mirror)
+        form_mirror.set_tooltip_text(mirror_status.get(state.mirror if state.mirror else state.name))
         form_mirror.show_all()
 
-    global on_mode_changed_silent
-    on_mode_changed_silent = True
-
     form_modes.remove_all()
     active = ""
-    for mode in widget.modes:
+    for mode in state.modes:
         m = "{}x{}@{}Hz".format(mode["width"], mode["height"], mode["refresh"] / 1000, mode[
-            "refresh"] / 1000, widget.refresh)
+            "refresh"] / 1000, state.refresh)
         form_modes.append(m, m)
         # This is just to set active_id
 
-        if mode["width"] == widget.physical_width and mode["height"] == widget.physical_height and mode[
-            "refresh"] / 1000 == widget.refresh:
+        if mode["width"] == state.physical_width and mode["height"] == state.physical_height and mode[
+            "refresh"] / 1000 == state.refresh:
             active = m
     if active:
         form_modes.set_active_id(active)
 
-    form_transform.set_active_id(widget.transform)
+    form_transform.set_active_id(state.transform)
 
-    on_mode_changed_silent = False
+    form_silent = False
 
 
 class DisplayButton(Gtk.Button):
-    def __init__(self, name, description, x, y, physical_width, physical_height, transform, scale, scale_filter,
-                 refresh, modes, active, dpms, adaptive_sync_status, ten_bit, custom_mode_status, focused, monitor,
-                 mirror=""):
+    def __init__(self, state):
         super().__init__()
-        # Output properties
-        self.name = name
-        self.description = description
-        self.x = x
-        self.y = y
-        self.physical_width = physical_width
-        self.physical_height = physical_height
-        self.transform = transform
-        self.scale = scale
-        self.scale_filter = scale_filter
-        self.refresh = refresh
-        self.modes = []
-        for m in modes:
-            if m not in self.modes:
-                self.modes.append(m)
-        # self.modes = modes
-        self.active = active
-        self.dpms = dpms
-        self.adaptive_sync = adaptive_sync_status == "enabled"  # converts "enabled | disabled" to bool
-        self.custom_mode = custom_mode_status
-        self.focused = focused
-        self.mirror = mirror
-        self.ten_bit = ten_bit
+        self.state = state
 
         # Button properties
-        self.selected = False
         self.set_can_focus(False)
         self.set_events(EvMask)
         self.connect("button_press_event", on_button_press_event)
         self.connect("motion_notify_event", on_motion_notify_event)
+        self.connect("button_release_event", on_button_release_event)
         self.set_always_show_image(True)
-        self.set_label(self.name)
+        self.set_label(state.name)
 
         self.rescale_transform()
         self.set_property("name", "output")
-
-        self.indicator = Indicator(monitor, name, round(self.physical_width * config["view-scale"]),
-                                   round(self.physical_height * config["view-scale"]), config["indicator-timeout"])
+        if state.changed:
+            self.mark_changed()
 
         self.show()
 
-    @property
-    def logical_width(self):
-        if is_rotated(self.transform):
-            return self.physical_height / self.scale
-        else:
-            return self.physical_width / self.scale
-
-    @property
-    def logical_height(self):
-        if is_rotated(self.transform):
-            return self.physical_width / self.scale
-        else:
-            return self.physical_height / self.scale
-
     def select(self):
-        self.selected = True
         self.set_property("name", "selected-output")
-        global selected_output_button
-        selected_output_button = self
 
     def unselect(self):
         self.set_property("name", "output")
 
+    def mark_changed(self):
+        self.get_style_context().add_class("changed")
+        self.set_tooltip_text("Changed since last run: {}".format(", ".join(self.state.changed)))
+
     def rescale_transform(self):
-        self.set_size_request(round(self.logical_width * config["view-scale"]),
-                              round(self.logical_height * config["view-scale"]))
+        w, h = self.state.logical_size()
+        self.set_size_request(round(w * config["view-scale"]), round(h * config["view-scale"]))
 
     def on_active_check_button_toggled(self, w):
-        self.active = w.get_active()
-        if not self.active:
+        self.state.active = w.get_active()
+        if not self.state.active:
             self.set_property("name", "inactive-output")
         else:
-            if self == selected_output_button:
+            if in_selection(self.state):
                 self.set_property("name", "selected-output")
             else:
                 self.set_property("name", "output")
@@ -429,28 +597,31 @@ def on_view_scale_changed(*args):
     global snap_threshold_scaled
     snap_threshold_scaled = round(config["snap-threshold"] * config["view-scale"] * 10)
 
-    for b in display_buttons:
-        b.rescale_transform()
-        fixed.move(b, b.x * config["view-scale"], b.y * config["view-scale"])
+    if canvas:
+        canvas.set_view_scale(config["view-scale"])
+    else:
+        for b in display_buttons.values():
+            b.rescale_transform()
+            fixed.move(b, b.state.x * config["view-scale"], b.state.y * config["view-scale"])
 
     save_json(config, os.path.join(config_dir, "config"))
 
 
 def on_transform_changed(*args):
-    if selected_output_button:
+    if selected_output and not form_silent:
         transform = form_transform.get_active_id()
-        selected_output_button.transform = transform
-        selected_output_button.rescale_transform()
+        selected_output.transform = transform
+        refresh_output_view(selected_output)
 
 
 def on_ten_bit_toggled(check_btn):
-    if selected_output_button:
-        selected_output_button.ten_bit = check_btn.get_active()
+    if selected_output and not form_silent:
+        selected_output.ten_bit = check_btn.get_active()
 
 
 def on_dpms_toggled(widget):
-    if selected_output_button:
-        selected_output_button.dpms = widget.get_active()
+    if selected_output and not form_silent:
+        selected_output.dpms = widget.get_active()
 
 
 def on_use_desc_toggled(widget):
@@ -458,86 +629,143 @@ def on_use_desc_toggled(widget):
     save_json(config, os.path.join(config_dir, "config"))
 
 
+def on_auto_reflow_toggled(widget):
+    config["auto-reflow"] = widget.get_active()
+    save_json(config, os.path.join(config_dir, "config"))
+
+
 def on_adaptive_sync_toggled(widget):
-    if selected_output_button:
-        selected_output_button.adaptive_sync = widget.get_active()
+    if selected_output and not form_silent:
+        selected_output.adaptive_sync = widget.get_active()
 
 
 def on_custom_mode_toggle(widget):
-    if selected_output_button:
+    if selected_output and not form_silent:
         outputs = set(config["custom-mode"])
         turned_on = widget.get_active()
-        selected_output_button.custom_mode = turned_on
+        selected_output.custom_mode = turned_on
         if turned_on:
-            outputs.add(selected_output_button.name)
+            outputs.add(selected_output.name)
         else:
-            outputs.discard(selected_output_button.name)
+            outputs.discard(selected_output.name)
         config["custom-mode"] = tuple(outputs)
 
 
 def on_pos_x_changed(widget):
-    if selected_output_button:
-        selected_output_button.x = round(widget.get_value())
-        fixed.move(selected_output_button, selected_output_button.x * config["view-scale"],
-                   selected_output_button.y * config["view-scale"])
+    if selected_output and not form_silent:
+        selected_output.x = round(widget.get_value())
+        refresh_output_view(selected_output)
 
 
 def on_pos_y_changed(widget):
-    if selected_output_button:
-        selected_output_button.y = round(widget.get_value())
-        fixed.move(selected_output_button, selected_output_button.x * config["view-scale"],
-                   selected_output_button.y * config["view-scale"])
+    if selected_output and not form_silent:
+        selected_output.y = round(widget.get_value())
+        refresh_output_view(selected_output)
 
 
 def on_width_changed(widget):
-    if selected_output_button:
-        selected_output_button.physical_width = round(widget.get_value())
-        selected_output_button.rescale_transform()
+    if selected_output and not form_silent:
+        selected_output.physical_width = round(widget.get_value())
+        refresh_output_view(selected_output)
 
 
 def on_height_changed(widget):
-    if selected_output_button:
-        selected_output_button.physical_height = round(widget.get_value())
-        selected_output_button.rescale_transform()
+    if selected_output and not form_silent:
+        selected_output.physical_height = round(widget.get_value())
+        refresh_output_view(selected_output)
 
 
 def on_scale_changed(widget):
-    if selected_output_button:
-        selected_output_button.scale = widget.get_value()
-        selected_output_button.rescale_transform()
+    if selected_output and not form_silent:
+        value = widget.get_value()
+        if value == selected_output.scale:
+            return
+        if config["scale-snapping"]:
+            snapped = snap_scale(valid_scales_for(selected_output), value, previous=selected_output.scale)
+            if snapped != value:
+                # fires "value-changed" again, with the valid value
+                widget.set_value(snapped)
+                return
+        selected_output.scale = value
+        refresh_output_view(selected_output)
+
+
+def valid_scales_for(state):
+    size = (state.physical_width, state.physical_height)
+    if size not in scales:
+        # custom mode
+        scales[size] = valid_scales(*size)
+    return scales[size]
 
 
 def on_scale_filter_changed(widget):
-    if selected_output_button:
-        selected_output_button.scale_filter = widget.get_active_id()
+    if selected_output and not form_silent:
+        selected_output.scale_filter = widget.get_active_id()
 
 
 def on_refresh_changed(widget):
-    if selected_output_button:
-        selected_output_button.refresh = widget.get_value()
+    if selected_output and not form_silent:
+        selected_output.refresh = widget.get_value()
 
-        update_form_from_widget(selected_output_button)
+        update_form(selected_output)
 
 
 def on_mode_changed(widget):
-    if selected_output_button and not on_mode_changed_silent:
-        mode = selected_output_button.modes[widget.get_active()]
-        selected_output_button.physical_width = mode["width"]
-        selected_output_button.physical_height = mode["height"]
-        selected_output_button.refresh = mode["refresh"] / 1000
-        selected_output_button.rescale_transform()
+    if selected_output and not form_silent:
+        mode = selected_output.modes[widget.get_active()]
+        selected_output.physical_width = mode["width"]
+        selected_output.physical_height = mode["height"]
+        selected_output.refresh = mode["refresh"] / 1000
+        if config["scale-snapping"]:
+            selected_output.scale = snap_scale(valid_scales_for(selected_output), selected_output.scale)
+        refresh_output_view(selected_output)
 
-        update_form_from_widget(selected_output_button)
+        update_form(selected_output)
 
 
 def on_mirror_selected(widget):
-    if selected_output_button and widget.get_active_id() is not None:
-        selected_output_button.mirror = widget.get_active_id()
+    if selected_output and widget.get_active_id() is not None:
+        target = widget.get_active_id()
+        if target == selected_output.mirror:
+            # set by update_form
+            return
+        selected_output.mirror = target
+        if target in layout:
+            propose_common_mode(target)
+
+
+def propose_common_mode(target):
+    # Puts the target and all the outputs mirroring it on the best mode they all support
+    group = [layout[target]] + [state for state in layout if state.mirror == target]
+    modes = common_modes([state.modes for state in group])
+    names = ", ".join(state.name for state in group)
+    if not modes:
+        mirror_status[target] = voc["no-common-mode"].format(names)
+        update_form(selected_output)
+        return
+
+    width, height, refreshes = modes[0]
+    mirror_status[target] = voc["common-mode"].format(names, "{}x{}".format(width, height))
+    for state, refresh in zip(group, refreshes):
+        state.physical_width = width
+        state.physical_height = height
+        state.refresh = refresh / 1000
+        if config["scale-snapping"]:
+            state.scale = snap_scale(valid_scales_for(state), state.scale)
+        refresh_output_view(state)
+
+    update_form(selected_output)
 
 
 def on_apply_button(widget):
     global outputs_activity
-    apply_settings(display_buttons, outputs_activity, outputs_path, use_desc=config["use-desc"])
+    if view_cached:
+        return
+    try:
+        apply_settings(layout, outputs_activity, outputs_path, use_desc=config["use-desc"])
+    except IPCError as e:
+        eprint("Couldn't apply settings: {}".format(e))
+        notify("Output configuration", "Couldn't apply settings: {}".format(e))
     # save config file
     save_json(config, os.path.join(config_dir, "config"))
 
@@ -548,40 +776,255 @@ def on_output_toggled(check_btn, name):
 
 
 def on_toggle_button(btn):
-    i3 = Connection()
-    global outputs_activity
-    for key in outputs_activity:
-        toggle = "enable" if outputs_activity[key] else "disable"
-        cmd = "output {} {}".format(key, toggle)
-        i3.command(cmd)
+    global outputs_activity, applied_activity
+    if view_cached:
+        return
+    try:
+        i3 = Connection()
+        for key in outputs_activity:
+            toggle = "enable" if outputs_activity[key] else "disable"
+            cmd = "output {} {}".format(key, toggle)
+            i3.command(cmd)
+            applied_activity[key] = outputs_activity[key]
+    except IPCError as e:
+        eprint("Couldn't toggle outputs: {}".format(e))
+        notify("Output configuration", "Couldn't toggle outputs: {}".format(e))
 
     # If the output has just been turned back on, Gdk.Display.get_default() may need some time
-    GLib.timeout_add(1000, create_display_buttons)
+    refresh_when_ready([key for key in applied_activity if applied_activity[key]])
+
+
+def refresh_when_ready(expected):
+    # Rebuilds the view once the compositor and Gdk agree on the `expected` active outputs, or on the deadline
+    wait_for_outputs(expected, lambda ready: create_display_buttons(), deadline=config["ready-timeout"])
+
+
+def create_display_buttons(live_outputs=None, changes=None, cached=False):
+    """
+    Rebuilds the layout and its widgets from `live_outputs` if given, or from a fresh compositor query otherwise.
+    Outputs listed in `changes` are highlighted. With `cached`, `live_outputs` come from the outputs cache.
+    """
+    global selected_output, selection, layout
+    selected = selected_output.name if selected_output else None
+    selected_names = [s.name for s in selection]
+    destroy_output_widgets()
+
+    global outputs, snapshot, applied_activity
+    if live_outputs is None:
+        snapshot = OutputSnapshot(wlr=config["wlr-output-management"])
+        outputs = list_outputs(snapshot)
+        applied_activity = list_outputs_activity(snapshot)
+        save_outputs_cache(outputs, applied_activity, outputs_cache_path)
+    else:
+        outputs = live_outputs
+
+    layout = Layout.from_outputs(outputs, config["custom-mode"])
+    global applied_layout, scales
+    applied_layout = layout.copy()
+    set_view_cached(cached)
+    scales = scale_table(layout)
+    mirror_status.clear()
+    for state in layout:
+        if changes and state.name in changes:
+            state.changed = changes[state.name]
+
+        indicators[state.name] = Indicator(outputs[state.name]["monitor"], state.name,
+                                           round(state.physical_width * config["view-scale"]),
+                                           round(state.physical_height * config["view-scale"]),
+                                           config["indicator-timeout"])
+
+        if not canvas:
+            b = DisplayButton(state)
+            display_buttons[state.name] = b
+            fixed.put(b, round(state.x * config["view-scale"]), round(state.y * config["view-scale"]))
+
+    if canvas:
+        canvas.set_items(layout)
+    global adjacency
+    adjacency = Adjacency(layout)
+
+    # No indicator on refresh, they've just shown up on their own
+    selected_output = layout[selected] if selected in layout else next(iter(layout))
+    selection = [layout[name] for name in selected_names if name in layout]
+    select_output(selected_output, keep_group=True)
+
+    global refresh_count
+    refresh_count += 1
+    if show_stats:
+        print_stats()
+    if metrics.enabled():
+        update_metrics()
+
+
+def output_identities():
+    # Built once per snapshot; outputs drawn from the cache have no snapshot until the compositor answers
+    global snapshot
+    if snapshot is None:
+        snapshot = OutputSnapshot()
+    return snapshot.identities()
+
+
+def destroy_output_widgets():
+    # Everything created per output on refresh is owned here, and must go before the next refresh
+    global display_buttons, indicators
+    for item in display_buttons.values():
+        item.destroy()
+    for item in indicators.values():
+        item.destroy()
+    display_buttons = {}
+    indicators = {}
 
 
-def create_display_buttons():
-    global display_buttons
-    for item in display_buttons:
-        item.destroy()
-    display_buttons = []
+def count_widgets(widget):
+    n = 1
+    if isinstance(widget, Gtk.Container):
+        for child in widget.get_children():
+            n += count_widgets(child)
+    return n
+
+
+def widget_stats():
+    toplevels = Gtk.Window.list_toplevels()
+    return {"toplevels": len(toplevels),
+            "widgets": sum(count_widgets(w) for w in toplevels),
+            "indicators": len(indicators),
+            "timers": sum(1 for item in indicators.values() if item.src_id)}
 
-    global outputs
-    outputs = list_outputs()
-    for key in outputs:
-        item = outputs[key]
-        custom_mode = key in config["custom-mode"]
-        b = DisplayButton(key, item["description"], item["x"], item["y"], round(item["physical-width"]),
-                          round(item["physical-height"]),
-                          item["transform"], item["scale"], item["scale_filter"], item["refresh"], item["modes"],
-                          item["active"], item["dpms"], item["adaptive_sync_status"], item["ten_bit"], custom_mode,
-                          item["focused"], item["monitor"], mirror=item["mirror"])
 
-        display_buttons.append(b)
+def print_stats():
+    stats = widget_stats()
+    eprint("[stats] refreshes: {}, toplevel windows: {}, widgets: {}, indicators: {} ({} timers pending), "
+           "outputs: {}, RSS: {} KiB, IPC queries: {}".format(refresh_count, stats["toplevels"], stats["widgets"],
+                                                               stats["indicators"], stats["timers"], len(layout),
+                                                               rss_kib(), snapshot.queries if snapshot else 0))
 
-        fixed.put(b, round(item["x"] * config["view-scale"]), round(item["y"] * config["view-scale"]))
 
-    display_buttons[0].select()
-    update_form_from_widget(display_buttons[0])
+def update_metrics():
+    # Gtk is not thread-safe: widgets are counted here, on the main loop, rather than on every scrape
+    stats = widget_stats()
+    metrics.inc("nwg_displays_refreshes_total")
+    metrics.set_gauge("nwg_displays_outputs", len(layout))
+    metrics.set_gauge("nwg_displays_widgets", stats["widgets"])
+    metrics.set_gauge("nwg_displays_indicators", stats["indicators"])
+
+
+def revalidate_outputs():
+    # Runs in a thread: compositor IPC only. Gdk & Gtk stuff is left for `merge_live_outputs` on the main loop.
+    try:
+        snap = OutputSnapshot(wlr=config["wlr-output-management"])
+        live = query_outputs(snap)
+        activity = list_outputs_activity(snap)
+    except Exception as e:
+        eprint("Couldn't query outputs: {}".format(e))
+        GLib.idle_add(on_revalidate_failed, str(e))
+        return
+    GLib.idle_add(merge_live_outputs, snap, live, activity)
+
+
+def on_revalidate_failed(error):
+    # The view stays on the cached outputs, with Apply off, until a retry gets through
+    if not view_cached:
+        return False
+    notify("Output configuration", voc["outputs-unknown"].format(error))
+    if form_apply:
+        form_apply.set_tooltip_text(voc["outputs-unknown"].format(error))
+    GLib.timeout_add_seconds(5, start_revalidation)
+    return False
+
+
+def start_revalidation():
+    threading.Thread(target=revalidate_outputs, daemon=True).start()
+    return False
+
+
+def set_view_cached(cached):
+    """
+    Apply, Toggle and the live preview only send what differs from `applied_layout`: they are off while it comes
+    from the cache, and may not be what the compositor runs.
+    """
+    global view_cached
+    view_cached = cached
+    if form_apply:
+        form_apply.set_sensitive(not cached and bool((sway and sway_config_dir) or (hypr and hypr_config_dir)))
+        if cached:
+            form_apply.set_tooltip_text(voc["outputs-pending"])
+        elif form_apply.get_sensitive():
+            form_apply.set_tooltip_text(None)
+    if form_toggle:
+        form_toggle.set_sensitive(not cached)
+
+
+def merge_live_outputs(snap, live, activity):
+    global snapshot, outputs_activity, applied_activity
+    snapshot = snap
+    changes = outputs_diff(outputs, live)
+    for key in changes:
+        eprint("{} changed since cached: {}".format(key, ", ".join(changes[key])))
+
+    # The user may have edited the cached view while the query ran: the edits go on top of the live outputs
+    edits = pending_edits()
+    toggled = {key: value for key, value in outputs_activity.items() if applied_activity.get(key, value) != value}
+
+    assign_gdk_monitors(live)
+    # Rebuild even if nothing changed: cached outputs have no Gdk.Monitor to show indicators on
+    create_display_buttons(live, changes)
+    if edits:
+        carry_edits(edits)
+
+    applied_activity = dict(activity)
+    activity = dict(activity)
+    for key in toggled:
+        if key in activity:
+            activity[key] = toggled[key]
+    if activity != outputs_activity:
+        outputs_activity = activity
+        fill_activity_box()
+
+    save_outputs_cache(live, activity, outputs_cache_path)
+
+    return False
+
+
+def pending_edits():
+    # name: {field: value} of what the user changed since the last refresh or apply
+    edits = {}
+    if applied_layout is None:
+        return edits
+    for state in layout:
+        old = applied_layout.get(state.name)
+        if old is not None:
+            fields = [f for f in state.diff(old) if f not in ("name", "description")]
+            if fields:
+                edits[state.name] = {f: getattr(state, f) for f in fields}
+    return edits
+
+
+def carry_edits(edits):
+    for name, fields in edits.items():
+        if name in layout:
+            eprint("{}: keeping the edited {}".format(name, ", ".join(fields)))
+            for field, value in fields.items():
+                setattr(layout[name], field, value)
+    # All the edits at once, rather than one by one through refresh_output_view: nothing to reflow here
+    global adjacency
+    adjacency = Adjacency(layout)
+    invalidate_drag_index()
+    for state in layout:
+        if state.name in edits:
+            redraw_output(state)
+    update_form(selected_output)
+
+
+def fill_activity_box():
+    for child in activity_box.get_children():
+        child.destroy()
+    for key in outputs_activity:
+        cb = Gtk.CheckButton()
+        cb.set_label(key)
+        cb.set_active(outputs_activity[key])
+        cb.connect("toggled", on_output_toggled, key)
+        activity_box.pack_start(cb, False, False, 3)
+    activity_box.show_all()
 
 
 class Indicator(Gtk.Window):
@@ -589,6 +1032,7 @@ class Indicator(Gtk.Window):
         super().__init__()
         self.timeout = timeout
         self.monitor = monitor
+        self.src_id = 0  # pending hide timeout
         self.set_property("name", "indicator")
 
         GtkLayerShell.init_for_window(self)
@@ -610,10 +1054,21 @@ class Indicator(Gtk.Window):
     def show_up(self, timeout=None):
         if self.timeout > 0 and self.monitor:
             self.show_all()
-            if timeout:
-                GLib.timeout_add(timeout, self.hide)
-            else:
-                GLib.timeout_add(self.timeout, self.hide)
+            if self.src_id:
+                GLib.source_remove(self.src_id)
+            self.src_id = GLib.timeout_add(timeout if timeout else self.timeout, self.on_timeout)
+
+    def on_timeout(self):
+        self.src_id = 0
+        self.hide()
+        return False
+
+    def destroy(self):
+        # The pending timeout would keep a reference to us, and fire on a destroyed window
+        if self.src_id:
+            GLib.source_remove(self.src_id)
+            self.src_id = 0
+        super().destroy()
 
 
 def handle_keyboard(window, event):
@@ -622,61 +1077,9 @@ def handle_keyboard(window, event):
 
 
 def create_workspaces_window(btn):
-    global sway_config_dir
     global workspaces
     workspaces = load_workspaces(os.path.join(sway_config_dir, "workspaces"), use_desc=config["use-desc"])
-    old_workspaces = workspaces.copy()
-    global dialog_win
-    if dialog_win:
-        dialog_win.destroy()
-    dialog_win = Gtk.Window()
-    dialog_win.set_resizable(False)
-    dialog_win.set_modal(True)
-    dialog_win.connect("key-release-event", handle_keyboard)
-    grid = Gtk.Grid()
-    for prop in ["margin_start", "margin_end", "margin_top", "margin_bottom"]:
-        grid.set_property(prop, 10)
-    grid.set_column_spacing(12)
-    grid.set_row_spacing(12)
-    dialog_win.add(grid)
-    global num_ws
-    global outputs
-    last_row = 0
-    for i in range(num_ws):
-        lbl = Gtk.Label()
-        lbl.set_text("workspace {} output ".format(i + 1))
-        grid.attach(lbl, 0, i, 1, 1)
-        combo = Gtk.ComboBoxText()
-        for key in outputs:
-            if not config["use-desc"]:
-                combo.append(key, key)
-            else:
-                desc = "{}".format(outputs[key]["description"])
-                combo.append(desc, desc)
-            if i + 1 in workspaces:
-                combo.set_active_id(workspaces[i + 1])
-            combo.connect("changed", on_ws_combo_changed, i + 1)
-        grid.attach(combo, 1, i, 1, 1)
-        last_row = i
-
-    box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-    grid.attach(box, 0, last_row + 1, 2, 1)
-
-    btn_apply = Gtk.Button()
-    btn_apply.set_label(voc["apply"])
-    if sway_config_dir:
-        btn_apply.connect("clicked", on_workspaces_apply_btn, dialog_win, old_workspaces)
-    else:
-        btn_apply.set_sensitive(False)
-        btn_apply.set_tooltip_text("Config dir not found")
-    box.pack_end(btn_apply, False, False, 0)
-
-    btn_close = Gtk.Button()
-    btn_close.set_label(voc["close"])
-    btn_close.connect("clicked", close_dialog, dialog_win)
-    box.pack_end(btn_close, False, False, 6)
-
-    dialog_win.show_all()
+    create_workspaces_editor("workspace {} output", on_workspaces_apply_btn, sway_config_dir)
 
 
 def create_workspaces_window_hypr(btn):
@@ -684,52 +1087,101 @@ def create_workspaces_window_hypr(btn):
     workspaces = load_workspaces_hypr(
         os.path.join(hypr_config_dir, "workspaces.conf"), num_ws=num_ws)
     eprint("WS->Mon:", workspaces)
+    if config["use-desc"]:
+        rule = "Workspace rule: <b>workspace={},monitor:desc:</b>"
+    else:
+        rule = "Workspace rule: <b>workspace={},monitor:</b>"
+    create_workspaces_editor(rule, on_workspaces_apply_btn_hypr, hypr_config_dir)
+
+
+def create_workspaces_editor(rule_markup, apply_handler, config_dir_found):
+    """
+    The workspace -> output list lives in a Gtk.ListStore, and all the rows share a single output model,
+    so opening the dialog costs the same for 10 and for 100 workspaces.
+    """
     old_workspaces = workspaces.copy()
     global dialog_win
     if dialog_win:
         dialog_win.destroy()
     dialog_win = Gtk.Window()
-    dialog_win.set_resizable(False)
     dialog_win.set_modal(True)
     dialog_win.connect("key-release-event", handle_keyboard)
     grid = Gtk.Grid()
     for prop in ["margin_start", "margin_end", "margin_top", "margin_bottom"]:
         grid.set_property(prop, 10)
     grid.set_column_spacing(12)
-    grid.set_row_spacing(6)
+    grid.set_row_spacing(12)
     dialog_win.add(grid)
-    global outputs
-    last_row = 0
-    for i in range(num_ws):
-        lbl = Gtk.Label()
-        if config["use-desc"]:
-            lbl.set_markup("Workspace rule: <b>workspace={},monitor:desc:</b>".format(i + 1))
-        else:
-            lbl.set_markup("Workspace rule: <b>workspace={},monitor:</b>".format(i + 1))
-        lbl.set_property("halign", Gtk.Align.END)
-        grid.attach(lbl, 0, i, 1, 1)
-        combo = Gtk.ComboBoxText()
-        for key in outputs:
-            if not config["use-desc"]:
-                combo.append(key, key)
-            else:
-                desc = "{}".format(outputs[key]["description"])
-                combo.append(desc, desc)
-            if i + 1 in workspaces:
-                combo.set_active_id(workspaces[i + 1])
-            combo.connect("changed", on_ws_combo_changed, i + 1)
-
-        grid.attach(combo, 1, i, 1, 1)
 
-        last_row += 1
+    output_store = Gtk.ListStore(str)
+    ids = output_identities()
+    for key in outputs:
+        output_store.append([ids.config_name(key, config["use-desc"])])
+
+    # workspace number, rule markup, output
+    ws_store = Gtk.ListStore(int, str, str)
+    for i in range(1, num_ws + 1):
+        ws_store.append([i, rule_markup.format(i), workspaces[i] if i in workspaces else ""])
+
+    tree = Gtk.TreeView(model=ws_store)
+    renderer = Gtk.CellRendererText()
+    renderer.set_property("xalign", 1.0)
+    tree.append_column(Gtk.TreeViewColumn(voc["workspace"], renderer, markup=1))
+
+    renderer = Gtk.CellRendererCombo()
+    renderer.set_property("model", output_store)
+    renderer.set_property("text-column", 0)
+    renderer.set_property("has-entry", False)
+    renderer.set_property("editable", True)
+    renderer.connect("edited", on_ws_output_edited, ws_store)
+    tree.append_column(Gtk.TreeViewColumn(voc["output"], renderer, text=2))
+
+    scrolled = Gtk.ScrolledWindow()
+    scrolled.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+    scrolled.set_propagate_natural_width(True)
+    scrolled.set_propagate_natural_height(True)
+    scrolled.set_max_content_height(480)
+    scrolled.set_vexpand(True)
+    scrolled.add(tree)
+    grid.attach(scrolled, 0, 0, 2, 1)
+
+    # Bulk rules
+    rule_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+    grid.attach(rule_box, 0, 1, 2, 1)
+
+    rule_combo = Gtk.ComboBoxText()
+    for rule in ["range", "round-robin", "split-evenly"]:
+        rule_combo.append(rule, voc[rule])
+    rule_combo.set_active_id("range")
+    rule_box.pack_start(rule_combo, False, False, 0)
+
+    first_spin = Gtk.SpinButton.new_with_range(1, max_val(num_ws, 1), 1)
+    rule_box.pack_start(first_spin, False, False, 0)
+    rule_box.pack_start(Gtk.Label.new("-"), False, False, 0)
+    last_spin = Gtk.SpinButton.new_with_range(1, max_val(num_ws, 1), 1)
+    last_spin.set_value(num_ws)
+    rule_box.pack_start(last_spin, False, False, 0)
+
+    target_combo = Gtk.ComboBox.new_with_model(output_store)
+    cell = Gtk.CellRendererText()
+    target_combo.pack_start(cell, True)
+    target_combo.add_attribute(cell, "text", 0)
+    target_combo.set_active(0)
+    rule_box.pack_start(target_combo, True, True, 0)
+    rule_combo.connect("changed", lambda c: target_combo.set_sensitive(c.get_active_id() == "range"))
+
+    btn_assign = Gtk.Button.new_with_label(voc["assign"])
+    btn_assign.connect("clicked", on_ws_rule_assign, rule_combo, first_spin, last_spin, target_combo, ws_store,
+                       output_store)
+    rule_box.pack_start(btn_assign, False, False, 0)
 
     box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-    grid.attach(box, 0, last_row + 1, 2, 1)
+    grid.attach(box, 0, 2, 2, 1)
 
     btn_apply = Gtk.Button()
     btn_apply.set_label(voc["apply"])
-    if hypr_config_dir:
-        btn_apply.connect("clicked", on_workspaces_apply_btn_hypr, dialog_win, old_workspaces)
+    if config_dir_found:
+        btn_apply.connect("clicked", apply_handler, dialog_win, old_workspaces)
     else:
         btn_apply.set_sensitive(False)
         btn_apply.set_tooltip_text("Config dir not found")
@@ -743,9 +1195,37 @@ def create_workspaces_window_hypr(btn):
     dialog_win.show_all()
 
 
-def on_ws_combo_changed(combo, ws_num):
+def on_ws_output_edited(renderer, path, new_text, ws_store):
+    global workspaces
+    ws_store[path][2] = new_text
+    workspaces[ws_store[path][0]] = new_text
+
+
+def on_ws_rule_assign(btn, rule_combo, first_spin, last_spin, target_combo, ws_store, output_store):
+    first = first_spin.get_value_as_int()
+    last = last_spin.get_value_as_int()
+    if first > last:
+        first, last = last, first
+    names = [row[0] for row in output_store]
+    if not names:
+        return
+
+    rule = rule_combo.get_active_id()
+    if rule == "range":
+        itr = target_combo.get_active_iter()
+        if itr is None:
+            return
+        assignments = assign_workspaces_range(first, last, output_store[itr][0])
+    elif rule == "round-robin":
+        assignments = assign_workspaces_round_robin(first, last, names)
+    else:
+        assignments = assign_workspaces_split_evenly(first, last, names)
+
     global workspaces
-    workspaces[ws_num] = combo.get_active_id()
+    workspaces.update(assignments)
+    for row in ws_store:
+        if row[0] in assignments:
+            row[2] = assignments[row[0]]
 
 
 def close_dialog(w, win):
@@ -756,7 +1236,7 @@ def on_workspaces_apply_btn(w, win, old_workspaces):
     global workspaces
     if workspaces != old_workspaces:
         save_workspaces(workspaces, os.path.join(sway_config_dir, "workspaces"), use_desc=config["use-desc"])
-        notify("Workspaces assignment", "Restart sway for changes to take effect")
+        rehome_workspaces()
 
     close_dialog(w, win)
 
@@ -764,14 +1244,11 @@ def on_workspaces_apply_btn(w, win, old_workspaces):
 def on_workspaces_apply_btn_hypr(w, win, old_workspaces):
     global workspaces
     if workspaces != old_workspaces:
-        workspace_conf_file = workspaces_path
-        text_file = open(workspace_conf_file, "w")
-
         now = datetime.datetime.now()
         line = "# Generated by nwg-displays on {} at {}. Do not edit manually.\n".format(
             datetime.datetime.strftime(now, '%Y-%m-%d'),
             datetime.datetime.strftime(now, '%H:%M:%S'))
-        text_file.write(line + "\n")
+        lines = [line]
 
         monitors_with_default_workspace = []
         for ws in workspaces:
@@ -785,74 +1262,101 @@ def on_workspaces_apply_btn_hypr(w, win, old_workspaces):
                 line += ",default:true"
                 monitors_with_default_workspace.append(mon)
 
-            text_file.write(line + "\n")
+            lines.append(line)
 
-        text_file.close()
-        notify("Workspaces assignment", "Restart Hyprland for changes to take effect")
+        save_list_to_text_file(lines, workspaces_path)
+        rehome_workspaces()
 
     close_dialog(w, win)
 
 
-def apply_settings(display_buttons, outputs_activity, outputs_path, use_desc=False):
-    now = datetime.datetime.now()
-    lines = ["# Generated by nwg-displays on {} at {}. Do not edit manually.\n".format(
-        datetime.datetime.strftime(now, '%Y-%m-%d'),
-        datetime.datetime.strftime(now, '%H:%M:%S'))]
-    cmds = []
-    db_names = []
-    # just active outputs have their buttons
-    if os.getenv("SWAYSOCK"):
-        for db in display_buttons:
-            name = db.name if not use_desc else db.description
-            db_names.append(name)
-
-            lines.append('output "%s" {' % name)
-            cmd = 'output "{}"'.format(name)
-
-            custom_mode_str = "--custom" if db.custom_mode else ""
-            lines.append(
-                "    mode {} {}x{}@{}Hz".format(custom_mode_str, db.physical_width, db.physical_height, db.refresh))
-            cmd += " mode {} {}x{}@{}Hz".format(custom_mode_str, db.physical_width, db.physical_height, db.refresh)
-
-            lines.append("    pos {} {}".format(db.x, db.y))
-            cmd += " pos {} {}".format(db.x, db.y)
-
-            lines.append("    transform {}".format(db.transform))
-            cmd += " transform {}".format(db.transform)
-
-            lines.append("    scale {}".format(db.scale))
-            cmd += " scale {}".format(db.scale)
-
-            lines.append("    scale_filter {}".format(db.scale_filter))
-            cmd += " scale_filter {}".format(db.scale_filter)
-
-            a_s = "on" if db.adaptive_sync else "off"
-            lines.append("    adaptive_sync {}".format(a_s))
-            cmd += " adaptive_sync {}".format(a_s)
-
-            dpms = "on" if db.dpms else "off"
-            lines.append("    dpms {}".format(dpms))
-            cmd += " dpms {}".format(dpms)
-
-            lines.append("}")
-            cmds.append(cmd)
+def rehome_workspaces():
+    assignments = {}
+    for ws in workspaces:
+        if workspaces[ws]:
+            assignments[ws] = workspaces[ws]
+    try:
+        report = move_workspaces(assignments, use_desc=config["use-desc"])
+    except IPCError as e:
+        eprint("Couldn't move workspaces: {}".format(e))
+        notify("Workspaces assignment", "Couldn't move workspaces: {}".format(e))
+        return
+
+    failed = []
+    unknown = []
+    for ws in sorted(report):
+        success, message = report[ws]
+        eprint("workspace {} -> {}: {}".format(ws, assignments[ws], message))
+        if success is None:
+            unknown.append(str(ws))
+        elif not success:
+            failed.append("{} ({})".format(ws, message))
+
+    if failed:
+        notify("Workspaces assignment", "Failed to move workspaces: {}".format(", ".join(failed)))
+    elif unknown:
+        notify("Workspaces assignment", "Workspaces sent, but the compositor reply doesn't tell which moved: {}".format(
+            ", ".join(unknown)))
+    else:
+        notify("Workspaces assignment", "{} workspaces assigned".format(len(report)))
+
+
+@metrics.timed("nwg_displays_apply_duration_seconds", labelled=True)
+def apply_settings(layout, outputs_activity, outputs_path, use_desc=False):
+    """
+    Saves the whole layout to the outputs file, but only sends the compositor what differs from
+    `applied_layout`, so that moving one output doesn't reconfigure the others.
+    Returns "ok", "rejected", or "unknown" if the compositor didn't reply in time.
+    """
+    global applied_layout, applied_activity, rollback
+    result = "ok"
+    # The protocol has no notion of mirroring, and would round scales like 4/3: these go over IPC
+    atomic = config["wlr-output-management"] and not any(state.mirror or not scale_exact(state.scale)
+                                                         for state in layout)
+    if atomic:
+        # Nothing changes, the config file included, unless the compositor accepts the whole layout
+        success, message = wlr_apply_layout(layout, outputs_activity)
+        if success is None:
+            # Sent, but no word back: on, as far as we know, and revertible, like any other apply
+            apply_timed_out(message)
+            result = "unknown"
+        elif not success:
+            metrics.inc("nwg_displays_apply_rejected_total")
+            eprint("Output configuration rejected: {}".format(message))
+            notify("Output configuration", "Rejected by the compositor: {}".format(message))
+            return "rejected"
+
+    # The compositor replies to the commands once the outputs are set up, a modeset each at worst
+    patience = apply_timeout(0 if atomic else modesets(layout, outputs_activity, applied_layout, applied_activity))
 
-        if not use_desc:
-            for key in outputs_activity:
-                if key not in db_names:
-                    lines.append('output "{}" disable'.format(key))
-                    cmds.append('output "{}" disable'.format(key))
-        else:
-            for key in outputs_activity:
-                desc = inactive_output_description(key)
-                if desc not in db_names:
-                    lines.append('output "{}" disable'.format(desc))
-                    cmds.append('output "{}" disable'.format(desc))
+    if os.getenv("SWAYSOCK"):
+        lines, cmds = sway_config(layout, outputs_activity, baseline=applied_layout, use_desc=use_desc,
+                                  describe=output_identities().description,
+                                  only=UNSUPPORTED_PROPERTIES if atomic else None)
 
         print("[Saving]")
         for line in lines:
             print(line)
 
+        print("[Executing]")
+        for cmd in cmds:
+            print(cmd)
+
+        # Raises IPCError: the file is only saved once the compositor took the commands
+        if cmds:
+            try:
+                with ipc_patience(patience):
+                    i3 = Connection()
+                    i3.command("; ".join(cmds))
+            except IPCTimeout as e:
+                apply_timed_out(e)
+                result = "unknown"
+            except IPCError as e:
+                if not atomic:
+                    raise
+                # The layout is on already, and must stay revertible
+                eprint("Couldn't set {}: {}".format(", ".join(UNSUPPORTED_PROPERTIES), e))
+
         # Check if the outputs file exists
         if os.path.isfile(outputs_path):
             # Load a backup to restore settings if needed
@@ -861,51 +1365,58 @@ def apply_settings(display_buttons, outputs_activity, outputs_path, use_desc=Fal
             backup = []
 
         save_list_to_text_file(lines, outputs_path)
-
-        print("[Executing]")
-        for cmd in cmds:
-            print(cmd)
-
-        i3 = Connection()
-        for cmd in cmds:
-            i3.command(cmd)
+        rollback = (applied_layout, dict(applied_activity))
+        applied_layout = layout.copy()
+        applied_activity = dict(outputs_activity)
+        preview_origin.clear()
 
         create_confirm_win(backup, outputs_path)
 
     elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
-        transforms = {"normal": 0, "90": 1, "180": 2, "270": 3, "flipped": 4, "flipped-90": 5, "flipped-180": 6,
-                      "flipped-270": 7}
-        for db in display_buttons:
-            name = db.name if not use_desc else "desc:{}".format(db.description.replace("#", "##"))
-            db_names.append(name)
-
-            line = "monitor={},{}x{}@{},{}x{},{}".format(name, db.physical_width, db.physical_height, db.refresh, db.x, db.y, db.scale)
-            if db.mirror:
-                line += ",mirror,{}".format(db.mirror)
-            if db.ten_bit:
-                line += ",bitdepth,10"
-
-            lines.append(line)
-            if db.transform != "normal":
-                lines.append("monitor={},transform,{}".format(name, transforms[db.transform]))
-
-            # avoid looking up the hardware name
-            if db.name in outputs_activity and not outputs_activity[db.name]:
-                lines.append("monitor={},disable".format(name))
-
-            cmd = "on" if db.dpms else "off"
-            hyprctl(f"dispatch dpms {cmd} {db.name}")
+        lines, cmds = hypr_config(layout, outputs_activity, baseline=applied_layout, use_desc=use_desc)
 
         print("[Saving]")
         for line in lines:
             print(line)
 
+        print("[Executing]")
+        for cmd in cmds:
+            print(cmd)
+
+        # Raises IPCError: the file is only saved once the compositor took the commands
+        if cmds:
+            try:
+                with ipc_patience(patience):
+                    hyprctl_batch(cmds)
+            except IPCTimeout as e:
+                apply_timed_out(e)
+                result = "unknown"
+            except IPCError as e:
+                if not atomic:
+                    raise
+                # The layout is on already, and must stay revertible
+                eprint("Couldn't set DPMS: {}".format(e))
+        rollback = (applied_layout, dict(applied_activity))
+        applied_layout = layout.copy()
+        applied_activity = dict(outputs_activity)
+        preview_origin.clear()
+
         backup = []
         if os.path.isfile(outputs_path):
             backup = load_text_file(outputs_path).splitlines()
         save_list_to_text_file(lines, outputs_path)
         create_confirm_win(backup, outputs_path)
 
+    return result
+
+
+def apply_timed_out(error):
+    # The compositor may still be at it: the apply goes on, saved and with the confirmation window, so that the
+    # layout can be rolled back if it did go through
+    eprint("No reply in time, the settings may have been applied: {}".format(error))
+    notify("Output configuration", "No reply from the compositor in time: check the outputs, keep or restore them")
+
+
 def create_confirm_win(backup, path):
     global confirm_win
     if confirm_win:
@@ -965,39 +1476,94 @@ def keep_current_settings(btn):
 
 
 def restore_old_settings(btn, backup, path):
+    """
+    Goes back to the layout from before the last apply: the old outputs file is written back, and the outputs
+    that differ from it are reconfigured in a single IPC request.
+    """
     print("Restoring old settings...")
+    global src_tag, applied_layout, applied_activity, outputs_activity, rollback
     if src_tag > 0:
         GLib.Source.remove(src_tag)
+        src_tag = 0
 
-    if os.getenv("SWAYSOCK"):
-        save_list_to_text_file(backup, path)
-
-        # Parse backup file back to commands and execute them
-        single_line = ""
-        # omit comments & empty lines
-        for line in backup:
-            if not line.startswith("#") and line:
-                single_line += line
-        # remove "{"
-        single_line = single_line.replace("{", "")
-        # convert multiple spaces into single
-        single_line = ' '.join(single_line.split())
-        cmds = single_line.split("}")
-        # execute line by line
-        i3 = Connection()
-        for cmd in cmds:
-            if cmd:
-                i3.command(cmd)
-
+    if rollback is None:
         confirm_win.close()
-        create_display_buttons()
+        return
+    previous, activity = rollback
+    rollback = None
+    trigger = "timeout" if btn is None else "restore"
+
+    # However stuck the compositor is, the file gets restored and the window goes away in time
+    n = modesets(previous, activity, applied_layout, applied_activity) if previous is not None else 0
+    restored = True
+    try:
+        with ipc_budget(ROLLBACK_BUDGET + MODESET_TIMEOUT * n), ipc_patience(apply_timeout(n)):
+            if previous is None:
+                # What ran before the apply is unknown too
+                raise IPCError("no layout to go back to")
+            if os.getenv("SWAYSOCK"):
+                lines, cmds = sway_config(previous, activity, baseline=applied_layout, use_desc=config["use-desc"],
+                                          describe=output_identities().description,
+                                          baseline_activity=applied_activity)
+                for cmd in cmds:
+                    print(cmd)
+                if cmds:
+                    i3 = Connection()
+                    i3.command("; ".join(cmds))
+
+            elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
+                lines, cmds = hypr_config(previous, activity, baseline=applied_layout, use_desc=config["use-desc"],
+                                          keywords=True, baseline_activity=applied_activity)
+                for cmd in cmds:
+                    print(cmd)
+                if cmds:
+                    hyprctl_batch(cmds)
+    except IPCTimeout as e:
+        # Some or all of the outputs may be restored: nothing is known until the refresh
+        eprint("No reply in time, the outputs may be partly restored: {}".format(e))
+        metrics.inc("nwg_displays_rollbacks_total", trigger=trigger, result="error")
+        restored = None
+    except IPCError as e:
+        eprint("Couldn't restore the outputs: {}; the config file will take effect on reload".format(e))
+        metrics.inc("nwg_displays_rollbacks_total", trigger=trigger, result="error")
+        restored = False
+    else:
+        metrics.inc("nwg_displays_rollbacks_total", trigger=trigger, result="ok")
+
+    if restored:
+        applied_layout = previous
+        applied_activity = dict(activity)
+    elif restored is None:
+        # Unknown: any apply until the refresh sends everything, and turns every output it keeps on
+        applied_layout = None
+        applied_activity = dict.fromkeys(activity, False)
+    if outputs_activity != activity:
+        outputs_activity = dict(activity)
+        fill_activity_box()
+    # The file as the user had it, not regenerated: it may hold more than we know about
+    save_list_to_text_file(backup, path)
+    confirm_win.close()
+    refresh_when_ready([key for key in activity if activity[key]])
 
-    elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
-        save_list_to_text_file(backup, path)
-        confirm_win.close()
-        # Don't execute any command here, just save the file and wait for Hyprland to notice and apply the change.
-        # Let's give it some time to do it before refreshing UI.
-        GLib.timeout_add(2000, create_display_buttons)
+
+def watch(as_json, once=False):
+    """
+    Prints a line per changed output to stdout: NDJSON records if `as_json`, or a short summary otherwise.
+    """
+
+    def on_outputs(old, new):
+        for record in output_records(old, new):
+            metrics.inc("nwg_displays_output_events_total", event=record["event"])
+            if as_json:
+                print(json.dumps(record, sort_keys=True), flush=True)
+            else:
+                changed = ": {}".format(", ".join(record["changed"])) if record["changed"] else ""
+                print("{} {}{}".format(record["name"], record["event"], changed), flush=True)
+
+    if once:
+        on_outputs({}, query_outputs())
+    else:
+        watch_outputs(on_outputs)
 
 
 def main():
@@ -1040,6 +1606,47 @@ def main():
                             default=10,
                             help="number of Workspaces in use, default: 10")
 
+    parser.add_argument("--watch",
+                        action="store_true",
+                        help="don't open the window, print output state changes as they happen")
+
+    parser.add_argument("--json",
+                        action="store_true",
+                        help="print output state as NDJSON records, one per output, and exit (or keep going with "
+                             "--watch)")
+
+    # Handled before the compositor check at the top of this module; here for --help only
+    parser.add_argument("--dry-run",
+                        nargs="+",
+                        metavar="SPEC",
+                        help="simulate applying layout spec files on a recorded outputs snapshot, print the result "
+                             "and exit; no compositor needed")
+
+    parser.add_argument("--record",
+                        type=str,
+                        metavar="FILE",
+                        help="save all the compositor IPC requests and replies to FILE (gzipped if *.gz), e.g. to "
+                             "attach to a bug report")
+
+    # Handled before the compositor check at the top of this module
+    parser.add_argument("--replay",
+                        type=str,
+                        metavar="FILE",
+                        help="serve the compositor IPC replies from a session saved with --record; no compositor "
+                             "needed")
+
+    parser.add_argument("--metrics",
+                        nargs="?",
+                        const="",
+                        metavar="SOCKET",
+                        help="serve metrics in the Prometheus text format on a Unix socket, default: "
+                             "{}".format(metrics.default_path()))
+
+    parser.add_argument("--stats",
+                        action="store_true",
+                        help="print widget counts, memory use and IPC queries to stderr after every refresh "
+                             "(debug)")
+
     parser.add_argument("-v",
                         "--version",
                         action="version",
@@ -1047,6 +1654,29 @@ def main():
                         help="display version information")
     args = parser.parse_args()
 
+    if args.record and not session.replaying():
+        try:
+            session.start_recording(args.record)
+        except OSError as e:
+            eprint("Couldn't start recording: {}".format(e))
+
+    if args.metrics is not None:
+        try:
+            metrics.start(args.metrics or metrics.default_path())
+            metrics.gauge_function("process_resident_memory_bytes", resident_memory_bytes)
+        except OSError as e:
+            eprint("Couldn't start the metrics endpoint: {}".format(e))
+
+    if args.watch or args.json:
+        try:
+            watch(args.json, once=not args.watch)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    global show_stats
+    show_stats = args.stats
+
     load_vocabulary()
 
     global outputs_path
@@ -1134,7 +1764,7 @@ def main():
                                                                                              "resources/style.css")))
 
     window.connect("key-release-event", handle_keyboard)
-    window.connect('destroy', Gtk.main_quit)
+    window.connect('destroy', quit_app)
 
     builder.get_object("lbl-modes").set_label("{}:".format(voc["modes"]))
     builder.get_object("lbl-position-x").set_label("{}:".format(voc["position-x"]))
@@ -1241,6 +1871,14 @@ def main():
     form_use_desc.set_tooltip_text("{}".format(voc["use-desc-tooltip"]))
     form_use_desc.connect("toggled", on_use_desc_toggled)
 
+    global form_auto_reflow
+    form_auto_reflow = Gtk.CheckButton.new_with_label(voc["auto-reflow"])
+    form_auto_reflow.set_tooltip_text(voc["auto-reflow-tooltip"])
+    form_auto_reflow.set_active(config["auto-reflow"])
+    form_auto_reflow.connect("toggled", on_auto_reflow_toggled)
+    form_use_desc.get_parent().pack_start(form_auto_reflow, False, True, 0)
+    form_auto_reflow.show()
+
     global form_transform
     form_transform = builder.get_object("transform")
     form_transform.set_tooltip_text(voc["transform-tooltip"])
@@ -1261,7 +1899,7 @@ def main():
     global form_close
     form_close = builder.get_object("close")
     form_close.set_label(voc["close"])
-    form_close.connect("clicked", Gtk.main_quit)
+    form_close.connect("clicked", quit_app)
     form_close.grab_focus()
 
     global form_apply
@@ -1282,26 +1920,48 @@ def main():
 
     global fixed
     fixed = builder.get_object("fixed")
+    if config["canvas-renderer"]:
+        # pycairo is only needed for the canvas
+        try:
+            from nwg_displays.canvas import LayoutCanvas
+        except ImportError as e:
+            eprint("Canvas renderer unavailable, falling back to buttons: {}".format(e))
+        else:
+            global canvas
+            canvas = LayoutCanvas(config["view-scale"], select_output, on_canvas_drag, on_band=select_outputs,
+                                  on_drop=lambda item: end_preview())
+            wrapper.remove(fixed)
+            wrapper.pack_start(canvas, True, True, 0)
+
+    global outputs_activity, applied_activity
+    cached_outputs, cached_activity = load_outputs_cache(outputs_cache_path)
+    if cached_outputs:
+        # Draw the last known layout right away, and merge the live one in when it arrives
+        outputs_activity = cached_activity
+        applied_activity = dict(cached_activity)
+        create_display_buttons(cached_outputs, cached=True)
+        start_revalidation()
+    else:
+        create_display_buttons()
+        outputs_activity = list_outputs_activity(snapshot)
+        applied_activity = dict(outputs_activity)
 
-    create_display_buttons()
-
-    global outputs_activity
-    outputs_activity = list_outputs_activity()
     lbl = Gtk.Label()
     lbl.set_text("{}:".format(voc["active"]))
     form_wrapper_box.pack_start(lbl, False, False, 3)
-    for key in outputs_activity:
-        cb = Gtk.CheckButton()
-        cb.set_label(key)
-        cb.set_active(outputs_activity[key])
-        cb.connect("toggled", on_output_toggled, key)
-        form_wrapper_box.pack_start(cb, False, False, 3)
+    global activity_box
+    activity_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+    form_wrapper_box.pack_start(activity_box, False, False, 0)
+    fill_activity_box()
 
     btn = Gtk.Button.new_with_label(voc["toggle"])
     if sway:
         btn.set_tooltip_text(voc["toggle-tooltip"])
         btn.connect("clicked", on_toggle_button)
         form_wrapper_box.pack_start(btn, False, False, 3)
+        global form_toggle
+        form_toggle = btn
+        form_toggle.set_sensitive(not view_cached)
     else:
         btn.destroy()
 
@@ -1323,9 +1983,8 @@ def main():
         form_mirror.connect("changed", on_mirror_selected)
         grid.attach(form_mirror, 7, 4, 1, 1)
 
-    if display_buttons:
-        update_form_from_widget(display_buttons[0])
-        display_buttons[0].select()
+    if selected_output:
+        update_form(selected_output)
 
     screen = Gdk.Screen.get_default()
     provider = Gtk.CssProvider()
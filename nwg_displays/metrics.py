@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+Opt-in metrics for long-running modes: `nwg-displays --metrics [SOCKET]` serves counters, gauges and histograms in
+the Prometheus text format on a local Unix socket. Answers plain HTTP too, e.g.:
+
+    curl --unix-socket $XDG_RUNTIME_DIR/nwg-displays-metrics.sock http://localhost/metrics
+
+With no --metrics, recording a value returns at once: the call sites cost next to nothing.
+"""
+
+import atexit
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from functools import wraps
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "nwg_displays_ipc_requests_total":
+        ("counter", "Compositor IPC requests, by result.", None),
+    "nwg_displays_ipc_request_duration_seconds":
+        ("histogram", "Compositor IPC round trip time, retries included.", LATENCY_BUCKETS),
+    "nwg_displays_ipc_sent_bytes_total":
+        ("counter", "Compositor IPC request payload bytes.", None),
+    "nwg_displays_ipc_received_bytes_total":
+        ("counter", "Compositor IPC reply payload bytes.", None),
+    "nwg_displays_apply_duration_seconds":
+        ("histogram", "Time to save and send a layout on Apply, by result: ok, rejected, unknown (no reply in time) "
+                      "or error.", LATENCY_BUCKETS),
+    "nwg_displays_apply_rejected_total":
+        ("counter", "Layouts the compositor refused in the wlr-output-management test.", None),
+    "nwg_displays_rollbacks_total":
+        ("counter", "Layouts rolled back, on the confirmation timeout or the Restore button, by result.", None),
+    "nwg_displays_outputs_settle_duration_seconds":
+        ("histogram", "Time from an output change until the compositor and GTK agree on the active outputs.",
+         LATENCY_BUCKETS),
+    "nwg_displays_output_events_total":
+        ("counter", "Output hotplug and state change events seen in watch mode.", None),
+    "nwg_displays_refreshes_total":
+        ("counter", "Output view rebuilds.", None),
+    "nwg_displays_outputs":
+        ("gauge", "Outputs in the edited layout.", None),
+    "nwg_displays_widgets":
+        ("gauge", "GTK widgets in all the toplevel windows.", None),
+    "nwg_displays_indicators":
+        ("gauge", "Output indicator windows.", None),
+    "process_resident_memory_bytes":
+        ("gauge", "Resident memory size in bytes.", None),
+}
+
+_lock = threading.Lock()  # values come from the main loop, the revalidation thread and the server
+_server = None
+_path = None
+_values = {}  # (name, labels): counter or gauge value, or [bucket counts, sum, count] of a histogram
+_functions = {}  # name: function returning the current gauge value, called on every scrape
+
+
+def enabled():
+    return _server is not None
+
+
+def default_path():
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, "nwg-displays-metrics.sock")
+
+
+def inc(name, value=1, **labels):
+    if _server is None:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] = _values.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    if _server is None:
+        return
+    with _lock:
+        _values[(name, tuple(sorted(labels.items())))] = value
+
+
+def gauge_function(name, function):
+    _functions[name] = function
+
+
+def observe(name, value, **labels):
+    if _server is None:
+        return
+    buckets = METRICS[name][2]
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        if key not in _values:
+            _values[key] = [[0] * len(buckets), 0, 0]
+        histogram = _values[key]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def timed(name, labelled=False):
+    """
+    Decorator: observes the call duration in the `name` histogram, with result="ok", or "error" if it raises.
+    With `labelled`, the function returns the result label itself, e.g. "rejected".
+    """
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _server is None:
+                return function(*args, **kwargs)
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except Exception:
+                observe(name, time.monotonic() - start, result="error")
+                raise
+            observe(name, time.monotonic() - start, result=result if labelled else "ok")
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ""
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        escaped.append("{}=\"{}\"".format(key, value))
+    return "{" + ",".join(escaped) + "}"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render():
+    """
+    Returns all the metrics as a Prometheus text format page.
+    """
+    values = {}
+    with _lock:
+        for (name, labels), value in _values.items():
+            if isinstance(value, list):
+                value = [list(value[0]), value[1], value[2]]
+            values.setdefault(name, []).append((labels, value))
+    for name, function in _functions.items():
+        try:
+            value = function()
+        except Exception:
+            value = None
+        if value is not None:
+            values[name] = [((), value)]
+
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        if name not in values:
+            continue
+        lines.append("# HELP {} {}".format(name, description))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in sorted(values[name]):
+            if kind == "histogram":
+                counts, total, count = value
+                for bound, n in zip(buckets, counts):
+                    lines.append("{}_bucket{} {}".format(name, format_labels(labels, [("le", bound)]), n))
+                lines.append("{}_bucket{} {}".format(name, format_labels(labels, [("le", "+Inf")]), count))
+                lines.append("{}_sum{} {}".format(name, format_labels(labels), format_value(total)))
+                lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+            else:
+                lines.append("{}{} {}".format(name, format_labels(labels), format_value(value)))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # HTTP clients send a request first, `socat - UNIX-CONNECT:...` and the like send nothing
+        self.request.settimeout(0.2)
+        try:
+            request = self.request.recv(4096)
+        except socket.timeout:
+            request = b""
+        body = render().encode("utf-8")
+        self.request.settimeout(2)
+        if request.startswith(b"GET") or request.startswith(b"HEAD"):
+            header = "HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n" \
+                     "Content-Length: {}\r\n\r\n".format(len(body)).encode("ascii")
+            body = header if request.startswith(b"HEAD") else header + body
+        try:
+            self.request.sendall(body)
+        except OSError:
+            # the client went away
+            pass
+
+
+def start(path):
+    """
+    Serves the metrics on the `path` Unix socket, in a daemon thread. Raises OSError if it can't.
+    """
+    global _server, _path
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError("{}: not a socket".format(path))
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            # left behind by an instance that didn't exit cleanly
+            os.unlink(path)
+        else:
+            raise OSError("{}: in use by another instance".format(path))
+        finally:
+            probe.close()
+
+    # Metrics are for the user only
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(path, MetricsHandler)
+    finally:
+        os.umask(umask)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _server = server
+    _path = path
+    atexit.register(stop)
+
+
+def stop():
+    global _server
+    if _server is None:
+        return
+    _server.shutdown()
+    _server.server_close()
+    _server = None
+    try:
+        os.unlink(_path)
+    except OSError:
+        pass
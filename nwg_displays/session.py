@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Recording and replay of compositor IPC sessions. With `--record FILE`, every sway and Hyprland request made through
+tools.py is saved with its raw reply; with `--replay FILE`, the replies are served from the file instead, with no
+compositor running. Turns field bug reports into reproducible test cases.
+
+The file is NDJSON, gzipped if the name ends with ".gz": a header line, and then a line per exchange.
+"""
+
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+SCHEMA = 1
+
+# Environment variables the compositor checks look at
+COMPOSITOR_ENV = {"sway": "SWAYSOCK", "hyprland": "HYPRLAND_INSTANCE_SIGNATURE"}
+
+_lock = threading.Lock()  # the outputs are revalidated in a thread
+_record_file = None
+_replies = None  # (ipc, request): [replies], while replaying
+
+
+class ReplayError(Exception):
+    pass
+
+
+def open_session_file(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def current_compositor():
+    for compositor, env in COMPOSITOR_ENV.items():
+        if os.getenv(env):
+            return compositor
+    return None
+
+
+def start_recording(path):
+    global _record_file
+    _record_file = open_session_file(path, "w")
+    header = {"schema": SCHEMA, "compositor": current_compositor(), "time": time.time()}
+    _record_file.write(json.dumps(header) + "\n")
+    _record_file.flush()
+
+
+def start_replay(path):
+    """
+    Loads the session, and sets the environment up as if its compositor was running. Returns the compositor name.
+    """
+    global _replies
+    _replies = {}
+    with open_session_file(path, "r") as f:
+        header = json.loads(f.readline())
+        if header.get("schema") != SCHEMA:
+            raise ReplayError("{}: unsupported session schema {}".format(path, header.get("schema")))
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                _replies.setdefault((item["ipc"], item["request"]), []).append(item["reply"])
+
+    compositor = header["compositor"]
+    for env in COMPOSITOR_ENV.values():
+        os.environ.pop(env, None)
+    if compositor in COMPOSITOR_ENV:
+        os.environ[COMPOSITOR_ENV[compositor]] = "replay"
+    return compositor
+
+
+def replaying():
+    return _replies is not None
+
+
+def exchange(ipc, request, send):
+    """
+    Returns the reply to `request`: from `send()`, recorded if recording, or from the session if replaying.
+    Replies to a repeated request are served in the recorded order, and the last one is repeated when they run out.
+    """
+    if _replies is not None:
+        with _lock:
+            replies = _replies.get((ipc, request))
+            if not replies:
+                if ipc == "sway" and request.startswith("0:") or ipc == "hyprland" and not request.startswith("j/"):
+                    # Commands that weren't recorded fail, like they would on a compositor that rejects them
+                    print("Not in the replayed session: {}".format(request), file=sys.stderr)
+                    if ipc == "sway":
+                        return json.dumps([{"success": False, "error": "not recorded"}])
+                    return "not recorded"
+                raise ReplayError("Not in the replayed session: {} {}".format(ipc, request))
+            return replies.pop(0) if len(replies) > 1 else replies[0]
+
+    reply = send()
+    if _record_file is not None:
+        with _lock:
+            _record_file.write(json.dumps({"ipc": ipc, "request": request, "reply": reply}) + "\n")
+            _record_file.flush()
+    return reply
@@ -3,16 +3,54 @@ import datetime
 import json
 import os
 import socket
-import subprocess
 import sys
+import threading
+import time
+from contextlib import contextmanager
 
 import gi
 
 gi.require_version('Gdk', '3.0')
-from gi.repository import Gdk
+from gi.repository import Gdk, Gio, GLib
+
+from nwg_displays import metrics, session, wlr
+from nwg_displays.edid import read_edids
+from nwg_displays.layout import is_rotated
 
 if os.getenv("SWAYSOCK"):
-    from i3ipc import Connection
+    from i3ipc import Connection as I3Connection, Event
+
+
+    class Connection(I3Connection):
+        """
+        i3ipc Connection whose requests go through the IPC session recorder / player, each with a deadline.
+        """
+
+        def __init__(self, *args, **kwargs):
+            self._args = args
+            self._kwargs = kwargs
+            if not session.replaying():
+                # Connecting is retried, and fails with IPCError, like the requests
+                ipc_call(lambda timeout: I3Connection.__init__(self, *args, **kwargs), "sway connect")
+
+        def _message(self, message_type, payload):
+            # Only commands (type 0) change anything, queries are safe to repeat
+            return ipc_request("sway", "{}:{}".format(message_type.value, payload),
+                               lambda timeout: self._send(message_type, payload, timeout),
+                               "sway {} '{}'".format(message_type.name, payload),
+                               idempotent=message_type.value != 0)
+
+        def _send(self, message_type, payload, timeout):
+            if self._cmd_socket is None:
+                I3Connection.__init__(self, *self._args, **self._kwargs)
+            self._cmd_socket.settimeout(timeout)
+            try:
+                return I3Connection._message(self, message_type, payload)
+            except OSError:
+                # The reply may still come, and would be taken for the next one: start over on a new socket
+                self._cmd_socket.close()
+                self._cmd_socket = None
+                raise
 
 
 def eprint(*args, **kwargs):
@@ -27,41 +65,305 @@ def get_config_home():
     return config_home
 
 
-def hyprctl(cmd):
+def get_cache_home():
+    xdg_cache_home = os.getenv('XDG_CACHE_HOME')
+    cache_home = xdg_cache_home if xdg_cache_home else os.path.join(
+        os.getenv("HOME"), ".cache")
+
+    return cache_home
+
+
+def hypr_socket_dir():
     # /tmp/hypr moved to $XDG_RUNTIME_DIR/hypr in #5788
     xdg_runtime_dir = os.getenv("XDG_RUNTIME_DIR")
     hypr_dir = f"{xdg_runtime_dir}/hypr" if xdg_runtime_dir and os.path.isdir(
         f"{xdg_runtime_dir}/hypr") else "/tmp/hypr"
 
-    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-    s.connect(f"{hypr_dir}/{os.getenv('HYPRLAND_INSTANCE_SIGNATURE')}/.socket.sock")
+    return f"{hypr_dir}/{os.getenv('HYPRLAND_INSTANCE_SIGNATURE')}"
+
+
+# Per request, in seconds; a stuck compositor must not hang us
+IPC_TIMEOUT = 2.0
+# Extra attempts for requests safe to repeat
+IPC_RETRIES = 2
 
-    s.send(cmd.encode("utf-8"))
-    output = s.recv(20480).decode('utf-8')
-    s.close()
+_budget = threading.local()
+
+
+class IPCError(Exception):
+    pass
+
+
+class IPCTimeout(IPCError):
+    # Sent, but no reply in time: a command may or may not have taken effect
+    pass
+
+
+@contextmanager
+def ipc_patience(seconds):
+    """
+    Lets each IPC request made in the block, on this thread, take up to `seconds` instead of IPC_TIMEOUT: the
+    compositor only replies to commands that change modes when it's done. See `apply_timeout()`.
+    """
+    previous = getattr(_budget, "timeout", None)
+    _budget.timeout = seconds
+    try:
+        yield
+    finally:
+        _budget.timeout = previous
 
-    return output
+
+def apply_timeout(modesets):
+    return IPC_TIMEOUT + wlr.MODESET_TIMEOUT * modesets
+
+
+@contextmanager
+def ipc_budget(seconds):
+    """
+    Limits the total time of all the IPC requests made in the block, on this thread, retries included.
+    """
+    previous = getattr(_budget, "deadline", None)
+    deadline = time.monotonic() + seconds
+    _budget.deadline = deadline if previous is None else min(previous, deadline)
+    try:
+        yield
+    finally:
+        _budget.deadline = previous
+
+
+def ipc_timeout(what):
+    # The time a single request may take: IPC_TIMEOUT or as set by `ipc_patience()`, less if the budget is running out
+    timeout = getattr(_budget, "timeout", None) or IPC_TIMEOUT
+    deadline = getattr(_budget, "deadline", None)
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise IPCError("{}: out of time".format(what))
+    return min(timeout, remaining)
+
+
+def ipc_call(send, what, idempotent=True):
+    """
+    Returns `send(timeout)`, retried up to IPC_RETRIES times with a short backoff, if `idempotent`. Requests that
+    change state are only retried if they couldn't be sent at all. Raises IPCError, or IPCTimeout if the last
+    attempt got no reply in time.
+    """
+    error = None
+    timed_out = False
+    for attempt in range(IPC_RETRIES + 1):
+        timeout = ipc_timeout(what)
+        try:
+            return send(timeout)
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            error = "can't connect: {}".format(e)
+            timed_out = False
+        except socket.timeout:
+            error = "no reply in {:.1f} s".format(timeout)
+            timed_out = True
+            if not idempotent:
+                break
+        except OSError as e:
+            error = str(e)
+            timed_out = False
+            if not idempotent:
+                break
+        if attempt < IPC_RETRIES:
+            time.sleep(min(0.05 * 2 ** attempt, ipc_timeout(what)))
+    raise (IPCTimeout if timed_out else IPCError)("{}: {}".format(what, error))
+
+
+def ipc_request(ipc, request, send, what, idempotent):
+    """
+    A compositor request: recorded or replayed, see session.py, sent by `ipc_call()`, and measured, if metrics
+    are on. Returns the reply, raises IPCError.
+    """
+
+    def call():
+        if not metrics.enabled():
+            return ipc_call(send, what, idempotent)
+        start = time.monotonic()
+        # sway requests are recorded as "type:payload"
+        payload = request.split(":", 1)[1] if ipc == "sway" else request
+        metrics.inc("nwg_displays_ipc_sent_bytes_total", len(payload.encode("utf-8")), compositor=ipc)
+        try:
+            reply = ipc_call(send, what, idempotent)
+        except IPCError:
+            metrics.inc("nwg_displays_ipc_requests_total", compositor=ipc, result="error")
+            raise
+        finally:
+            metrics.observe("nwg_displays_ipc_request_duration_seconds", time.monotonic() - start, compositor=ipc)
+        metrics.inc("nwg_displays_ipc_requests_total", compositor=ipc, result="ok")
+        metrics.inc("nwg_displays_ipc_received_bytes_total", len(reply.encode("utf-8")), compositor=ipc)
+        return reply
+
+    return session.exchange(ipc, request, call)
+
+
+def hyprctl(cmd):
+    # Queries start with "j/"; commands like "keyword" and "dispatch" are not repeated
+    return ipc_request("hyprland", cmd, lambda timeout: hyprctl_send(cmd, timeout), "hyprctl '{}'".format(cmd),
+                       idempotent=cmd.startswith("j/"))
+
+
+def hyprctl_send(cmd, timeout=IPC_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.settimeout(timeout)
+        s.connect(f"{hypr_socket_dir()}/.socket.sock")
+        s.sendall(cmd.encode("utf-8"))
+
+        # Hyprland closes the socket after the reply, which may take more than one read
+        chunks = []
+        while True:
+            s.settimeout(max(deadline - time.monotonic(), 0.001))
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        s.close()
+
+    return b"".join(chunks).decode('utf-8')
+
+
+def hyprctl_batch(cmds):
+    """
+    Sends `cmds` in a single [[BATCH]] request, returns a list of replies, one per command. Replies that can't
+    be told apart are None: which of the commands failed is unknown then.
+    """
+    output = hyprctl("[[BATCH]]" + ";".join(cmds))
+    replies = [r.strip() for r in output.split("\n\n") if r.strip()]
+    if len(replies) == len(cmds):
+        return replies
+    # Some Hyprland versions concatenate replies with no separator at all
+    if not output.replace("ok", "").strip():
+        return ["ok"] * len(cmds)
+    eprint("Can't match the batch reply to the commands: {}".format(output.strip()))
+    return [None] * len(cmds)
+
+
+# PATH value: names of the executables found there
+path_index = {}
 
 
 def is_command(cmd):
     cmd = cmd.split()[0]
-    cmd = "command -v {}".format(cmd)
-    try:
-        is_cmd = subprocess.check_output(
-            cmd, shell=True).decode("utf-8").strip()
-        if is_cmd:
-            return True
+    if os.sep in cmd:
+        return os.path.isfile(cmd) and os.access(cmd, os.X_OK)
+
+    path = os.getenv("PATH", "")
+    if path not in path_index:
+        found = set()
+        for directory in path.split(os.pathsep):
+            try:
+                for entry in os.scandir(directory):
+                    if entry.is_file() and os.access(entry.path, os.X_OK):
+                        found.add(entry.name)
+            except OSError:
+                pass
+        path_index[path] = found
+
+    return cmd in path_index[path]
+
+
+class OutputSnapshot:
+    """
+    Compositor state captured once per refresh. Each IPC endpoint is queried at most once, and then
+    served from memory to `list_outputs()`, `list_outputs_activity()` and anything else that needs it.
+    `queries` holds the number of round trips actually made. With `wlr`, the output heads and modes are also read
+    over wlr-output-management.
+    """
+
+    def __init__(self, wlr=False):
+        self.wlr = wlr
+        self.queries = 0
+        self._replies = {}
+        self._i3 = None
+        self._identities = None
+
+    def _get(self, key, fetch):
+        if key not in self._replies:
+            self._replies[key] = fetch()
+            self.queries += 1
+        return self._replies[key]
+
+    def connection(self):
+        if self._i3 is None:
+            self._i3 = Connection()
+        return self._i3
+
+    # sway
+    def tree(self):
+        return self._get("get_tree", lambda: self.connection().get_tree())
+
+    def outputs(self):
+        return self._get("get_outputs", lambda: self.connection().get_outputs())
+
+    # Hyprland: all monitors, including disabled ones (won't work w/ Hyprland <= 0.36.0)
+    def monitors(self):
+        return self._get("j/monitors all", lambda: json.loads(hyprctl("j/monitors all")))
+
+    # wlr-output-management: None if off, unavailable, or replaying a session, which has no Wayland traffic
+    def heads(self):
+        if not self.wlr or session.replaying():
+            return None
+        return self._get("wlr heads", wlr.query_heads)
+
+    def identities(self):
+        if self._identities is None:
+            self._identities = OutputIdentities(self)
+        return self._identities
+
+
+class OutputIdentities:
+    """
+    Connector name -> description of all the outputs, inactive ones included, built once from a snapshot.
+    """
+
+    def __init__(self, snapshot):
+        self._description = {}  # name: description
+
+        if os.getenv("SWAYSOCK"):
+            for o in snapshot.outputs():
+                self._description[o.name] = "{} {} {}".format(o.ipc_data["make"], o.ipc_data["model"],
+                                                              o.ipc_data["serial"])
+
+        elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
+            for m in snapshot.monitors():
+                self._description[m["name"]] = m["description"]
+
+    def description(self, name):
+        # An output the compositor didn't list goes by its connector name
+        return self._description.get(name) or name
+
+    def config_name(self, name, use_desc=False):
+        # How the output is referred to in config files and commands
+        return self.description(name) if use_desc else name
+
+
+def list_outputs(snapshot=None):
+    outputs_dict = query_outputs(snapshot)
+    assign_gdk_monitors(outputs_dict)
+
+    for key in outputs_dict:
+        eprint(key, outputs_dict[key])
+    return outputs_dict
 
-    except subprocess.CalledProcessError:
-        return False
 
+def query_outputs(snapshot=None):
+    """
+    Builds the outputs dictionary from compositor IPC alone, with "monitor" left None. Does not touch Gdk,
+    so it's safe to call from a background thread.
+    """
+    if snapshot is None:
+        snapshot = OutputSnapshot()
 
-def list_outputs():
     if os.getenv("SWAYSOCK"):
         outputs_dict = {}
         eprint("Running on sway")
-        i3 = Connection()
-        tree = i3.get_tree()
+        tree = snapshot.tree()
         for item in tree:
             if item.type == "output" and not item.name.startswith("__"):
                 outputs_dict[item.name] = {"x": item.rect.x,
@@ -87,21 +389,14 @@ def list_outputs():
                                                                            item.ipc_data["serial"])
                 outputs_dict[item.name]["focused"] = item.ipc_data["focused"]
 
+                # to identify Gdk.Monitor
+                outputs_dict[item.name]["model"] = item.ipc_data["model"]
+
                 outputs_dict[item.name]["mirror"] = ""  # We only use it on Hyprland
                 outputs_dict[item.name]["ten_bit"] = False  # We have no way to check it on sway
                 outputs_dict[item.name]["monitor"] = None
 
     elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
-        monitors_all = json.loads(hyprctl("j/monitors all"))
-        monitors = json.loads(hyprctl("j/monitors"))
-        active = []
-        for item in monitors:
-            active.append(item["name"])
-        outputs_dict = {}
-        for mon in monitors_all:
-            name = mon["name"]
-            outputs_dict[name] = {"active": True} if name in active else {"active": False}
-
         eprint("Running on Hyprland")
 
         # 1. Mirroring is impossible to check in any way. We need to parse back the monitors.conf file, and it sucks.
@@ -116,35 +411,35 @@ def list_outputs():
                         settings = line.split("=")[1].split(",")
                         mirrors[settings[0].strip()] = settings[-1].strip()
 
-        # 2. This won't work w/ Hyprland <= 0.36.0
-        output = hyprctl("j/monitors all")
-        monitors = json.loads(output)
+        # 2. A single `j/monitors all` query gives us everything, including the activity state.
         transforms = {0: "normal", 1: "90", 2: "180", 3: "270", 4: "flipped", 5: "flipped-90", 6: "flipped-180",
                       7: "flipped-270"}
-        for m in monitors:
-            outputs_dict[m["name"]]["mirror"] = mirrors[name] if name in mirrors else ""
+        outputs_dict = {}
+        for m in snapshot.monitors():
+            name = m["name"]
+            outputs_dict[name] = {"active": not m.get("disabled", False)}
+
+            outputs_dict[name]["mirror"] = mirrors[name] if name in mirrors else ""
 
-            outputs_dict[m["name"]]["scale_filter"] = None
-            outputs_dict[m["name"]]["modes"] = []
-            outputs_dict[m["name"]]["focused"] = m["focused"]
-            outputs_dict[m["name"]]["adaptive_sync_status"] = "enabled" if m["vrr"] else "disabled"
+            outputs_dict[name]["scale_filter"] = None
+            outputs_dict[name]["focused"] = m["focused"]
+            outputs_dict[name]["adaptive_sync_status"] = "enabled" if m["vrr"] else "disabled"
 
-            outputs_dict[m["name"]]["description"] = f'{m["description"]}'
-            outputs_dict[m["name"]]["x"] = int(m["x"])
-            outputs_dict[m["name"]]["y"] = int(m["y"])
+            outputs_dict[name]["description"] = f'{m["description"]}'
+            outputs_dict[name]["x"] = int(m["x"])
+            outputs_dict[name]["y"] = int(m["y"])
 
-            outputs_dict[m["name"]]["refresh"] = round(m["refreshRate"], 2)
+            outputs_dict[name]["refresh"] = round(m["refreshRate"], 2)
 
-            outputs_dict[m["name"]]["logical-width"] = m["width"] / m["scale"]
-            outputs_dict[m["name"]]["logical-height"] = m["height"] / m["scale"]
+            outputs_dict[name]["logical-width"] = m["width"] / m["scale"]
+            outputs_dict[name]["logical-height"] = m["height"] / m["scale"]
 
-            outputs_dict[m["name"]]["physical-width"] = m["width"]
-            outputs_dict[m["name"]]["physical-height"] = m["height"]
+            outputs_dict[name]["physical-width"] = m["width"]
+            outputs_dict[name]["physical-height"] = m["height"]
 
-            outputs_dict[m["name"]]["transform"] = transforms[m["transform"]]
-            outputs_dict[m["name"]]["scale"] = m["scale"]
-            outputs_dict[m["name"]]["focused"] = m["focused"]
-            outputs_dict[m["name"]]["dpms"] = m["dpmsStatus"]
+            outputs_dict[name]["transform"] = transforms[m["transform"]]
+            outputs_dict[name]["scale"] = m["scale"]
+            outputs_dict[name]["dpms"] = m["dpmsStatus"]
 
             outputs_dict[name]["modes"] = []
 
@@ -156,63 +451,252 @@ def list_outputs():
                     mode = {"width": int(w), "height": int(h), "refresh": float(r) * 1000}
                 except ValueError as e:
                     eprint(e)
-                outputs_dict[m["name"]]["modes"].append(mode)
+                    continue
+                outputs_dict[name]["modes"].append(mode)
 
-            outputs_dict[m["name"]]["ten_bit"] = True if m["currentFormat"] in ["XRGB2101010", "XBGR2101010"] else False
+            outputs_dict[name]["ten_bit"] = True if m["currentFormat"] in ["XRGB2101010", "XBGR2101010"] else False
 
             # to identify Gdk.Monitor
-            outputs_dict[m["name"]]["model"] = m["model"]
+            outputs_dict[name]["model"] = m["model"]
 
-            outputs_dict[m["name"]]["monitor"] = None
+            outputs_dict[name]["monitor"] = None
 
     else:
         eprint("This program only supports sway and Hyprland, and we seem to be elsewhere, terminating.")
         sys.exit(1)
 
+    # The protocol describes heads and modes the way the atomic apply sets them. The rest (which outputs to
+    # list, names, descriptions, DPMS, focus, scale, mirroring) stays compositor-specific: the fixed point scale
+    # would lose the exact fractional values, and descriptions differ in format from the IPC ones.
+    heads = snapshot.heads()
+    if heads:
+        for key in outputs_dict:
+            if key in heads:
+                outputs_dict[key].update(heads[key])
+
+    # Read straight from /sys/class/drm, DRM connector names are the output names on both compositors
+    edids = read_edids()
+    for key in outputs_dict:
+        outputs_dict[key]["edid"] = edids[key].to_dict() if key in edids else None
+
+    return outputs_dict
+
+
+def assign_gdk_monitors(outputs_dict):
     # We used to assign Gdk.Monitor to output on the basis of x and y coordinates, but it no longer works,
     # starting from gtk3-1:3.24.42: all monitors have x=0, y=0. This is most likely a bug, but from now on
-    # we must rely on gdk monitors order.
+    # we must rely on gdk monitors order, unless the model name (from EDID) identifies the monitor unambiguously.
     monitors = []
     display = Gdk.Display.get_default()
     for i in range(display.get_n_monitors()):
         monitor = display.get_monitor(i)
         monitors.append(monitor)
 
-    idx = 0
+    models = [m.get_model() for m in monitors]
+    output_models = [outputs_dict[key].get("model") for key in outputs_dict]
+    unassigned = list(range(len(monitors)))
     for key in outputs_dict:
-        try:
+        outputs_dict[key]["monitor"] = None
+        model = outputs_dict[key].get("model")
+        if model and models.count(model) == 1 and output_models.count(model) == 1:
+            idx = models.index(model)
             outputs_dict[key]["monitor"] = monitors[idx]
-        except IndexError:
-            print(f"Couldn't assign a Gdk.Monitor to {outputs_dict[key]}")
-        idx += 1
+            unassigned.remove(idx)
 
     for key in outputs_dict:
-        eprint(key, outputs_dict[key])
-    return outputs_dict
+        if outputs_dict[key]["monitor"] is None:
+            try:
+                outputs_dict[key]["monitor"] = monitors[unassigned.pop(0)]
+            except IndexError:
+                print(f"Couldn't assign a Gdk.Monitor to {outputs_dict[key]}")
+
 
+def list_outputs_activity(snapshot=None):
+    if snapshot is None:
+        snapshot = OutputSnapshot()
 
-def list_outputs_activity():
     result = {}
     if os.getenv("SWAYSOCK"):
-        i3 = Connection()
-        outputs = i3.get_outputs()
-        for o in outputs:
+        for o in snapshot.outputs():
             result[o.name] = o.active
 
     elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
-        monitors_all = json.loads(hyprctl("j/monitors all"))
-        monitors = json.loads(hyprctl("j/monitors"))
-        active = []
-        for item in monitors:
-            active.append(item["name"])
+        for mon in snapshot.monitors():
+            result[mon["name"]] = not mon.get("disabled", False)
+
+    return result
 
-        for mon in monitors_all:
-            name = mon["name"]
-            result[name] = True if name in active else False
 
+def save_outputs_cache(outputs_dict, activity, path):
+    data = {"outputs": {}, "activity": activity}
+    for key in outputs_dict:
+        data["outputs"][key] = {k: v for k, v in outputs_dict[key].items() if k != "monitor"}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save_json(data, path)
+    except Exception as e:
+        eprint("Couldn't save outputs cache: {}".format(e))
+
+
+def load_outputs_cache(path):
+    """
+    Returns (outputs, activity) as saved by `save_outputs_cache()`, or (None, None).
+    """
+    if not os.path.isfile(path):
+        return None, None
+    data = load_json(path)
+    if not data or not data.get("outputs") or "activity" not in data:
+        return None, None
+    for key in data["outputs"]:
+        data["outputs"][key]["monitor"] = None
+    return data["outputs"], data["activity"]
+
+
+def outputs_diff(old, new, ignored=("monitor", "focused")):
+    """
+    Returns {name: [changed keys]} for outputs that differ between two outputs dictionaries. Added and removed
+    outputs are listed with ["added"] and ["removed"].
+    """
+    result = {}
+    for key in new:
+        if key not in old:
+            result[key] = ["added"]
+            continue
+        changed = [k for k in new[key] if k not in ignored and old[key].get(k) != new[key][k]]
+        if changed:
+            result[key] = changed
+    for key in old:
+        if key not in new:
+            result[key] = ["removed"]
     return result
 
 
+# Bump on incompatible changes to the records below
+OUTPUT_RECORD_SCHEMA = 1
+
+# Hyprland socket2 events that may change the outputs state
+HYPR_OUTPUT_EVENTS = ["monitoradded", "monitoraddedv2", "monitorremoved", "monitorremovedv2", "focusedmon",
+                      "focusedmonv2", "configreloaded"]
+
+
+def output_records(old, new):
+    """
+    Returns a record for every output that differs between two `query_outputs()` dictionaries:
+    {"schema", "time", "event": "added" | "removed" | "changed", "name", "changed": [keys], "output": {...}}.
+    "output" is the outputs dictionary entry without the Gdk.Monitor, or None if removed.
+    """
+    records = []
+    now = round(time.time(), 3)
+    diff = outputs_diff(old, new, ignored=("monitor",))
+    for name in diff:
+        event = diff[name][0] if diff[name] in (["added"], ["removed"]) else "changed"
+        output = None
+        if event != "removed":
+            output = {k: v for k, v in new[name].items() if k != "monitor"}
+        records.append({"schema": OUTPUT_RECORD_SCHEMA,
+                        "time": now,
+                        "event": event,
+                        "name": name,
+                        "changed": diff[name] if event == "changed" else [],
+                        "output": output})
+    return records
+
+
+def watch_outputs(callback):
+    """
+    Calls `callback(old, new)` with `query_outputs()` dictionaries: once with old == {} on start, and then on
+    compositor events that may change the outputs state. Blocks.
+    """
+    outputs_dict = {}
+
+    def refresh(*args):
+        nonlocal outputs_dict
+        new = query_outputs()
+        callback(outputs_dict, new)
+        outputs_dict = new
+
+    refresh()
+    if session.replaying():
+        # No events recorded, the initial state is all there is
+        return
+
+    if os.getenv("SWAYSOCK"):
+        i3 = Connection()
+        i3.on(Event.OUTPUT, refresh)
+        i3.on(Event.WORKSPACE_FOCUS, refresh)
+        i3.main()
+
+    elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(f"{hypr_socket_dir()}/.socket2.sock")
+        with s.makefile("r", encoding="utf-8") as events:
+            for line in events:
+                if line.split(">>")[0] in HYPR_OUTPUT_EVENTS:
+                    refresh()
+
+
+def wait_for_outputs(expected, callback, deadline=3000):
+    """
+    Readiness barrier: calls `callback(True)` on the main loop as soon as the compositor reports the `expected`
+    output names as the active ones, and Gdk has as many monitors; `callback(False)` if it doesn't happen
+    within `deadline` ms. Checks on Gdk monitor changes, and polls the compositor with a growing interval.
+    """
+    display = Gdk.Display.get_default()
+    expected = set(expected)
+    start = time.monotonic()
+    handlers = []
+    src_id = 0
+    interval = 5  # ms, doubled on every poll up to 100
+    done = False
+
+    def ready():
+        if display.get_n_monitors() != len(expected):
+            return False
+        try:
+            activity = list_outputs_activity()
+        except IPCError as e:
+            eprint(e)
+            return False
+        return {name for name in activity if activity[name]} == expected
+
+    def finish(result):
+        nonlocal done
+        done = True
+        metrics.observe("nwg_displays_outputs_settle_duration_seconds", time.monotonic() - start,
+                        ready="true" if result else "false")
+        for handler in handlers:
+            display.disconnect(handler)
+        if src_id:
+            GLib.source_remove(src_id)
+        callback(result)
+
+    def check(*args):
+        nonlocal src_id, interval
+        if done:
+            return
+        if src_id:
+            GLib.source_remove(src_id)
+            src_id = 0
+        if ready():
+            finish(True)
+        elif (time.monotonic() - start) * 1000 >= deadline:
+            eprint("Outputs not ready after {} ms, expected: {}".format(deadline, sorted(expected)))
+            finish(False)
+        else:
+            src_id = GLib.timeout_add(interval, on_timeout)
+            interval = min(interval * 2, 100)
+
+    def on_timeout():
+        nonlocal src_id
+        src_id = 0
+        check()
+        return False
+
+    handlers.append(display.connect("monitor-added", check))
+    handlers.append(display.connect("monitor-removed", check))
+    check()
+
+
 def max_window_height():
     if os.getenv("SWAYSOCK"):
         i3 = Connection()
@@ -230,13 +714,31 @@ def scale_if_floating():
     pid = os.getpid()
     if os.getenv("SWAYSOCK"):
         i3 = Connection()
-        node = i3.get_tree().find_by_pid(pid)[0]
-        if node.type == "floating_con":
+        # A replayed tree may not hold our window
+        nodes = i3.get_tree().find_by_pid(pid)
+        if nodes and nodes[0].type == "floating_con":
             h = int(max_window_height())
             if h:
                 i3.command("resize set height {}".format(h))
 
 
+def rss_kib():
+    # Resident set size of this process, or None if unavailable
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def resident_memory_bytes():
+    kib = rss_kib()
+    return kib * 1024 if kib is not None else None
+
+
 def min_val(a, b):
     if b < a:
         return b
@@ -259,25 +761,62 @@ def round_to_nearest_multiple(i, m):
     return i / m * m
 
 
+def snap_edges(rects):
+    """
+    Lists the x and y edges of (x, y, width, height) `rects` to snap to, including 0.
+    """
+    snap_x, snap_y = [0], [0]
+    for x, y, w, h in rects:
+        for val in (x, x + w):
+            if val not in snap_x:
+                snap_x.append(val)
+        for val in (y, y + h):
+            if val not in snap_y:
+                snap_y.append(val)
+    return snap_x, snap_y
+
+
+def snap_position(x, y, width, height, snap_x, snap_y, threshold):
+    """
+    Returns x, y of a `width` x `height` rectangle moved to the edges from `snap_x` and `snap_y`,
+    if closer than `threshold`. Right and bottom edge matches take precedence.
+    """
+    snap_h, snap_v = None, None
+    for value in snap_x:
+        if abs(x - value) < threshold:
+            snap_h = value
+            break
+
+    for value in snap_x:
+        if abs(width + x - value) < threshold:
+            snap_h = value - width
+            break
+
+    for value in snap_y:
+        if abs(y - value) < threshold:
+            snap_v = value
+            break
+
+    for value in snap_y:
+        if abs(height + y - value) < threshold:
+            snap_v = value - height
+            break
+
+    # Just in case ;)
+    if snap_h and snap_h < 0:
+        snap_h = 0
+
+    if snap_v and snap_v < 0:
+        snap_v = 0
+
+    return x if snap_h is None else snap_h, y if snap_v is None else snap_v
+
+
 def orientation_changed(transform, transform_old):
     return (is_rotated(transform) and not is_rotated(transform_old)) or (
             is_rotated(transform_old) and not is_rotated(transform))
 
 
-def is_rotated(transform):
-    return "90" in transform or "270" in transform
-
-
-def inactive_output_description(name):
-    if os.getenv("SWAYSOCK"):
-        i3 = Connection()
-        for item in i3.get_outputs():
-            if item.name == name:
-                return "{} {} {}".format(item.ipc_data["make"], item.ipc_data["model"],
-                                         item.ipc_data["serial"])
-    return None
-
-
 def config_keys_missing(config, config_file):
     key_missing = False
     defaults = {"view-scale": 0.15,
@@ -285,7 +824,15 @@ def config_keys_missing(config, config_file):
                 "indicator-timeout": 500,
                 "custom-mode": [],
                 "use-desc": False,
-                "confirm-timeout": 10, }
+                "confirm-timeout": 10,
+                "canvas-renderer": False,
+                "scale-snapping": True,
+                "ready-timeout": 3000,
+                "wlr-output-management": False,
+                "live-preview": False,
+                "live-preview-rate": 20,
+                "collision-drag": False,
+                "auto-reflow": False, }
     for key in defaults:
         if key not in config:
             config[key] = defaults[key]
@@ -307,12 +854,24 @@ def load_json(path):
         return None
 
 
+def saving_allowed(path):
+    # Replaying a session must leave the user's files alone
+    if session.replaying():
+        eprint("Replaying a session, not saving {}".format(path))
+        return False
+    return True
+
+
 def save_json(src_dict, path):
+    if not saving_allowed(path):
+        return
     with open(path, 'w') as f:
         json.dump(src_dict, f, indent=2)
 
 
 def save_list_to_text_file(data, file_path):
+    if not saving_allowed(file_path):
+        return
     text_file = open(file_path, "w")
     for line in data:
         text_file.write(line + "\n")
@@ -320,7 +879,7 @@ def save_list_to_text_file(data, file_path):
 
 
 def create_empty_file(file_path):
-    if not os.path.isfile(file_path):
+    if not os.path.isfile(file_path) and not session.replaying():
         with open(file_path, "w") as file:
             pass
 
@@ -391,6 +950,8 @@ def load_workspaces_hypr(path, num_ws=0):
 
 
 def save_workspaces(data_dict, path, use_desc=False):
+    if not saving_allowed(path):
+        return
     text_file = open(path, "w")
     now = datetime.datetime.now()
     line = "# Generated by nwg-displays on {} at {}. Do not edit manually.\n".format(
@@ -406,9 +967,126 @@ def save_workspaces(data_dict, path, use_desc=False):
     text_file.close()
 
 
+def assign_workspaces_range(first, last, output):
+    return {num: output for num in range(first, last + 1)}
+
+
+def assign_workspaces_round_robin(first, last, outputs):
+    result = {}
+    for i, num in enumerate(range(first, last + 1)):
+        result[num] = outputs[i % len(outputs)]
+    return result
+
+
+def assign_workspaces_split_evenly(first, last, outputs):
+    # Contiguous blocks; if the workspaces don't divide evenly, the first outputs get one extra each.
+    nums = list(range(first, last + 1))
+    size, remainder = divmod(len(nums), len(outputs))
+    result = {}
+    start = 0
+    for i, output in enumerate(outputs):
+        end = start + size + (1 if i < remainder else 0)
+        for num in nums[start:end]:
+            result[num] = output
+        start = end
+    return result
+
+
+# Hyprland: workspace number -> the rule last set at runtime with `keyword workspace`
+workspace_rules = {}
+
+
+def move_workspaces(assignments, use_desc=False):
+    """
+    Registers the workspace -> output assignments at runtime, and moves the workspaces that already exist
+    to their outputs, all in one batched IPC request. Returns {workspace_num: (success, message)}, with success
+    None if the compositor reply doesn't tell.
+    """
+    cmds = []
+    owners = []  # workspace number each command belongs to
+    if os.getenv("SWAYSOCK"):
+        i3 = Connection()
+        existing = []
+        focused = None
+        for ws in i3.get_workspaces():
+            existing.append(ws.num)
+            if ws.focused:
+                focused = ws.name
+        for num in assignments:
+            target = '"{}"'.format(assignments[num])
+            cmds.append("workspace {} output {}".format(num, target))
+            owners.append(num)
+            if num in existing:
+                cmds.append("workspace number {}".format(num))
+                cmds.append("move workspace to output {}".format(target))
+                owners += [num, num]
+        if focused:
+            cmds.append('workspace "{}"'.format(focused))
+            owners.append(None)
+
+        replies = [(r.success, r.error if r.error else "ok") for r in i3.command("; ".join(cmds))] if cmds else []
+
+    elif os.getenv("HYPRLAND_INSTANCE_SIGNATURE"):
+        existing = [ws["id"] for ws in json.loads(hyprctl("j/workspaces"))]
+        rules = {}
+        for num in assignments:
+            monitor = "desc:{}".format(assignments[num]) if use_desc else assignments[num]
+            # Hyprland merges a rule into the one with the same workspace selector, so this replaces the rule set
+            # last time, rather than adding another. Same rules are not sent again.
+            rule = "{},monitor:{}".format(num, monitor)
+            if workspace_rules.get(num) != rule:
+                rules[num] = rule
+                cmds.append("keyword workspace {}".format(rule))
+                owners.append(num)
+            if num in existing:
+                cmds.append("dispatch moveworkspacetomonitor {} {}".format(num, monitor))
+                owners.append(num)
+
+        replies = [(r == "ok", r) if r is not None else (None, "unknown") for r in hyprctl_batch(cmds)] \
+            if cmds else []
+        for num, (success, message) in zip(owners, replies):
+            if not success:
+                # failed or unknown: sent again next time
+                rules.pop(num, None)
+        workspace_rules.update(rules)
+
+    else:
+        return {}
+
+    report = {}
+    for num, (success, message) in zip(owners, replies):
+        if num is None:
+            continue
+        if num not in report or report[num][0]:
+            report[num] = (success, message)
+    return report
+
+
 def notify(summary, body, timeout=3000):
-    cmd = "notify-send '{}' '{}' -i /usr/share/pixmaps/nwg-displays.svg -t {}".format(summary, body, timeout)
-    subprocess.call(cmd, shell=True)
+    """
+    Sends a desktop notification over D-Bus (org.freedesktop.Notifications). Asynchronous: returns immediately,
+    and the reply is handled on the main loop.
+    """
+    params = GLib.Variant("(susssasa{sv}i)", ("nwg-displays", 0, "/usr/share/pixmaps/nwg-displays.svg",
+                                              summary, body, [], {}, timeout))
+
+    def on_reply(connection, result):
+        try:
+            connection.call_finish(result)
+        except GLib.Error as e:
+            eprint("Couldn't send notification: {}".format(e.message))
+
+    def on_bus(source, result):
+        try:
+            bus = Gio.bus_get_finish(result)
+        except GLib.Error as e:
+            eprint("Couldn't connect to the session bus: {}".format(e.message))
+            return
+        bus.call("org.freedesktop.Notifications", "/org/freedesktop/Notifications",
+                 "org.freedesktop.Notifications", "Notify", params, GLib.VariantType("(u)"),
+                 Gio.DBusCallFlags.NONE, -1, None, on_reply)
+
+    Gio.bus_get(Gio.BusType.SESSION, None, on_bus)
 
 
 def get_shell_data_dir():
@@ -0,0 +1,411 @@
+#!/usr/bin/env python
+
+"""
+Minimal Wayland client for the wlr-output-management protocol (zwlr_output_manager_v1), implemented by sway and
+Hyprland. The whole layout goes in one output configuration: it's tested first, and applied atomically, in a single
+modeset, only if the compositor accepts it.
+
+Speaks the Wayland wire format over the socket directly: the protocol needs no file descriptors, and pywayland
+doesn't ship the wlr protocol bindings.
+"""
+
+import os
+import socket
+import struct
+import sys
+import time
+
+from nwg_displays.layout import HYPR_TRANSFORMS, REFRESH_TOLERANCE
+
+MANAGER_INTERFACE = "zwlr_output_manager_v1"
+MANAGER_VERSION = 4  # adaptive_sync
+TIMEOUT = 2  # seconds to wait for the compositor, per round: connection, test and apply
+MODESET_TIMEOUT = 2  # seconds more per output, for an apply that may change modes
+
+# wl_output.transform has the same values as the Hyprland transforms
+TRANSFORMS = HYPR_TRANSFORMS
+TRANSFORM_NAMES = {v: k for k, v in TRANSFORMS.items()}
+
+# sway output properties the protocol doesn't carry, to be sent as commands after the apply
+UNSUPPORTED_PROPERTIES = ("scale_filter", "dpms")
+
+DISPLAY_ID = 1
+
+# Opcodes
+DISPLAY_SYNC, DISPLAY_GET_REGISTRY = 0, 1
+DISPLAY_ERROR, DISPLAY_DELETE_ID = 0, 1
+REGISTRY_BIND = 0
+REGISTRY_GLOBAL = 0
+CALLBACK_DONE = 0
+MANAGER_CREATE_CONFIGURATION = 0
+MANAGER_HEAD, MANAGER_DONE, MANAGER_FINISHED = 0, 1, 2
+CONFIGURATION_ENABLE_HEAD, CONFIGURATION_DISABLE_HEAD, CONFIGURATION_APPLY, CONFIGURATION_TEST, \
+    CONFIGURATION_DESTROY = 0, 1, 2, 3, 4
+CONFIGURATION_SUCCEEDED, CONFIGURATION_FAILED, CONFIGURATION_CANCELLED = 0, 1, 2
+HEAD_SET_MODE, HEAD_SET_CUSTOM_MODE, HEAD_SET_POSITION, HEAD_SET_TRANSFORM, HEAD_SET_SCALE, \
+    HEAD_SET_ADAPTIVE_SYNC = 0, 1, 2, 3, 4, 5
+
+
+class WlrError(Exception):
+    pass
+
+
+def scale_exact(scale):
+    """
+    If the protocol can carry `scale` as it is: wl_fixed is 24.8 fixed point, so e.g. 4/3 would go as 1.332, and
+    the logical size come out fractional.
+    """
+    return float(scale) * 256 == round(float(scale) * 256)
+
+
+# What a failed connection, a timeout or malformed events may raise
+PROTOCOL_ERRORS = (OSError, WlrError, struct.error, ValueError, KeyError, IndexError)
+
+
+class Mode:
+    def __init__(self, mode_id):
+        self.id = mode_id
+        self.width = 0
+        self.height = 0
+        self.refresh = 0  # mHz
+        self.preferred = False
+
+
+class Head:
+    def __init__(self, head_id):
+        self.id = head_id
+        self.name = ""
+        self.description = ""
+        self.make = ""
+        self.model = ""
+        self.serial = ""
+        self.physical_size = (0, 0)  # mm
+        self.modes = []
+        self.enabled = False
+        self.current_mode = None
+        self.x = 0
+        self.y = 0
+        self.transform = "normal"
+        self.scale = 1.0
+        self.adaptive_sync = False
+
+
+def pack_args(*args):
+    """
+    Packs request arguments: int for int/uint/object/new_id, float for fixed, str for string.
+    """
+    data = b""
+    for arg in args:
+        if isinstance(arg, str):
+            s = arg.encode("utf-8") + b"\0"
+            data += struct.pack("=I", len(s)) + s + b"\0" * (-len(s) % 4)
+        elif isinstance(arg, float):
+            data += struct.pack("=i", round(arg * 256))
+        elif arg < 0:
+            data += struct.pack("=i", arg)
+        else:
+            data += struct.pack("=I", arg)
+    return data
+
+
+class Reader:
+    """
+    Reads event arguments in order.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def uint(self):
+        value = struct.unpack_from("=I", self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def int(self):
+        value = struct.unpack_from("=i", self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def fixed(self):
+        return self.int() / 256
+
+    def string(self):
+        length = self.uint()
+        value = self.data[self.pos:self.pos + length - 1].decode("utf-8", errors="replace") if length else ""
+        self.pos += length + (-length % 4)
+        return value
+
+
+class OutputManager:
+    """
+    Connects to the compositor, and keeps the output heads and modes up to date as it announces them.
+    """
+
+    def __init__(self, display=None):
+        display = display if display else os.getenv("WAYLAND_DISPLAY", "wayland-0")
+        path = display if display.startswith("/") else os.path.join(os.getenv("XDG_RUNTIME_DIR", "/tmp"), display)
+        self.deadline = time.monotonic() + TIMEOUT
+        self.buffer = b""
+        self.next_id = 2
+        self.objects = {DISPLAY_ID: ("wl_display", None)}  # id: (interface, Python object)
+        self.heads = {}  # id: Head
+        self.serial = None
+        self.manager_id = None
+        self.results = {}  # configuration id: "succeeded" | "failed" | "cancelled"
+        self.globals = {}  # interface: (name, version)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.connect(path)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def connect(self, path):
+        self.sock.settimeout(TIMEOUT)
+        self.sock.connect(path)
+        registry_id = self.new_object("wl_registry")
+        self.send(DISPLAY_ID, DISPLAY_GET_REGISTRY, registry_id)
+        self.roundtrip()
+        if MANAGER_INTERFACE not in self.globals:
+            raise WlrError("{} not supported by the compositor".format(MANAGER_INTERFACE))
+
+        name, version = self.globals[MANAGER_INTERFACE]
+        self.manager_id = self.new_object(MANAGER_INTERFACE)
+        self.send(registry_id, REGISTRY_BIND, name, MANAGER_INTERFACE, min(version, MANAGER_VERSION), self.manager_id)
+        # The initial state ends with the manager's `done`
+        while self.serial is None:
+            self.dispatch()
+
+    def close(self):
+        self.sock.close()
+
+    def new_object(self, interface, obj=None):
+        object_id = self.next_id
+        self.next_id += 1
+        self.objects[object_id] = (interface, obj)
+        return object_id
+
+    def send(self, object_id, opcode, *args):
+        payload = pack_args(*args)
+        self.sock.sendall(struct.pack("=II", object_id, (8 + len(payload)) << 16 | opcode) + payload)
+
+    def roundtrip(self):
+        callback_id = self.new_object("wl_callback")
+        self.send(DISPLAY_ID, DISPLAY_SYNC, callback_id)
+        while callback_id in self.objects:
+            self.dispatch()
+
+    def dispatch(self):
+        """
+        Reads and handles the events received, at least one. Raises socket.timeout if the compositor hangs, or
+        trickles events past the deadline of the round.
+        """
+        while len(self.buffer) < 8 or len(self.buffer) < struct.unpack_from("=I", self.buffer, 4)[0] >> 16:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("no reply in time")
+            self.sock.settimeout(remaining)
+            data = self.sock.recv(65536)
+            if not data:
+                raise WlrError("connection closed by the compositor")
+            self.buffer += data
+
+        while len(self.buffer) >= 8:
+            object_id, word = struct.unpack_from("=II", self.buffer)
+            size = word >> 16
+            if len(self.buffer) < size:
+                break
+            args = Reader(self.buffer[8:size])
+            self.buffer = self.buffer[size:]
+            self.handle(object_id, word & 0xffff, args)
+
+    def handle(self, object_id, opcode, args):
+        if object_id not in self.objects:
+            return  # destroyed already
+        interface, obj = self.objects[object_id]
+
+        if interface == "wl_display":
+            if opcode == DISPLAY_ERROR:
+                failed_id, code, message = args.uint(), args.uint(), args.string()
+                raise WlrError("protocol error {} on object {}: {}".format(code, failed_id, message))
+            if opcode == DISPLAY_DELETE_ID:
+                self.objects.pop(args.uint(), None)
+
+        elif interface == "wl_registry" and opcode == REGISTRY_GLOBAL:
+            name, global_interface, version = args.uint(), args.string(), args.uint()
+            self.globals[global_interface] = (name, version)
+
+        elif interface == "wl_callback" and opcode == CALLBACK_DONE:
+            del self.objects[object_id]
+
+        elif interface == MANAGER_INTERFACE:
+            if opcode == MANAGER_HEAD:
+                head = Head(args.uint())
+                self.heads[head.id] = head
+                self.objects[head.id] = ("zwlr_output_head_v1", head)
+            elif opcode == MANAGER_DONE:
+                self.serial = args.uint()
+            elif opcode == MANAGER_FINISHED:
+                raise WlrError("the output manager finished")
+
+        elif interface == "zwlr_output_head_v1":
+            self.handle_head(obj, opcode, args)
+
+        elif interface == "zwlr_output_mode_v1":
+            if opcode == 0:
+                obj.width, obj.height = args.int(), args.int()
+            elif opcode == 1:
+                obj.refresh = args.int()
+            elif opcode == 2:
+                obj.preferred = True
+            elif opcode == 3:
+                for head in self.heads.values():
+                    if obj in head.modes:
+                        head.modes.remove(obj)
+
+        elif interface == "zwlr_output_configuration_v1":
+            self.results[object_id] = ("succeeded", "failed", "cancelled")[opcode]
+
+    def handle_head(self, head, opcode, args):
+        if opcode == 0:
+            head.name = args.string()
+        elif opcode == 1:
+            head.description = args.string()
+        elif opcode == 2:
+            head.physical_size = (args.int(), args.int())
+        elif opcode == 3:
+            mode = Mode(args.uint())
+            head.modes.append(mode)
+            self.objects[mode.id] = ("zwlr_output_mode_v1", mode)
+        elif opcode == 4:
+            head.enabled = bool(args.int())
+        elif opcode == 5:
+            mode_id = args.uint()
+            head.current_mode = next((m for m in head.modes if m.id == mode_id), None)
+        elif opcode == 6:
+            head.x, head.y = args.int(), args.int()
+        elif opcode == 7:
+            head.transform = TRANSFORM_NAMES.get(args.int(), "normal")
+        elif opcode == 8:
+            head.scale = args.fixed()
+        elif opcode == 9:
+            self.heads.pop(head.id, None)
+        elif opcode == 10:
+            head.make = args.string()
+        elif opcode == 11:
+            head.model = args.string()
+        elif opcode == 12:
+            head.serial = args.string()
+        elif opcode == 13:
+            head.adaptive_sync = bool(args.uint())
+
+    def head(self, name):
+        return next((h for h in self.heads.values() if h.name == name), None)
+
+    def configure(self, layout, activity, test_only=False):
+        """
+        Sends the whole layout in one configuration, to test or apply. Heads the layout doesn't mention keep
+        their current state, unless turned off in `activity`. Returns "succeeded", "failed" or "cancelled"
+        (the outputs changed meanwhile).
+        """
+        # The compositor replies to an apply once done, after a modeset per output at worst
+        self.deadline = time.monotonic() + TIMEOUT + (0 if test_only else MODESET_TIMEOUT * len(self.heads))
+        config_id = self.new_object("zwlr_output_configuration_v1")
+        self.send(self.manager_id, MANAGER_CREATE_CONFIGURATION, config_id, self.serial)
+
+        for head in self.heads.values():
+            state = layout.get(head.name)
+            enabled = activity.get(head.name, head.enabled if state is None else True)
+            if not enabled:
+                self.send(config_id, CONFIGURATION_DISABLE_HEAD, head.id)
+                continue
+
+            config_head_id = self.new_object("zwlr_output_configuration_head_v1")
+            self.send(config_id, CONFIGURATION_ENABLE_HEAD, config_head_id, head.id)
+            if state is None:
+                if head.current_mode is not None:
+                    self.send(config_head_id, HEAD_SET_MODE, head.current_mode.id)
+                continue
+
+            mode = None
+            if not state.custom_mode:
+                for m in head.modes:
+                    if m.width == state.physical_width and m.height == state.physical_height and \
+                            abs(m.refresh - state.refresh * 1000) <= REFRESH_TOLERANCE:
+                        mode = m
+                        break
+            if mode is not None:
+                self.send(config_head_id, HEAD_SET_MODE, mode.id)
+            else:
+                self.send(config_head_id, HEAD_SET_CUSTOM_MODE, state.physical_width, state.physical_height,
+                          round(state.refresh * 1000))
+            self.send(config_head_id, HEAD_SET_POSITION, state.x, state.y)
+            self.send(config_head_id, HEAD_SET_TRANSFORM, TRANSFORMS[state.transform])
+            self.send(config_head_id, HEAD_SET_SCALE, float(state.scale))
+            if self.globals[MANAGER_INTERFACE][1] >= 4:
+                self.send(config_head_id, HEAD_SET_ADAPTIVE_SYNC, 1 if state.adaptive_sync else 0)
+
+        self.send(config_id, CONFIGURATION_TEST if test_only else CONFIGURATION_APPLY)
+        while config_id not in self.results:
+            self.dispatch()
+        self.send(config_id, CONFIGURATION_DESTROY)
+        return self.results.pop(config_id)
+
+
+def query_heads(display=None):
+    """
+    Returns {name: properties} of the heads, in the `query_outputs()` format: activity, position, current mode,
+    modes, transform and adaptive sync, as the protocol reports them. Disabled heads only carry their activity
+    and modes. Returns None if the protocol is unavailable.
+    """
+    try:
+        manager = OutputManager(display)
+    except PROTOCOL_ERRORS as e:
+        print("wlr-output-management unavailable: {}".format(e), file=sys.stderr)
+        return None
+    manager.close()
+
+    heads = {}
+    for head in manager.heads.values():
+        item = {"active": head.enabled,
+                "modes": [{"width": m.width, "height": m.height, "refresh": m.refresh} for m in head.modes]}
+        if head.enabled:
+            item["x"] = head.x
+            item["y"] = head.y
+            item["transform"] = head.transform
+            item["adaptive_sync_status"] = "enabled" if head.adaptive_sync else "disabled"
+            if head.current_mode is not None:
+                item["physical-width"] = head.current_mode.width
+                item["physical-height"] = head.current_mode.height
+                item["refresh"] = head.current_mode.refresh / 1000
+        heads[head.name] = item
+    return heads
+
+
+def apply_layout(layout, activity):
+    """
+    Tests the layout, and applies it only if the compositor accepts it as a whole. Returns (success, message),
+    never raises: a compositor that hangs, or speaks garbage, just fails the apply. Success is None if the apply was
+    sent, but got no reply in time: the layout may or may not be on. Scales must be `scale_exact()`.
+    """
+    try:
+        manager = OutputManager()
+    except PROTOCOL_ERRORS as e:
+        return False, str(e)
+
+    applying = False
+    try:
+        result = manager.configure(layout, activity, test_only=True)
+        if result == "succeeded":
+            applying = True
+            result = manager.configure(layout, activity)
+        if result == "succeeded":
+            return True, "ok"
+        return False, "configuration {}".format(result)
+    except socket.timeout as e:
+        return (None if applying else False), str(e)
+    except PROTOCOL_ERRORS as e:
+        return False, str(e)
+    finally:
+        manager.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+Writes the EDID fixtures of tests/test_edid.py into tests/fixtures/edid. Run again after changing them.
+"""
+
+import os
+import struct
+
+HEADER = b"\x00\xff\xff\xff\xff\xff\xff\x00"
+
+
+def pnp(vendor):
+    return struct.pack(">H", sum((ord(c) - ord("A") + 1) << shift for c, shift in zip(vendor, (10, 5, 0))))
+
+
+def detailed_timing(pixel_clock_khz, h_active, h_blank, v_active, v_blank, width_mm, height_mm):
+    d = bytearray(18)
+    d[0:2] = struct.pack("<H", pixel_clock_khz // 10)
+    d[2] = h_active & 0xff
+    d[3] = h_blank & 0xff
+    d[4] = (h_active >> 8) << 4 | h_blank >> 8
+    d[5] = v_active & 0xff
+    d[6] = v_blank & 0xff
+    d[7] = (v_active >> 8) << 4 | v_blank >> 8
+    d[12] = width_mm & 0xff
+    d[13] = height_mm & 0xff
+    d[14] = (width_mm >> 8) << 4 | height_mm >> 8
+    return bytes(d)
+
+
+def descriptor(tag, text=""):
+    data = text.encode("cp437")
+    if len(data) < 13:
+        data += b"\x0a" + b"\x20" * (12 - len(data))
+    return b"\x00\x00\x00" + bytes([tag]) + b"\x00" + data
+
+
+def checksum(block):
+    return block + bytes([(256 - sum(block) % 256) % 256])
+
+
+def base_block(vendor, product, serial_number, descriptors, extensions=0):
+    block = HEADER + pnp(vendor) + struct.pack("<HI", product, serial_number)
+    block += bytes([10, 2020 - 1990, 1, 4])  # week, year, version 1.4
+    block += bytes([0xa5, 53, 30, 0x78, 0x3a])  # digital input, 53x30 cm, gamma, features
+    block += bytes(10)  # chromaticity
+    block += bytes(3)  # established timings
+    block += b"\x01\x01" * 8  # standard timings: unused
+    for d in descriptors:
+        block += d
+    block += bytes([extensions])
+    return checksum(block)
+
+
+def cta_block(timings):
+    block = bytes([0x02, 0x03, 4, 0])
+    for t in timings:
+        block += t
+    block += bytes(127 - len(block))
+    return checksum(block)
+
+
+def main():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "edid")
+    os.makedirs(path, exist_ok=True)
+    fixtures = {}
+
+    # 1920x1080@60, serial and name in display descriptors
+    fixtures["dell.bin"] = base_block("DEL", 0xa0c4, 0x12345678, [
+        detailed_timing(148500, 1920, 280, 1080, 45, 527, 296),
+        descriptor(0xff, "ABC123"),
+        descriptor(0xfc, "DELL U2415"),
+        descriptor(0x10)])
+
+    # 2560x1440@60 preferred, 1280x720@60 in a CTA-861 extension, numeric serial only
+    fixtures["cta.bin"] = base_block("GSM", 0x5b09, 987654, [
+        detailed_timing(241500, 2560, 160, 1440, 41, 597, 336),
+        descriptor(0xfc, "LG ULTRAGEAR"),
+        descriptor(0x10),
+        descriptor(0x10)], extensions=1) + cta_block([detailed_timing(74250, 1280, 370, 720, 30, 597, 336)])
+
+    fixtures["truncated.bin"] = fixtures["dell.bin"][:100]
+
+    corrupt = bytearray(fixtures["dell.bin"])
+    corrupt[20] ^= 0xff
+    fixtures["bad-checksum.bin"] = bytes(corrupt)
+
+    for name, data in fixtures.items():
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    main()
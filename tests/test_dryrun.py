@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+Runs the offline layout simulator on the specs in tests/fixtures/dryrun.
+`python -m pytest tests` or `python tests/test_dryrun.py`.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nwg_displays import dryrun
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "dryrun")
+
+
+def run(*names):
+    """
+    Returns the exit code and the reports, by spec file name.
+    """
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        code = dryrun.main(["--dry-run"] + [os.path.join(FIXTURES, name) for name in names] + ["--json"])
+    reports = {}
+    for line in out.getvalue().splitlines():
+        report = json.loads(line)
+        reports[os.path.basename(report["spec"])] = report
+    return code, reports
+
+
+class DryRunTest(unittest.TestCase):
+    def test_scaled(self):
+        code, reports = run("scaled.json")
+        self.assertEqual(code, 0)
+        report = reports["scaled.json"]
+        self.assertEqual(report["errors"], [])
+        self.assertEqual(report["commands"], ['output "HDMI-A-1" scale 1.25'])
+        self.assertEqual((report["geometry"]["HDMI-A-1"]["width"], report["geometry"]["HDMI-A-1"]["height"]),
+                         (2048, 1152))
+        self.assertEqual(report["workspaces"], {"1": "DP-1", "2": "HDMI-A-1"})
+
+    def test_overlap(self):
+        code, reports = run("overlap.json")
+        self.assertEqual(code, 1)
+        self.assertEqual(reports["overlap.json"]["errors"], ["DP-1 overlaps HDMI-A-1"])
+
+    def test_bad_types(self):
+        # Reported per spec: the other specs still run
+        code, reports = run("bad-types.json", "scaled.json")
+        self.assertEqual(code, 1)
+        self.assertEqual(reports["bad-types.json"]["errors"], ['DP-1: scale must be int or float, not "1.5"',
+                                                               "DP-1: x must be int, not null",
+                                                               "HDMI-A-1: mode must be str, not 1080"])
+        self.assertEqual(reports["bad-types.json"]["commands"], [])
+        self.assertEqual(reports["scaled.json"]["errors"], [])
+
+    def test_malformed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "malformed.json")
+            with open(path, "w") as f:
+                json.dump({"snapshot": os.path.join(FIXTURES, "outputs-sway.json"), "outputs": ["DP-1"]}, f)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                code = dryrun.main(["--dry-run", path, "--json"])
+        self.assertEqual(code, 1)
+        self.assertTrue(json.loads(out.getvalue())["errors"][0].startswith("AttributeError"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Checks the EDID parser against the fixtures in tests/fixtures/edid, written by tests/fixtures/make_edid.py.
+`python -m pytest tests` or `python tests/test_edid.py`.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nwg_displays import edid
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "edid")
+
+
+def fixture(name):
+    return os.path.join(FIXTURES, name)
+
+
+def fixture_data(name):
+    with open(fixture(name), "rb") as f:
+        return f.read()
+
+
+class EdidTest(unittest.TestCase):
+    def test_identity(self):
+        e = edid.parse_edid(fixture_data("dell.bin"))
+        self.assertEqual((e.vendor, e.product_code, e.serial_number), ("DEL", 0xa0c4, 0x12345678))
+        self.assertEqual(e.serial, "ABC123")
+        self.assertEqual(e.identity(), "DEL A0C4 ABC123")
+        self.assertEqual((e.year, e.week, e.version), (2020, 10, "1.4"))
+        self.assertEqual((e.width_cm, e.height_cm), (53, 30))
+
+    def test_monitor_name(self):
+        self.assertEqual(edid.parse_edid(fixture_data("dell.bin")).name, "DELL U2415")
+        self.assertEqual(edid.parse_edid(fixture_data("cta.bin")).name, "LG ULTRAGEAR")
+
+    def test_numeric_serial(self):
+        # No serial string descriptor: the identity falls back to the base block serial number
+        e = edid.parse_edid(fixture_data("cta.bin"))
+        self.assertEqual(e.serial, "")
+        self.assertEqual(e.identity(), "GSM 5B09 987654")
+
+    def test_preferred_mode(self):
+        mode = edid.parse_edid(fixture_data("dell.bin")).preferred_mode()
+        self.assertEqual((mode["width"], mode["height"], mode["refresh"]), (1920, 1080, 60000))
+        self.assertEqual((mode["width-mm"], mode["height-mm"]), (527, 296))
+        self.assertFalse(mode["interlaced"])
+
+    def test_cta_extension(self):
+        e = edid.parse_edid(fixture_data("cta.bin"))
+        self.assertEqual([(t["width"], t["height"], t["refresh"]) for t in e.timings],
+                         [(2560, 1440, 59951), (1280, 720, 60000)])
+
+    def test_corrupt(self):
+        for name in ("truncated.bin", "bad-checksum.bin"):
+            with self.assertRaises(ValueError):
+                edid.parse_edid(fixture_data(name))
+            self.assertIsNone(edid.read_edid(fixture(name)))
+
+    def test_read_edids(self):
+        # A /sys/class/drm lookalike: a monitor, an empty connector and a corrupt EDID
+        with tempfile.TemporaryDirectory() as drm:
+            for connector, name in (("card1-DP-1", "dell.bin"), ("card1-HDMI-A-1", None),
+                                    ("card1-DP-2", "bad-checksum.bin")):
+                os.makedirs(os.path.join(drm, connector))
+                if name:
+                    shutil.copy(fixture(name), os.path.join(drm, connector, "edid"))
+                else:
+                    open(os.path.join(drm, connector, "edid"), "wb").close()
+
+            edids = edid.read_edids(drm)
+            self.assertEqual(list(edids), ["DP-1"])
+            self.assertEqual(edids["DP-1"].identity(), "DEL A0C4 ABC123")
+
+
+if __name__ == "__main__":
+    unittest.main()
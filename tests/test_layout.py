@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+
+"""
+Checks the GTK-free layout model: the diff-based apply commands, scales, mirroring modes, collisions and reflow.
+`python -m pytest tests` or `python tests/test_layout.py`.
+"""
+
+import os
+import sys
+import unittest
+from fractions import Fraction
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nwg_displays.layout import Adjacency, Layout, OutputState, RectIndex, common_modes, free_position, hypr_config, modesets, \
+    position_commands, scale_table, snap_scale, sway_config, valid_scales
+
+
+def output(name, x=0, y=0, size=(1920, 1080), transform="normal", scale=1.0, refresh=60.0, modes=(), active=True,
+           mirror=""):
+    width, height = size
+    return OutputState(name, "Maker {} serial".format(name), x, y, width, height, transform, scale, "linear", refresh,
+                       list(modes), active, True, False, False, mirror=mirror)
+
+
+def pair():
+    return Layout([output("DP-1"), output("HDMI-A-1", x=1920)])
+
+
+class SwayConfigTest(unittest.TestCase):
+    def test_unchanged(self):
+        layout = pair()
+        lines, cmds = sway_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=layout.copy())
+        self.assertEqual(cmds, [])
+        # the file always holds everything
+        self.assertIn("    pos 1920 0", lines)
+        self.assertIn("    mode  1920x1080@60.0Hz", lines)
+
+    def test_moved(self):
+        baseline = pair()
+        layout = baseline.copy()
+        layout["HDMI-A-1"].x = 2000
+        _, cmds = sway_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline)
+        self.assertEqual(cmds, ['output "HDMI-A-1" pos 2000 0'])
+
+    def test_no_baseline(self):
+        _, cmds = sway_config(pair(), {"DP-1": True, "HDMI-A-1": True})
+        self.assertEqual(len(cmds), 2)
+        self.assertTrue(cmds[0].startswith('output "DP-1" mode  1920x1080@60.0Hz pos 0 0 transform normal'))
+
+    def test_only(self):
+        baseline = pair()
+        layout = baseline.copy()
+        layout["HDMI-A-1"].x = 2000
+        layout["HDMI-A-1"].scale = 2.0
+        _, cmds = sway_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline, only=("pos",))
+        self.assertEqual(cmds, ['output "HDMI-A-1" pos 2000 0'])
+
+    def test_disable(self):
+        # An output turned off is left out of the layout, and disabled, but only if it was on
+        baseline = pair()
+        layout = Layout([baseline["DP-1"].copy()])
+        activity = {"DP-1": True, "HDMI-A-1": False}
+        lines, cmds = sway_config(layout, activity, baseline=baseline, describe=lambda name: name)
+        self.assertEqual(cmds, ['output "HDMI-A-1" disable'])
+        self.assertIn('output "HDMI-A-1" disable', lines)
+
+        _, cmds = sway_config(layout, activity, baseline=Layout([baseline["DP-1"].copy()]),
+                              describe=lambda name: name)
+        self.assertEqual(cmds, [])
+
+    def test_enable(self):
+        # An output off in the baseline comes back with all its properties, even if they didn't change
+        baseline = pair()
+        layout = baseline.copy()
+        _, cmds = sway_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline,
+                              baseline_activity={"DP-1": True, "HDMI-A-1": False})
+        self.assertEqual(len(cmds), 1)
+        self.assertTrue(cmds[0].startswith('output "HDMI-A-1" mode '))
+        self.assertIn(" pos 1920 0 ", cmds[0])
+        self.assertTrue(cmds[0].endswith(" enable"))
+
+    def test_use_desc(self):
+        baseline = pair()
+        layout = baseline.copy()
+        layout["DP-1"].y = 100
+        _, cmds = sway_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline, use_desc=True,
+                              describe=lambda name: baseline[name].description)
+        self.assertEqual(cmds, ['output "Maker DP-1 serial" pos 0 100'])
+
+
+class HyprConfigTest(unittest.TestCase):
+    def test_unchanged(self):
+        layout = pair()
+        lines, cmds = hypr_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=layout.copy(), keywords=True)
+        self.assertEqual(cmds, [])
+        self.assertIn("monitor=HDMI-A-1,1920x1080@60.0,1920x0,1.0", lines)
+
+    def test_moved(self):
+        baseline = pair()
+        layout = baseline.copy()
+        layout["HDMI-A-1"].x = 2000
+        _, cmds = hypr_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline, keywords=True)
+        self.assertEqual(cmds, ["keyword monitor HDMI-A-1,1920x1080@60.0,2000x0,1.0"])
+
+    def test_without_keywords(self):
+        # Hyprland picks the file up on its own: only DPMS changes are sent
+        baseline = pair()
+        layout = baseline.copy()
+        layout["HDMI-A-1"].x = 2000
+        layout["DP-1"].dpms = False
+        _, cmds = hypr_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline)
+        self.assertEqual(cmds, ["dispatch dpms off DP-1"])
+
+    def test_disable_enable(self):
+        baseline = pair()
+        layout = baseline.copy()
+        lines, cmds = hypr_config(layout, {"DP-1": True, "HDMI-A-1": False}, baseline=baseline, keywords=True,
+                                  baseline_activity={"DP-1": True, "HDMI-A-1": True})
+        self.assertIn("monitor=HDMI-A-1,disable", lines)
+        self.assertEqual(cmds, ["keyword monitor HDMI-A-1,1920x1080@60.0,1920x0,1.0",
+                                "keyword monitor HDMI-A-1,disable"])
+
+        _, cmds = hypr_config(layout, {"DP-1": True, "HDMI-A-1": True}, baseline=baseline, keywords=True,
+                              baseline_activity={"DP-1": True, "HDMI-A-1": False})
+        self.assertEqual(cmds, ["keyword monitor HDMI-A-1,1920x1080@60.0,1920x0,1.0"])
+
+
+class PositionCommandsTest(unittest.TestCase):
+    def test_sway(self):
+        layout = pair()
+        layout["HDMI-A-1"].x = 2000
+        self.assertEqual(position_commands([layout["HDMI-A-1"]], {"HDMI-A-1": True}),
+                         ['output "HDMI-A-1" pos 2000 0'])
+
+    def test_hypr_sends_applied_settings(self):
+        # Edits not applied yet, like the scale and mode here, don't go out with the dragged position
+        baseline = pair()
+        layout = baseline.copy()
+        state = layout["HDMI-A-1"]
+        state.x, state.y = 2000, 100
+        state.scale = 2.0
+        state.physical_width, state.physical_height, state.refresh = 1280, 720, 50.0
+        state.ten_bit = True
+        self.assertEqual(position_commands([state], {"HDMI-A-1": True}, hypr=True, baseline=baseline),
+                         ["keyword monitor HDMI-A-1,1920x1080@60.0,2000x100,1.0"])
+        self.assertEqual(baseline["HDMI-A-1"].x, 1920)
+
+    def test_hypr_unknown(self):
+        state = pair()["HDMI-A-1"]
+        self.assertEqual(position_commands([state], {"HDMI-A-1": True}, hypr=True), [])
+        self.assertEqual(position_commands([state], {"HDMI-A-1": True}, hypr=True, baseline=Layout()), [])
+
+
+class ModesetsTest(unittest.TestCase):
+    def test_modesets(self):
+        baseline = pair()
+        activity = {"DP-1": True, "HDMI-A-1": True}
+        layout = baseline.copy()
+        layout["DP-1"].x = 100
+        layout["DP-1"].scale = 2.0
+        self.assertEqual(modesets(layout, activity, baseline, activity), 0)
+        layout["DP-1"].refresh = 50.0
+        self.assertEqual(modesets(layout, activity, baseline, activity), 1)
+        self.assertEqual(modesets(layout, {"DP-1": True, "HDMI-A-1": False}, baseline, activity), 2)
+        self.assertEqual(modesets(layout, activity), 2)
+
+
+class ScaleTest(unittest.TestCase):
+    def test_valid_scales(self):
+        scales = valid_scales(2560, 1440)
+        for scale in (Fraction(1), Fraction(5, 4), Fraction(4, 3), Fraction(2)):
+            self.assertIn(scale, scales)
+        # 2560 / 1.3 isn't an integer
+        self.assertNotIn(Fraction(13, 10), scales)
+        self.assertEqual(scales, sorted(scales))
+
+    def test_integer_logical_size(self):
+        for width, height in ((2560, 1440), (1920, 1080), (3840, 2160), (1366, 768)):
+            for scale in valid_scales(width, height):
+                self.assertEqual((width / scale).denominator, 1)
+                self.assertEqual((height / scale).denominator, 1)
+                self.assertEqual((scale * 120).denominator, 1)
+
+    def test_snap(self):
+        scales = valid_scales(2560, 1440)
+        self.assertEqual(snap_scale(scales, 1.25), 1.25)
+        self.assertAlmostEqual(snap_scale(scales, 1.3), 4 / 3)
+        # stepping the spin button moves on to the next valid scale, either way
+        self.assertAlmostEqual(snap_scale(scales, 1.26, previous=1.25), 4 / 3)
+        self.assertEqual(snap_scale(scales, 1.32, previous=4 / 3), 1.25)
+        self.assertEqual(snap_scale([], 1.3), 1.3)
+
+    def test_table(self):
+        layout = Layout([output("DP-1", size=(2560, 1440), modes=[{"width": 1920, "height": 1080, "refresh": 60000}])])
+        table = scale_table(layout)
+        self.assertEqual(sorted(table), [(1920, 1080), (2560, 1440)])
+        self.assertIn(Fraction(3, 2), table[(1920, 1080)])
+
+
+def modes(*specs):
+    return [{"width": w, "height": h, "refresh": r} for w, h, r in specs]
+
+
+class CommonModesTest(unittest.TestCase):
+    def test_largest_first(self):
+        result = common_modes([modes((3840, 2160, 30000), (3840, 2160, 60000), (1920, 1080, 60000)),
+                               modes((2560, 1440, 60000), (3840, 2160, 29970), (1920, 1080, 59940))])
+        # 3840x2160@60 has no match within the tolerance
+        self.assertEqual(result, [(3840, 2160, (30000, 29970)), (1920, 1080, (60000, 59940))])
+
+    def test_refresh_ranking(self):
+        # At the same size: the highest refresh all can do, then the closest match
+        result = common_modes([modes((1920, 1080, 50000), (1920, 1080, 59940), (1920, 1080, 60000)),
+                               modes((1920, 1080, 59940), (1920, 1080, 50000))])
+        self.assertEqual(result, [(1920, 1080, (59940, 59940)), (1920, 1080, (60000, 59940)),
+                                  (1920, 1080, (50000, 50000))])
+
+    def test_none(self):
+        self.assertEqual(common_modes([modes((1920, 1080, 75000)), modes((1920, 1080, 60000))]), [])
+        self.assertEqual(common_modes([modes((1920, 1080, 60000)), modes((1280, 720, 60000))]), [])
+        self.assertEqual(common_modes([]), [])
+
+
+class RectIndexTest(unittest.TestCase):
+    def test_overlapping(self):
+        big = (0, 0, 3840, 2160)  # spans several cells
+        side = (3840, 0, 1920, 1080)
+        index = RectIndex([big, side])
+        self.assertEqual(index.overlapping(3000, 1000, 100, 100), [big])
+        self.assertEqual(index.overlapping(3800, 500, 100, 100), [big, side])
+        # touching edges don't count
+        self.assertEqual(index.overlapping(0, 2160, 1920, 1080), [])
+        self.assertEqual(index.overlapping(5760, 0, 1920, 1080), [])
+        # fractional sizes, as with scaled outputs
+        self.assertEqual(index.overlapping(5759.5, 0, 100, 100), [side])
+
+    def test_free_position(self):
+        index = RectIndex([(0, 0, 1920, 1080)])
+        self.assertEqual(free_position(index, 2000, 0, 1280, 720), (2000, 0))
+        # below is closer than on the right
+        self.assertEqual(free_position(index, 1000, 500, 1280, 720), (1000, 1080))
+        # on the right is closer than below
+        self.assertEqual(free_position(index, 1500, 100, 1280, 720), (1920, 100))
+
+    def test_free_position_non_negative(self):
+        # Left of and above the obstacle would be closer, but negative
+        index = RectIndex([(0, 0, 1920, 1080)])
+        self.assertEqual(free_position(index, 100, 100, 1280, 720), (100, 1080))
+
+    def test_free_position_taken(self):
+        # The closest slot, below the first output, is taken by a second one
+        index = RectIndex([(0, 0, 1920, 1080), (0, 1080, 1920, 1080)])
+        self.assertEqual(free_position(index, 1000, 500, 1280, 720), (1920, 500))
+
+    def test_free_position_gives_up(self):
+        index = RectIndex([(0, 0, 1920, 1080)])
+        self.assertIsNone(free_position(index, 100, 100, 1280, 720, max_candidates=1))
+
+
+def grid():
+    # DP-1 with HDMI-A-1 and DP-3 on its right, DP-2 below it, and DP-4 apart from all
+    return Layout([output("DP-1"), output("HDMI-A-1", x=1920), output("DP-3", x=3840), output("DP-2", y=1080),
+                   output("DP-4", x=6000, y=3000)])
+
+
+class AdjacencyTest(unittest.TestCase):
+    def positions(self, layout):
+        return {state.name: (state.x, state.y) for state in layout}
+
+    def test_rotate(self):
+        layout = grid()
+        adjacency = Adjacency(layout)
+        layout["DP-1"].transform = "90"
+        shifted = adjacency.update(layout["DP-1"])
+        self.assertEqual(sorted(state.name for state in shifted), ["DP-2", "DP-3", "HDMI-A-1"])
+        # 1920x1080 turned 1080x1920: the right neighbours move 840 px left, the one below 840 px down
+        self.assertEqual(self.positions(layout), {"DP-1": (0, 0), "HDMI-A-1": (1080, 0), "DP-3": (3000, 0),
+                                                  "DP-2": (0, 1920), "DP-4": (6000, 3000)})
+
+        # and back, with the edges as they are now
+        layout["DP-1"].transform = "normal"
+        adjacency.update(layout["DP-1"])
+        self.assertEqual(self.positions(layout), self.positions(grid()))
+
+    def test_scale(self):
+        layout = grid()
+        adjacency = Adjacency(layout)
+        layout["HDMI-A-1"].scale = 1.5
+        shifted = adjacency.update(layout["HDMI-A-1"])
+        # 1280x720 now: only what's right of it follows; DP-1 is on its left, and nothing is below
+        self.assertEqual([state.name for state in shifted], ["DP-3"])
+        self.assertEqual(self.positions(layout)["DP-3"], (3200, 0))
+        self.assertEqual(self.positions(layout)["DP-1"], (0, 0))
+        self.assertEqual(self.positions(layout)["DP-2"], (0, 1080))
+
+    def test_no_reflow(self):
+        layout = grid()
+        adjacency = Adjacency(layout)
+        layout["DP-1"].transform = "90"
+        self.assertEqual(adjacency.update(layout["DP-1"], reflow=False), [])
+        self.assertEqual(self.positions(layout), self.positions(grid()))
+
+    def test_moved_apart(self):
+        # An output dragged away from its neighbour no longer pulls it along
+        layout = grid()
+        adjacency = Adjacency(layout)
+        layout["DP-2"].y = 2000
+        adjacency.moved([layout["DP-2"]])
+        layout["DP-1"].transform = "90"
+        adjacency.update(layout["DP-1"])
+        self.assertEqual(self.positions(layout)["DP-2"], (0, 2000))
+
+    def test_inactive_and_mirrors_left_out(self):
+        layout = Layout([output("DP-1"), output("HDMI-A-1", x=1920, active=False),
+                         output("DP-2", x=1920, mirror="DP-1")])
+        adjacency = Adjacency(layout)
+        layout["DP-1"].transform = "90"
+        self.assertEqual(adjacency.update(layout["DP-1"]), [])
+        self.assertEqual(layout["HDMI-A-1"].x, 1920)
+        self.assertEqual(layout["DP-2"].x, 1920)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""
+Checks the result labels of timed calls.
+`python -m pytest tests` or `python tests/test_metrics.py`.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nwg_displays import metrics
+
+NAME = "nwg_displays_apply_duration_seconds"
+
+
+def count(result):
+    return metrics._values.get((NAME, (("result", result),)), [None, 0, 0])[2]
+
+
+class TimedTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        metrics.start(os.path.join(self.tmp.name, "metrics.sock"))
+        metrics._values.clear()
+
+    def tearDown(self):
+        metrics.stop()
+        metrics._values.clear()
+        self.tmp.cleanup()
+
+    def test_ok(self):
+        metrics.timed(NAME)(lambda: "rejected")()
+        self.assertEqual(count("ok"), 1)
+
+    def test_error(self):
+        def fail():
+            raise OSError("gone")
+
+        with self.assertRaises(OSError):
+            metrics.timed(NAME)(fail)()
+        self.assertEqual(count("error"), 1)
+
+    def test_labelled(self):
+        apply = metrics.timed(NAME, labelled=True)(lambda result: result)
+        self.assertEqual(apply("rejected"), "rejected")
+        apply("ok")
+        apply("unknown")
+        self.assertEqual((count("ok"), count("rejected"), count("unknown")), (1, 1, 1))
+        self.assertIn('{}_count{{result="rejected"}} 1'.format(NAME), metrics.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+Checks the hand-written wlr-output-management wire client against a fake compositor on a Unix socket.
+Needs neither Wayland nor GTK: `python -m pytest tests` or `python tests/test_wlr.py`.
+"""
+
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from nwg_displays import wlr
+from nwg_displays.layout import Layout, OutputState
+
+HEAD_ID = 0xff000000
+MODE_1080P = 0xff000001
+MODE_720P = 0xff000002
+
+
+class FakeCompositor:
+    """
+    Serves a single client: one head, DP-1, with two modes, and a manager that accepts or rejects configurations.
+    Requests on the configuration objects are logged.
+    """
+
+    def __init__(self, path, reject=False, manager=True, hang=False, hang_apply=False):
+        self.path = path
+        self.reject = reject
+        self.manager = manager
+        self.hang = hang
+        self.hang_apply = hang_apply
+        self.log = []
+        self.objects = {}  # id: interface
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.close()
+
+    def event(self, conn, object_id, opcode, *args):
+        payload = wlr.pack_args(*args)
+        conn.sendall(struct.pack("=II", object_id, (8 + len(payload)) << 16 | opcode) + payload)
+
+    def serve(self):
+        conn, _ = self.server.accept()
+        buffer = b""
+        while True:
+            try:
+                data = conn.recv(4096)
+            except OSError:
+                return
+            if not data:
+                conn.close()
+                return
+            if self.hang:
+                continue
+            buffer += data
+            while len(buffer) >= 8:
+                object_id, word = struct.unpack_from("=II", buffer)
+                size = word >> 16
+                if len(buffer) < size:
+                    break
+                try:
+                    self.request(conn, object_id, word & 0xffff, wlr.Reader(buffer[8:size]))
+                except OSError:
+                    # the client is gone, e.g. right after destroying the configuration
+                    return
+                buffer = buffer[size:]
+
+    def request(self, conn, object_id, opcode, args):
+        interface = self.objects.get(object_id, "wl_display" if object_id == wlr.DISPLAY_ID else None)
+        if interface == "wl_display" and opcode == wlr.DISPLAY_GET_REGISTRY:
+            registry_id = args.uint()
+            self.objects[registry_id] = "wl_registry"
+            if self.manager:
+                self.event(conn, registry_id, wlr.REGISTRY_GLOBAL, 7, wlr.MANAGER_INTERFACE, 4)
+            self.event(conn, registry_id, wlr.REGISTRY_GLOBAL, 8, "wl_seat", 7)
+
+        elif interface == "wl_display" and opcode == wlr.DISPLAY_SYNC:
+            callback_id = args.uint()
+            self.event(conn, callback_id, wlr.CALLBACK_DONE, 0)
+            self.event(conn, wlr.DISPLAY_ID, wlr.DISPLAY_DELETE_ID, callback_id)
+
+        elif interface == "wl_registry" and opcode == wlr.REGISTRY_BIND:
+            args.uint(), args.string(), args.uint()
+            manager_id = args.uint()
+            self.objects[manager_id] = "manager"
+            self.event(conn, manager_id, wlr.MANAGER_HEAD, HEAD_ID)
+            self.event(conn, HEAD_ID, 0, "DP-1")
+            self.event(conn, HEAD_ID, 1, "Dell U2415 (DP-1)")
+            self.event(conn, HEAD_ID, 3, MODE_1080P)
+            self.event(conn, MODE_1080P, 0, 1920, 1080)
+            self.event(conn, MODE_1080P, 1, 60000)
+            self.event(conn, MODE_1080P, 2)
+            self.event(conn, HEAD_ID, 3, MODE_720P)
+            self.event(conn, MODE_720P, 0, 1280, 720)
+            self.event(conn, MODE_720P, 1, 59940)
+            self.event(conn, HEAD_ID, 4, 1)
+            self.event(conn, HEAD_ID, 5, MODE_1080P)
+            self.event(conn, HEAD_ID, 6, 10, 20)
+            self.event(conn, HEAD_ID, 7, 1)
+            self.event(conn, HEAD_ID, 8, 1.5)
+            self.event(conn, manager_id, wlr.MANAGER_DONE, 42)
+
+        elif interface == "manager" and opcode == wlr.MANAGER_CREATE_CONFIGURATION:
+            config_id, serial = args.uint(), args.uint()
+            self.objects[config_id] = "configuration"
+            self.log.append(("create", serial))
+
+        elif interface == "configuration":
+            if opcode == wlr.CONFIGURATION_ENABLE_HEAD:
+                config_head_id, head_id = args.uint(), args.uint()
+                self.objects[config_head_id] = "configuration_head"
+                self.log.append(("enable", head_id))
+            elif opcode == wlr.CONFIGURATION_DISABLE_HEAD:
+                self.log.append(("disable", args.uint()))
+            elif opcode in (wlr.CONFIGURATION_APPLY, wlr.CONFIGURATION_TEST):
+                self.log.append(("apply" if opcode == wlr.CONFIGURATION_APPLY else "test",))
+                if opcode == wlr.CONFIGURATION_APPLY and self.hang_apply:
+                    return
+                self.event(conn, object_id, wlr.CONFIGURATION_FAILED if self.reject else wlr.CONFIGURATION_SUCCEEDED)
+            elif opcode == wlr.CONFIGURATION_DESTROY:
+                self.event(conn, wlr.DISPLAY_ID, wlr.DISPLAY_DELETE_ID, object_id)
+
+        elif interface == "configuration_head":
+            if opcode == wlr.HEAD_SET_MODE:
+                self.log.append(("mode", args.uint()))
+            elif opcode == wlr.HEAD_SET_CUSTOM_MODE:
+                self.log.append(("custom_mode", args.int(), args.int(), args.int()))
+            elif opcode == wlr.HEAD_SET_POSITION:
+                self.log.append(("position", args.int(), args.int()))
+            elif opcode == wlr.HEAD_SET_TRANSFORM:
+                self.log.append(("transform", args.int()))
+            elif opcode == wlr.HEAD_SET_SCALE:
+                self.log.append(("scale", args.fixed()))
+            elif opcode == wlr.HEAD_SET_ADAPTIVE_SYNC:
+                self.log.append(("adaptive_sync", args.uint()))
+
+
+def output(mode=(1280, 720, 59.94), custom_mode=False):
+    width, height, refresh = mode
+    return OutputState("DP-1", "Dell U2415", 100, 50, width, height, "90", 1.5, "linear", refresh, [], True, True,
+                       True, custom_mode)
+
+
+class WlrTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "wayland-test")
+        self.compositor = None
+        # apply_layout() connects to $WAYLAND_DISPLAY: set per test, and restored after
+        environ = mock.patch.dict(os.environ)
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def tearDown(self):
+        if self.compositor:
+            self.compositor.close()
+        self.dir.cleanup()
+
+    def start(self, **kwargs):
+        self.compositor = FakeCompositor(self.path, **kwargs)
+
+    def test_query_heads(self):
+        self.start()
+        heads = wlr.query_heads(self.path)
+        self.assertEqual(list(heads), ["DP-1"])
+        head = heads["DP-1"]
+        self.assertTrue(head["active"])
+        self.assertEqual((head["x"], head["y"]), (10, 20))
+        self.assertEqual((head["physical-width"], head["physical-height"], head["refresh"]), (1920, 1080, 60.0))
+        self.assertEqual(head["transform"], "90")
+        self.assertEqual(head["modes"], [{"width": 1920, "height": 1080, "refresh": 60000},
+                                         {"width": 1280, "height": 720, "refresh": 59940}])
+
+    def test_apply_accepted(self):
+        self.start()
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        self.assertEqual(wlr.apply_layout(Layout([output()]), {"DP-1": True}), (True, "ok"))
+        head_requests = [("enable", HEAD_ID), ("mode", MODE_720P), ("position", 100, 50), ("transform", 1),
+                         ("scale", 1.5), ("adaptive_sync", 1)]
+        self.assertEqual(self.compositor.log, [("create", 42)] + head_requests + [("test",)] +
+                         [("create", 42)] + head_requests + [("apply",)])
+
+    def test_custom_mode(self):
+        self.start()
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        self.assertEqual(wlr.apply_layout(Layout([output((1600, 900, 60.0), custom_mode=True)]), {"DP-1": True}),
+                         (True, "ok"))
+        self.assertIn(("custom_mode", 1600, 900, 60000), self.compositor.log)
+
+    def test_disable(self):
+        self.start()
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        self.assertEqual(wlr.apply_layout(Layout(), {"DP-1": False}), (True, "ok"))
+        self.assertEqual(self.compositor.log, [("create", 42), ("disable", HEAD_ID), ("test",),
+                                               ("create", 42), ("disable", HEAD_ID), ("apply",)])
+
+    def test_apply_rejected(self):
+        self.start(reject=True)
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        self.assertEqual(wlr.apply_layout(Layout([output()]), {"DP-1": True}), (False, "configuration failed"))
+        self.assertNotIn(("apply",), self.compositor.log)
+
+    def test_unsupported(self):
+        self.start(manager=False)
+        self.assertIsNone(wlr.query_heads(self.path))
+
+    def test_hang(self):
+        self.start(hang=True)
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        timeout = wlr.TIMEOUT
+        wlr.TIMEOUT = 0.3
+        try:
+            start = time.monotonic()
+            success, message = wlr.apply_layout(Layout([output()]), {"DP-1": True})
+        finally:
+            wlr.TIMEOUT = timeout
+        self.assertFalse(success)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_apply_no_reply(self):
+        # Tested fine, applied, but no word back: unknown, not failed
+        self.start(hang_apply=True)
+        os.environ["WAYLAND_DISPLAY"] = self.path
+        with mock.patch.object(wlr, "TIMEOUT", 0.2), mock.patch.object(wlr, "MODESET_TIMEOUT", 0.1):
+            success, message = wlr.apply_layout(Layout([output()]), {"DP-1": True})
+        self.assertIsNone(success)
+        self.assertIn(("apply",), self.compositor.log)
+
+    def test_socket_closed_on_error(self):
+        sockets = []
+        real_socket = socket.socket
+
+        def make_socket(*args, **kwargs):
+            s = real_socket(*args, **kwargs)
+            # sockets the fake compositor accepts are made with a file descriptor
+            if "fileno" not in kwargs:
+                sockets.append(s)
+            return s
+
+        self.start(manager=False)
+        with mock.patch.object(socket, "socket", make_socket):
+            # no compositor
+            with self.assertRaises(OSError):
+                wlr.OutputManager(os.path.join(self.dir.name, "wayland-none"))
+            # no output manager
+            with self.assertRaises(wlr.WlrError):
+                wlr.OutputManager(self.path)
+        self.assertEqual([s.fileno() for s in sockets], [-1, -1])
+
+    def test_scale_exact(self):
+        for scale in (1, 1.25, 1.5, 1.75, 2.0, float(Fraction(5, 4))):
+            self.assertTrue(wlr.scale_exact(scale))
+        for scale in (float(Fraction(4, 3)), 1.2, float(Fraction(7, 6))):
+            self.assertFalse(wlr.scale_exact(scale))
+
+
+if __name__ == "__main__":
+    unittest.main()